@@ -30,7 +30,7 @@ from fastapi import (
 )
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from app.utils_func.streaming import fetch_answer_stream, filter_other_lang, escape_inner_quotes
+from app.utils_func.streaming import fetch_answer_stream, filter_other_lang, iter_generate_stream
 
 from slowapi import Limiter
 from slowapi.util import get_remote_address
@@ -215,25 +215,20 @@ async def create_arena_model_response(
     try:
         async def stream_model_data():
             async with httpx.AsyncClient(timeout=120) as client:
-                text_buffer = ""
                 try:
                     async with client.stream("POST", url, json=payload, headers=headers) as response:
-                        async for chunk in response.aiter_bytes():
-                            if chunk:
-                                chunk_data = chunk.decode("utf-8")
-                                text_buffer += chunk_data
-                                try:
-                                    escaped_text = escape_inner_quotes(text_buffer)
-                                    chunk_json_obj = json.loads(escaped_text, strict=False)
-                                    text_buffer = ""
-                                    if "text" in chunk_json_obj:
-                                        yield chunk_json_obj["text"]
-                                    else:
-                                        yield ""
-                                except json.JSONDecodeError:
-                                    yield ""
-                                except (ValueError, KeyError):
-                                    yield ""
+                        async for event in iter_generate_stream(response):
+                            if event["event"] == "token":
+                                yield event["text"]
+                            elif event["event"] == "error":
+                                save_failed_arena_model_response()
+                                raise HTTPException(
+                                    status_code=status.HTTP_502_BAD_GATEWAY,
+                                    detail={
+                                        "code": "generation_error",
+                                        "description": event["message"]
+                                    }
+                                )
                 except httpx.RequestError as exc:
                     save_failed_arena_model_response()
                     raise HTTPException(
@@ -12,7 +12,7 @@ from sse_starlette.sse import EventSourceResponse
 from app.core.config import settings
 from enum import Enum
 from urllib.parse import urljoin
-from app.utils_func.streaming import fetch_answer_stream, filter_other_lang, escape_inner_quotes
+from app.utils_func.streaming import fetch_answer_stream, filter_other_lang, iter_generate_stream
 from app.api.custom_route import AuthenticatedRoute
 
 import requests, uuid, json
@@ -313,26 +313,22 @@ async def create_chat(
     try:
         async def stream_model_data():
             async with httpx.AsyncClient(timeout=120) as client:
-                text_buffer = ""
                 try:
                     async with client.stream("POST", url, json=payload, headers=headers) as response:
                         try:
-                            async for chunk in response.aiter_bytes():
-                                if chunk:
-                                    chunk_data = chunk.decode("utf-8")
-                                    text_buffer += chunk_data
-                                    try:
-                                        escaped_text = escape_inner_quotes(text_buffer)
-                                        chunk_json_obj = json.loads(escaped_text, strict=False)
-                                        text_buffer = ""
-                                        if "text" in chunk_json_obj:
-                                            yield chunk_json_obj["text"]
-                                        else:
-                                            yield ""
-                                    except json.JSONDecodeError:
-                                        yield ""
-                                    except (ValueError, KeyError):
-                                        yield ""
+                            async for event in iter_generate_stream(response):
+                                if event["event"] == "token":
+                                    yield event["text"]
+                                elif event["event"] == "error":
+                                    raise HTTPException(
+                                        status_code=status.HTTP_502_BAD_GATEWAY,
+                                        detail={
+                                            "code": "generation_error",
+                                            "description": event["message"]
+                                        }
+                                    )
+                        except HTTPException:
+                            raise
                         except Exception as e:
                             print(f"Unexpected error during streaming: {str(e)}")
 
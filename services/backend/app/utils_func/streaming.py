@@ -24,20 +24,9 @@ def filter_other_lang(text: str) -> str:
     filtered_text = re.sub(pattern, "", text)
     return filtered_text
 
-def escape_inner_quotes(text):
-    # Find the position of the first and last double quotes
-    first_quote_index = text.find('"', text.find(':') + 1)
-    last_quote_index = text.rfind('"')
-
-    # Extract the parts: before the first quote, the inner part, and after the last quote
-    before = text[:first_quote_index + 1]  # Includes the first quote
-    inner = text[first_quote_index + 1:last_quote_index]  # Content between first and last quotes
-    after = text[last_quote_index:]  # Includes the last quote
-
-    # Escape all inner quotes
-    escaped_inner = inner.replace('"', '\\"')
-
-    # Reassemble the string
-    result_text = before + escaped_inner + after
-
-    return result_text
\ No newline at end of file
+async def iter_generate_stream(response) -> AsyncGenerator[dict, None]:
+    # The RAG /generate stream is NDJSON: one JSON frame per line, with an "event" of
+    # references, token, usage, done or error
+    async for line in response.aiter_lines():
+        if line:
+            yield json.loads(line)
\ No newline at end of file
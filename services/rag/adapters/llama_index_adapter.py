@@ -1,28 +1,80 @@
 import os
 import json
+import asyncio
+import logging
+import threading
+import time
 from glob import glob
-import pickle
+from typing import NamedTuple, Optional
 from fastapi import HTTPException
 from fastapi.responses import StreamingResponse
-from llama_index.core import VectorStoreIndex, Settings, QueryBundle
-from llama_index.core.schema import TextNode
+from llama_index.core import Settings, QueryBundle
+from llama_index.core.schema import TextNode, MetadataMode
 from langfuse.llama_index import LlamaIndexCallbackHandler
 from llama_index.core.callbacks import CallbackManager
+from core.rag.cache import DiskLRUCache, RerankScoreCache, SemanticCache
+from core.rag.index import IndexSnapshot, DenseVectorIndex, HNSWVectorIndex, BM25Index, ReferenceGraph, compute_content_hash, compute_corpus_fingerprint
+from core.rag.retriever import FusionRetriever
+from core.rag.synthesizer import ContextPacker
+from core.rag.response import STREAM_MEDIA_TYPE, encode_stream_event
 from infrastructure.embeddings.instructor_embeddings import get_instructor_embedding_model
-from infrastructure.rerankers.instructor_rerankers import get_instructor_reranker_model
-from infrastructure.rag.llm import initialize_llm
+from infrastructure.rerankers.instructor_rerankers import get_instructor_reranker_model, get_reranker_stats
+from infrastructure.rag.llm import aclose_llms, get_llm, get_token_counter, LLM_SELECTION_DICT
 from infrastructure.rag.query_engine import create_query_engine
 from infrastructure.rag.retriever import visualize_retrieved_nodes
 from ports.llama_service_port import LlamaServicePort
 
+class IndexState(NamedTuple):
+    """Indexes of one snapshot version, swapped in as a whole so a request never mixes two versions."""
+    snapshot: IndexSnapshot
+    vector_index: DenseVectorIndex
+    bm25_index: Optional[BM25Index]
+    reference_graph: Optional[ReferenceGraph]
+    version: str
+
 class LlamaIndexAdapter(LlamaServicePort):
     def __init__(self):
         self.callback_handler = self.initialize_callback_handler()
-        self.vector_index = None
+        # replaced by a single assignment on each update; a request reads it once and uses that state throughout
+        self.index_state: Optional[IndexState] = None
+        self._update_lock = threading.Lock()
+        self.answer_cache = SemanticCache(
+            maxsize=int(os.getenv("ANSWER_CACHE_SIZE", "1024")),
+            ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.97")),
+        )
+        self.completion_cache = DiskLRUCache(
+            path=os.getenv("COMPLETION_CACHE_PATH", os.path.join(os.getenv("DOCUMENTS_DIR", "/app/data"), "cache", "completions.sqlite")),
+            maxsize=int(os.getenv("COMPLETION_CACHE_SIZE", "10000")),
+        )
+        self.rerank_score_cache = RerankScoreCache(maxsize=int(os.getenv("RERANKER_CACHE_SIZE", "100000")))
         self.law_url_mapper = self.load_law_url_mapper()
         self.embed_model = get_instructor_embedding_model(os.getenv("EMBEDDING_MODEL", "embedding"))
+        self.reranker_model_name = os.getenv("RERANKER_MODEL", "BAAI/bge-reranker-v2-m3")
         if self.callback_handler:
             Settings.callback_manager = CallbackManager([self.callback_handler])
+        # engines get their LLM explicitly, the global is only a fallback for retrieval engines that never call it
+        Settings.llm = None
+
+    @property
+    def snapshot(self):
+        return self.index_state.snapshot if self.index_state else None
+
+    @property
+    def vector_index(self):
+        return self.index_state.vector_index if self.index_state else None
+
+    @property
+    def bm25_index(self):
+        return self.index_state.bm25_index if self.index_state else None
+
+    @property
+    def reference_graph(self):
+        return self.index_state.reference_graph if self.index_state else None
+
+    @property
+    def index_version(self):
+        return self.index_state.version if self.index_state else None
 
     @staticmethod
     def initialize_callback_handler():
@@ -39,10 +91,12 @@ class LlamaIndexAdapter(LlamaServicePort):
         except FileNotFoundError:
             return {}
 
-    def initialize_retrievers(self):
+    @staticmethod
+    def list_law_files(documents_dir):
+        return sorted(f for f in glob(os.path.join(documents_dir, "*.json")) if os.path.basename(f) != "wcx_law_url_mapper.json")
+
+    def load_law_nodes(self, json_files):
         nodes = []
-        documents_dir = os.getenv("DOCUMENTS_DIR", "/app/data")
-        json_files = [f for f in glob(os.path.join(documents_dir, "*.json")) if os.path.basename(f) not in ["wcx_law_url_mapper.json", "vector_index.pkl"]]
         for path in json_files:
             law_code = os.path.basename(path).replace(".json", "")
             with open(path) as file:
@@ -60,71 +114,468 @@ class LlamaIndexAdapter(LlamaServicePort):
                 )
                 for section in law_sections
             )
+        return nodes
 
-        self.vector_index = VectorStoreIndex(nodes, embed_model=self.embed_model, show_progress=True, store_nodes_override=True)
-        
-    def load_vector_index(self):
-        try:
-            with open("/app/data/vector_index.pkl", "rb") as f:
-                self.vector_index = pickle.load(f)
-        except FileNotFoundError:
-            raise HTTPException(status_code=500, detail="Vector index file not found. Please initialize retrievers first.")
+    @staticmethod
+    def load_law_references(json_files, node_ids):
+        """Ids of the sections cited by each node, resolved from the `reference` lists of the law files."""
+        sections = {}
+        references = {}
+        for path in json_files:
+            law_code = os.path.basename(path).replace(".json", "")
+            with open(path) as file:
+                law_sections = json.load(file)
+            for section in law_sections:
+                node_id = f"{law_code}_{section['section_num']}"
+                sections[(section["law_name"], section["section_num"])] = node_id
+                references[node_id] = [
+                    (reference["law_name"], reference["section_num"])
+                    for reference in section.get("reference", [])
+                    # excluded references cite laws that are not in the corpus
+                    if reference.get("include", True)
+                ]
+        return [
+            [sections[key] for key in references.get(node_id, []) if key in sections]
+            for node_id in node_ids
+        ]
+
+    def list_corpus(self):
+        """Law files, snapshot directory and corpus fingerprint of DOCUMENTS_DIR as it is now."""
+        documents_dir = os.getenv("DOCUMENTS_DIR", "/app/data")
+        snapshot_dir = os.getenv("INDEX_SNAPSHOT_DIR", os.path.join(documents_dir, "index"))
+        json_files = self.list_law_files(documents_dir)
+        fingerprint = compute_corpus_fingerprint(
+            json_files + glob(os.path.join(documents_dir, "wcx_law_url_mapper.json")),
+            embed_model_name=self.embed_model.model_name,
+            instruction=self.embed_model.instruction,
+        )
+        return json_files, snapshot_dir, fingerprint
+
+    def embed_texts(self, texts, on_progress=None):
+        # embedded in slices so progress can be reported while the corpus is embedded
+        step = int(os.getenv("EMBEDDING_PROGRESS_STEP", "1024"))
+        embeddings = []
+        for start in range(0, len(texts), step):
+            if on_progress:
+                on_progress(stage="embedding", embedded=start, total=len(texts))
+            embeddings.extend(self.embed_model.get_text_embedding_batch(texts[start:start + step], show_progress=True))
+        if on_progress:
+            on_progress(stage="embedding", embedded=len(texts), total=len(texts))
+        return embeddings
+
+    def build_index_snapshot(self, json_files, fingerprint, previous=None, on_progress=None):
+        """
+        Builds the snapshot of the corpus, deriving it from `previous` when it can: only sections that are new or
+        changed are upserted, removed ones are tombstoned, and a section is only embedded when no row of
+        `previous` has its content hash.
+
+        Returns:
+        - the new snapshot and counts of the added, changed, deleted, embedded and reused sections
+        """
+        nodes = self.load_law_nodes(json_files)
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        model_name = self.embed_model.model_name
+        content_hashes = [compute_content_hash(text, model_name, self.embed_model.instruction) for text in texts]
+        if previous is not None and previous.embed_model_name == model_name and None in previous.content_hashes:
+            self.hash_legacy_rows(previous)
+        if previous is None or previous.embed_model_name != model_name:
+            embeddings = self.embed_texts(texts, on_progress=on_progress)
+            snapshot = IndexSnapshot.from_nodes(
+                nodes, embeddings, fingerprint=fingerprint, embed_model_name=model_name, content_hashes=content_hashes
+            )
+            return snapshot, {"added": len(nodes), "changed": 0, "deleted": 0, "embedded": len(nodes), "reused": 0, "compacted": False}
+
+        changes = previous.diff([node.node_id for node in nodes], content_hashes)
+        upsert_ids = set(changes["added"]) | set(changes["changed"])
+        upserts = [position for position, node in enumerate(nodes) if node.node_id in upsert_ids]
+        cached_rows = previous.embedding_rows()
+        missing = [position for position in upserts if content_hashes[position] not in cached_rows]
+        embedded = dict(zip(missing, self.embed_texts([texts[position] for position in missing], on_progress=on_progress)))
+        snapshot = previous.upsert(
+            nodes=[nodes[position] for position in upserts],
+            embeddings=[
+                embedded[position] if position in embedded else previous.embeddings[cached_rows[content_hashes[position]]]
+                for position in upserts
+            ],
+            content_hashes=[content_hashes[position] for position in upserts],
+            delete_ids=changes["deleted"],
+            fingerprint=fingerprint,
+        )
+        # tombstones are only skipped by searches, rewrite the snapshot once too many rows are dead
+        compacted = snapshot.num_deleted > float(os.getenv("INDEX_COMPACTION_RATIO", "0.2")) * len(snapshot)
+        if compacted:
+            snapshot = snapshot.compact()
+        stats = {name: len(ids) for name, ids in changes.items()}
+        stats.update(embedded=len(missing), reused=len(upserts) - len(missing), compacted=compacted)
+        return snapshot, stats
+
+    def hash_legacy_rows(self, snapshot):
+        """
+        Fills in the content hashes that snapshots written before they were stored lack, from the stored text and
+        metadata of each row, so their embeddings are reused instead of the whole corpus being embedded again.
+
+        Those snapshots do not record the embedding instruction, the current one is assumed to be the one they used.
+        """
+        snapshot.content_hashes = [
+            content_hash or compute_content_hash(
+                TextNode(text=snapshot.texts[row], extra_info=snapshot.metadata[row]).get_content(metadata_mode=MetadataMode.EMBED),
+                snapshot.embed_model_name,
+                self.embed_model.instruction,
+            )
+            for row, content_hash in enumerate(snapshot.content_hashes)
+        ]
+
+    def initialize_retrievers(self, on_progress=None):
+        on_progress = on_progress or (lambda **fields: None)
+        json_files, snapshot_dir, fingerprint = self.list_corpus()
+
+        # Only embed the sections that changed since the last snapshot, or none if the corpus is unchanged
+        on_progress(stage="loading_snapshot")
+        with IndexSnapshot.lock(snapshot_dir):
+            snapshot = IndexSnapshot.load(snapshot_dir, fingerprint=fingerprint)
+            if snapshot is None:
+                snapshot, _ = self.build_index_snapshot(
+                    json_files, fingerprint, previous=IndexSnapshot.load(snapshot_dir), on_progress=on_progress
+                )
+                snapshot.save(snapshot_dir)
+            on_progress(stage="loading_index", num_nodes=len(snapshot))
+            self.load_indexes(snapshot, json_files)
+        IndexSnapshot.prune(snapshot_dir, keep=int(os.getenv("INDEX_SNAPSHOT_KEEP", "2")))
+
+    def update_index(self, on_progress=None):
+        """
+        Brings the live index up to date with DOCUMENTS_DIR without a restart, e.g. after a law file was
+        added or amended. The new snapshot version is saved and swapped in once all its indexes are built;
+        requests keep using the previous version until then.
+
+        Several workers can call it at once: the first one builds the new version, the others load it.
+
+        Returns:
+        - status (`unchanged`, `loaded` or `updated`), versions and counts of the changed sections
+        """
+        start = time.time()
+        with self._update_lock:
+            # the url mapper is part of the fingerprint, so a changed one must be read before the nodes are rebuilt
+            self.law_url_mapper = self.load_law_url_mapper()
+            json_files, snapshot_dir, fingerprint = self.list_corpus()
+            result = {"status": "unchanged", "version": fingerprint[:16], "previous_version": (self.index_version or "")[:16]}
+            if fingerprint == self.index_version:
+                return result
+            with IndexSnapshot.lock(snapshot_dir):
+                snapshot = IndexSnapshot.load(snapshot_dir, fingerprint=fingerprint)
+                if snapshot is not None:
+                    result["status"] = "loaded"
+                else:
+                    snapshot, stats = self.build_index_snapshot(
+                        json_files, fingerprint, previous=IndexSnapshot.load(snapshot_dir), on_progress=on_progress
+                    )
+                    snapshot.save(snapshot_dir)
+                    result.update(stats, status="updated")
+                self.load_indexes(snapshot, json_files)
+            IndexSnapshot.prune(snapshot_dir, keep=int(os.getenv("INDEX_SNAPSHOT_KEEP", "2")))
+        result.update(num_nodes=len(snapshot) - snapshot.num_deleted, elapsed_s=round(time.time() - start, 3))
+        logging.warning(f"Index {result['status']}: {result}")
+        return result
+
+    def load_indexes(self, snapshot, json_files):
+        """Builds every index of `snapshot` and only then swaps them in, so a swap never exposes a half-built version."""
+        dtype = os.getenv("DENSE_INDEX_DTYPE", "float32")
+        if os.getenv("VECTOR_INDEX_BACKEND", "exact").lower() == "hnsw":
+            vector_index = HNSWVectorIndex.from_snapshot(
+                snapshot,
+                embed_model=self.embed_model,
+                dtype=dtype,
+                M=int(os.getenv("HNSW_M", "16")),
+                ef_construction=int(os.getenv("HNSW_EF_CONSTRUCTION", "200")),
+                ef_search=int(os.getenv("HNSW_EF_SEARCH", "64")),
+            )
+        else:
+            vector_index = DenseVectorIndex.from_snapshot(
+                snapshot,
+                embed_model=self.embed_model,
+                dtype=dtype,
+            )
+        bm25_index = None
+        if os.getenv("BM25_RETRIEVER", "true").lower() == "true":
+            # Shares the snapshot docstore, tokenizes the corpus only when the snapshot has no BM25 index yet
+            bm25_index = BM25Index.from_snapshot(
+                snapshot,
+                docstore=snapshot.docstore,
+                k1=float(os.getenv("BM25_K1", "1.5")),
+                b=float(os.getenv("BM25_B", "0.75")),
+                tokenizer_engine=os.getenv("BM25_TOKENIZER_ENGINE", "newmm"),
+            )
+        reference_graph = None
+        if os.getenv("REFERENCE_EXPANSION", "true").lower() == "true":
+            reference_graph = ReferenceGraph.from_snapshot(
+                snapshot,
+                load_references=lambda: self.load_law_references(json_files, snapshot.node_ids),
+            )
+        # the parent was only needed to derive the indexes, keeping it would keep every older version alive
+        snapshot.parent = None
 
-    def get_vector_index(self):
-        if self.vector_index is None:
+        self.index_state = IndexState(snapshot, vector_index, bm25_index, reference_graph, snapshot.fingerprint)
+        # answers cached for another snapshot may cite sections that changed
+        self.answer_cache.clear()
+        # scores are keyed by index version, the ones of the previous snapshot can never hit again
+        self.rerank_score_cache.clear()
+
+    def warmup_models(self, component, on_progress=None):
+        """Load the reranker model, or every LLM client and tokenizer, before the first request needs them."""
+        on_progress = on_progress or (lambda **fields: None)
+        if component == "reranker":
+            on_progress(model=self.reranker_model_name)
+            get_instructor_reranker_model(model_name=self.reranker_model_name, use_fp16=True, top_n=1)
+        elif component == "llm":
+            for loaded, model_id in enumerate(LLM_SELECTION_DICT):
+                on_progress(loaded=loaded, total=len(LLM_SELECTION_DICT))
+                get_llm(model_id, completion_cache=self.completion_cache)
+                get_token_counter(model_id)
+            on_progress(loaded=len(LLM_SELECTION_DICT), total=len(LLM_SELECTION_DICT))
+        else:
+            raise ValueError(f"Unknown component: {component}")
+
+    def get_index_state(self):
+        state = self.index_state
+        if state is None:
             raise HTTPException(status_code=500, detail="Vector index not initialized.")
-        return self.vector_index
+        return state
 
-    def retrieve_documents(self, request):
+    def get_retriever(self, top_k, state):
+        retriever = state.vector_index.as_retriever(similarity_top_k=top_k)
+        if state.bm25_index is None:
+            return retriever
+        # Fused top_k candidates, so the reranker sees top_k nodes instead of one list per retriever
+        return FusionRetriever(
+            retrievers=[retriever],
+            bm25_retriever=state.bm25_index.as_retriever(similarity_top_k=top_k),
+            reference_nodes=state.vector_index.docs,
+            top_k=top_k,
+            fusion_mode=os.getenv("FUSION_MODE", "rrf"),
+            timeout=float(os.getenv("RETRIEVER_TIMEOUT", "10")),
+        )
+
+    def get_cache_stats(self):
+        return {
+            "query_embedding": self.embed_model.cache_stats,
+            "answer": self.answer_cache.stats(),
+            "completion": self.completion_cache.stats(),
+            "reranker_score": self.rerank_score_cache.stats(),
+            "reranker_batching": get_reranker_stats(),
+        }
+
+    async def aclose(self):
+        """Close the pooled connections of the embedding model and of every LLM client, on the serving event loop."""
+        await self.embed_model.aclose()
+        await aclose_llms()
+
+    def answer_cache_partition(self, request, state):
+        # the retrieval parameters decide the references frame and the temperature how the answer was sampled,
+        # so answers are only shared between identical ones
+        return (
+            request.model, request.language.lower(), state.version,
+            request.top_k, request.top_n, request.reranker, request.temperature,
+        )
+
+    def replay_cached_answer(self, cached, start):
+        """Frames of a cached answer, in the same order and chunking as the live answer they were recorded from."""
+        yield encode_stream_event("references", references=cached["references"])
+        first_token_at = time.perf_counter() if cached["chunks"] else None
+        for chunk in cached["chunks"]:
+            yield encode_stream_event("token", text=chunk)
+        yield self.encode_usage_event(
+            cached["format_input"],
+            cached["prompt_tokens"],
+            start,
+            first_token_at,
+            sum(len(chunk) for chunk in cached["chunks"]),
+            len(cached["chunks"]),
+        )
+        yield encode_stream_event("done")
+
+    def create_reranker(self, top_n, state):
+        return get_instructor_reranker_model(
+            model_name=self.reranker_model_name,
+            use_fp16=True,
+            top_n=top_n,
+            score_cache=self.rerank_score_cache,
+            index_version=state.version,
+        )
+
+    def create_retrieval_engine(self, request, state):
         if not request.query.strip():
             raise HTTPException(status_code=400, detail="Query string cannot be empty.")
-        Settings.llm = None
-        vector_index = self.get_vector_index()
-        retriever = vector_index.as_retriever(similarity_top_k=request.top_k)
+        retriever = self.get_retriever(request.top_k, state)
 
         postprocessors = [
-            get_instructor_reranker_model(model_name=os.getenv("RERANKER_MODEL", "BAAI/bge-reranker-v2-m3"), use_fp16=True, top_n=request.top_n)
+            self.create_reranker(request.top_n, state)
         ] if request.reranker else []
-        query_engine = create_query_engine(
+        return create_query_engine(
             retriever=retriever,
             node_postprocessors=postprocessors
         )
-        retrieved_nodes = query_engine._nodes(QueryBundle(request.query))
-        if self.callback_handler:
-            self.callback_handler.flush()
-        return visualize_retrieved_nodes(retrieved_nodes)
 
-    def generate_response(self, request):
+    def create_generation_engine(self, request, state):
         if not request.query.strip():
             raise HTTPException(status_code=400, detail="Query string cannot be empty.")
 
-        vector_index = self.get_vector_index()
+        retriever = self.get_retriever(request.top_k, state)
         if self.callback_handler:
             self.callback_handler.set_trace_params(tags=[request.model])
-        Settings.llm = initialize_llm(
-            model_id=request.model,
-            prompt_language=request.language,
-            temperature=request.temperature
-        )
+        try:
+            llm = get_llm(request.model, completion_cache=self.completion_cache)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-        retriever = vector_index.as_retriever(similarity_top_k=request.top_k)
-        reranker = get_instructor_reranker_model(model_name=os.getenv("RERANKER_MODEL", "BAAI/bge-reranker-v2-m3"), use_fp16=True, top_n=request.top_n)
+        reranker = self.create_reranker(request.top_n, state)
         postprocessors = [
             reranker
         ] if request.reranker else []
-        query_engine = create_query_engine(
+        return create_query_engine(
             retriever=retriever,
-            response_mode="default",
+            llm=llm,
+            llm_kwargs={
+                "temperature": request.temperature,
+                # greedy completions are always cached, sampled ones only on opt-in
+                "use_completion_cache": os.getenv("COMPLETION_CACHE_SAMPLED", "false").lower() == "true",
+            },
+            reference_graph=state.reference_graph,
+            reference_hops=int(os.getenv("REFERENCE_MAX_HOPS", "1")),
+            max_references=int(os.getenv("REFERENCE_MAX_SECTIONS", "10")),
+            context_packer=ContextPacker(
+                get_token_counter(request.model),
+                token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000")),
+                near_duplicate_threshold=float(os.getenv("CONTEXT_NEAR_DUPLICATE_THRESHOLD", "0.9")),
+            ),
+            response_mode=os.getenv("RESPONSE_MODE", "default"),
+            map_concurrency=int(os.getenv("MAP_REDUCE_CONCURRENCY", "8")),
             prompt_language=request.language,
             node_postprocessors=postprocessors,
             streaming=True,
         )
 
+    @staticmethod
+    def encode_usage_event(format_input, prompt_tokens, start, first_token_at, completion_chars, num_chunks):
+        return encode_stream_event(
+            "usage",
+            prompt_chars=len(format_input),
+            prompt_tokens=prompt_tokens,
+            completion_chars=completion_chars,
+            completion_chunks=num_chunks,
+            time_to_first_token_ms=round((first_token_at - start) * 1000, 1) if first_token_at else None,
+            total_ms=round((time.perf_counter() - start) * 1000, 1),
+        )
+
+    def retrieve_documents(self, request):
+        query_engine = self.create_retrieval_engine(request, self.get_index_state())
+        retrieved_nodes = query_engine._nodes(QueryBundle(request.query))
+        if self.callback_handler:
+            self.callback_handler.flush()
+        return visualize_retrieved_nodes(retrieved_nodes)
+
+    async def aretrieve_documents(self, request):
+        query_engine = self.create_retrieval_engine(request, self.get_index_state())
+        retrieved_nodes = await query_engine.aretrieve(QueryBundle(request.query))
+        if self.callback_handler:
+            await asyncio.to_thread(self.callback_handler.flush)
+        return visualize_retrieved_nodes(retrieved_nodes)
+
+    def generate_response(self, request):
+        # one read of the state, so the cached answer is keyed by the version it was retrieved from
+        state = self.get_index_state()
+        query_engine = self.create_generation_engine(request, state)
+        count_tokens = get_token_counter(request.model)
+
+        partition = self.answer_cache_partition(request, state)
+
         def fetch_stream(query_str, engine):
-            response, _, _ = engine.query(QueryBundle(query_str))
-            for chunk in response.get_response():
-                yield f'{{"text": "{chunk}"}}\n\n'
-            if self.callback_handler:
-                self.callback_handler.flush()
+            start = time.perf_counter()
+            first_token_at = None
+            completion_chars = num_chunks = 0
+            try:
+                query_embedding = self.embed_model.get_query_embedding(query_str) if self.answer_cache.maxsize > 0 else None
+                cached = self.answer_cache.get(query_embedding, partition) if query_embedding is not None else None
+                if cached is not None:
+                    yield from self.replay_cached_answer(cached, start)
+                    return
+                response, format_input, _ = engine.query(QueryBundle(query_str))
+                references = visualize_retrieved_nodes(response.get_nodes())
+                yield encode_stream_event("references", references=references)
+                chunks = []
+                # tokens are forwarded as vLLM generates them
+                for chunk in response.response_gen:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    completion_chars += len(chunk)
+                    num_chunks += 1
+                    chunks.append(chunk)
+                    yield encode_stream_event("token", text=chunk)
+                prompt_tokens = response.prompt_tokens
+                if prompt_tokens is None:
+                    prompt_tokens = count_tokens([format_input])[0]
+                if query_embedding is not None:
+                    self.answer_cache.put(query_embedding, partition, {
+                        "references": references, "chunks": chunks, "format_input": format_input, "prompt_tokens": prompt_tokens,
+                    })
+                yield self.encode_usage_event(format_input, prompt_tokens, start, first_token_at, completion_chars, num_chunks)
+                yield encode_stream_event("done")
+            except Exception as e:
+                # headers are already sent, so failures are reported in-band
+                logging.exception("Generation failed while streaming")
+                yield encode_stream_event("error", message=str(e))
+            finally:
+                if self.callback_handler:
+                    self.callback_handler.flush()
+
+        return StreamingResponse(fetch_stream(request.query, query_engine), media_type=STREAM_MEDIA_TYPE)
+
+    async def agenerate_response(self, request):
+        # one read of the state, so the cached answer is keyed by the version it was retrieved from
+        state = self.get_index_state()
+        query_engine = self.create_generation_engine(request, state)
+        count_tokens = get_token_counter(request.model)
+
+        partition = self.answer_cache_partition(request, state)
+
+        async def afetch_stream(query_str, engine):
+            start = time.perf_counter()
+            first_token_at = None
+            completion_chars = num_chunks = 0
+            try:
+                # the embedding is cached, so retrieval does not compute it again on a miss
+                query_embedding = await self.embed_model.aget_query_embedding(query_str) if self.answer_cache.maxsize > 0 else None
+                cached = self.answer_cache.get(query_embedding, partition) if query_embedding is not None else None
+                if cached is not None:
+                    for frame in self.replay_cached_answer(cached, start):
+                        yield frame
+                    return
+                response, format_input, _ = await engine.aquery(QueryBundle(query_str))
+                references = visualize_retrieved_nodes(response.get_nodes())
+                yield encode_stream_event("references", references=references)
+                chunks = []
+                async for chunk in response.async_response_gen:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    completion_chars += len(chunk)
+                    num_chunks += 1
+                    chunks.append(chunk)
+                    yield encode_stream_event("token", text=chunk)
+                prompt_tokens = response.prompt_tokens
+                if prompt_tokens is None:
+                    # only prompts the context packer did not build are tokenized here, off the event loop
+                    prompt_tokens = (await asyncio.to_thread(count_tokens, [format_input]))[0]
+                if query_embedding is not None:
+                    self.answer_cache.put(query_embedding, partition, {
+                        "references": references, "chunks": chunks, "format_input": format_input, "prompt_tokens": prompt_tokens,
+                    })
+                yield self.encode_usage_event(format_input, prompt_tokens, start, first_token_at, completion_chars, num_chunks)
+                yield encode_stream_event("done")
+            except Exception as e:
+                # headers are already sent, so failures are reported in-band
+                logging.exception("Generation failed while streaming")
+                yield encode_stream_event("error", message=str(e))
+            finally:
+                if self.callback_handler:
+                    await asyncio.to_thread(self.callback_handler.flush)
 
-        return StreamingResponse(fetch_stream(request.query, query_engine), media_type="text/event-stream")
\ No newline at end of file
+        return StreamingResponse(afetch_stream(request.query, query_engine), media_type=STREAM_MEDIA_TYPE)
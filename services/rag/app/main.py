@@ -5,7 +5,8 @@ import traceback
 import logging
 import time
 import json
-from presentation.api.controllers import router as api_router
+import os
+from presentation.api.controllers import router as api_router, warmup, index_watcher
 
 class JsonFormatter(logging.Formatter):
     def format(self, record):
@@ -30,7 +31,7 @@ logging.getLogger("uvicorn.error").disabled = True
 
 class LoggingMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
-        if request.url.path == "/healthz":
+        if request.url.path in ("/healthz", "/readyz"):
             return await call_next(request)
         log = {
             "http.status": None,
@@ -52,11 +53,22 @@ class LoggingMiddleware(BaseHTTPMiddleware):
             logger.error(log)
         return response
     
+# with a pre-forking server (gunicorn --preload) this runs once in the master, before the workers fork
+if os.getenv("PRELOAD_MODELS", "false").lower() == "true":
+    warmup.preload()
+
 app = FastAPI()
 app.add_middleware(LoggingMiddleware)
 
 @app.on_event("startup")
 async def startup_event():
-    pass
+    warmup.start()
+    if index_watcher.interval > 0:
+        index_watcher.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if warmup.adapter is not None:
+        await warmup.adapter.aclose()
 
 app.include_router(api_router)
\ No newline at end of file
@@ -1,60 +1,206 @@
 import requests
+import httpx
 import asyncio
 import json
+import logging
 import os
-from typing import Any, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional, Tuple
 from pydantic.v1 import PrivateAttr
+from requests.adapters import HTTPAdapter
 from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.callbacks import CBEventType, EventPayload
+from llama_index.core.utils import get_tqdm_iterable
+
+from ...rag.cache import LRUCache, normalize_query
 
 class InstructorEmbeddings(BaseEmbedding):
     _url: str = PrivateAttr()
     _instruction: str = PrivateAttr()
+    _timeout: float = PrivateAttr()
+    _max_concurrent_batches: int = PrivateAttr()
+    _session: requests.Session = PrivateAttr()
+    _max_concurrent_requests: int = PrivateAttr()
+    _async_client: Optional[httpx.AsyncClient] = PrivateAttr()
+    _async_semaphore: Optional[asyncio.Semaphore] = PrivateAttr()
+    _async_loop: Optional[asyncio.AbstractEventLoop] = PrivateAttr()
+    _query_cache: LRUCache = PrivateAttr()
 
     def __init__(
         self,
         url: str = os.getenv("EMBEDDING_URL", "http://10.204.100.78:31000/embed"),
         instruction: str = "Represent a document for semantic search:",
+        embed_batch_size: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "32")),
+        max_concurrent_batches: int = int(os.getenv("EMBEDDING_MAX_CONCURRENT_BATCHES", "4")),
+        max_concurrent_requests: int = int(os.getenv("EMBEDDING_MAX_CONCURRENT_REQUESTS", "32")),
+        timeout: float = float(os.getenv("EMBEDDING_TIMEOUT", "60")),
+        query_cache_size: int = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096")),
+        query_cache_ttl: float = float(os.getenv("EMBEDDING_CACHE_TTL", "3600")),
         **kwargs: Any,
     ) -> None:
         self._url = url
         self._instruction = instruction
-        super().__init__(**kwargs)
+        self._timeout = timeout
+        self._max_concurrent_batches = max(1, max_concurrent_batches)
+        self._max_concurrent_requests = max(1, max_concurrent_requests)
+
+        # The async client and semaphore are bound to an event loop, so they are created on first use
+        self._async_client = None
+        self._async_semaphore = None
+        self._async_loop = None
+        self._query_cache = LRUCache(maxsize=query_cache_size, ttl=query_cache_ttl)
+
+        # Keep-alive session whose pool is large enough for every in-flight batch
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._max_concurrent_batches)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers.update({'Content-Type': 'application/json'})
+        super().__init__(embed_batch_size=embed_batch_size, **kwargs)
 
     @classmethod
     def class_name(cls) -> str:
         return "instructor"
 
+    @property
+    def instruction(self) -> str:
+        return self._instruction
+
+    @property
+    def cache_stats(self) -> dict:
+        return self._query_cache.stats()
+
+    def _query_cache_key(self, query: str) -> Tuple[str, str, str]:
+        return (normalize_query(query), self.model_name, self._instruction)
+
     async def _aget_query_embedding(self, query: str) -> List[float]:
-        return await self._aget_text_embedding(query)
+        key = self._query_cache_key(query)
+        embedding = self._query_cache.get(key)
+        if embedding is None:
+            embedding = await self._aget_text_embedding(query)
+            self._query_cache.put(key, embedding)
+        return embedding
 
     async def _aget_text_embedding(self, text: str) -> List[float]:
-        return await asyncio.to_thread(self._get_text_embedding, text)
+        return (await self._apost_embeddings([text]))[0]
 
     def _get_query_embedding(self, query: str) -> List[float]:
-        return self._get_text_embedding(query)
+        key = self._query_cache_key(query)
+        embedding = self._query_cache.get(key)
+        if embedding is None:
+            embedding = self._get_text_embedding(query)
+            self._query_cache.put(key, embedding)
+        return embedding
 
     def _get_text_embedding(self, text: str) -> List[float]:
+        return self._post_embeddings([text])[0]
+
+    def _post_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Embed one batch of texts with a single request to the embedding server."""
         payload = {
-            "inputs": text
+            "inputs": texts
         }
-        headers = {
-            'Content-Type': 'application/json'
+        response = self._session.post(self._url, data=json.dumps(payload), timeout=self._timeout)
+
+        if response.status_code == 200:
+            embeddings = response.json()
+            assert len(embeddings) == len(texts), f"Expected {len(texts)} embeddings, got {len(embeddings)}"
+            return embeddings
+        else:
+            raise Exception(f"Failed to get embedding: {response.text}")
+
+    def _get_async_client(self) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        """Return the pooled async client and concurrency semaphore of the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            if self._async_client is not None:
+                self._close_async_client(self._async_client, self._async_loop)
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self._timeout),
+                limits=httpx.Limits(
+                    max_connections=self._max_concurrent_requests,
+                    max_keepalive_connections=self._max_concurrent_requests,
+                ),
+                headers={'Content-Type': 'application/json'},
+            )
+            self._async_semaphore = asyncio.Semaphore(self._max_concurrent_requests)
+            self._async_loop = loop
+        return self._async_client, self._async_semaphore
+
+    @staticmethod
+    def _close_async_client(client: httpx.AsyncClient, loop: asyncio.AbstractEventLoop) -> None:
+        """Close a client replaced by the one of another event loop, on the loop its connections belong to."""
+        if loop.is_closed():
+            # asyncio cannot close transports of a closed loop, the garbage collector closes their sockets
+            logging.warning("The event loop of the embedding client was closed before the client, its connections were not closed cleanly.")
+            return
+
+        def _log_failure(future) -> None:
+            if not future.cancelled() and future.exception() is not None:
+                logging.warning("Failed to close the embedding client of a previous event loop.", exc_info=future.exception())
+
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop).add_done_callback(_log_failure)
+
+    async def _apost_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Embed one batch of texts with a single non-blocking request to the embedding server."""
+        client, semaphore = self._get_async_client()
+        payload = {
+            "inputs": texts
         }
-        
-        response = requests.post(self._url, headers=headers, data=json.dumps(payload))
+        async with semaphore:
+            response = await client.post(self._url, content=json.dumps(payload))
 
         if response.status_code == 200:
-            embedding = response.json()
-            return embedding[0]
+            embeddings = response.json()
+            assert len(embeddings) == len(texts), f"Expected {len(texts)} embeddings, got {len(embeddings)}"
+            return embeddings
         else:
             raise Exception(f"Failed to get embedding: {response.text}")
 
     async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
-        return await asyncio.to_thread(self._get_text_embeddings, texts)
-
-    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
-        embeddings = []
-        for text in texts:
-            embedding = self._get_text_embedding(text)
-            embeddings.append(embedding)
-        return embeddings
\ No newline at end of file
+        batches = [texts[i:i + self.embed_batch_size] for i in range(0, len(texts), self.embed_batch_size)]
+        results = await asyncio.gather(*[self._apost_embeddings(batch) for batch in batches])
+        return [embedding for batch in results for embedding in batch]
+
+    async def aclose(self) -> None:
+        """Close the async client, on the event loop it was created on."""
+        if self._async_client is not None:
+            if self._async_loop is asyncio.get_running_loop():
+                await self._async_client.aclose()
+            else:
+                self._close_async_client(self._async_client, self._async_loop)
+            self._async_client = None
+            self._async_semaphore = None
+            self._async_loop = None
+
+    def _get_text_embeddings(self, texts: List[str], show_progress: bool = False) -> List[List[float]]:
+        """Split texts into `embed_batch_size` batches and keep up to `max_concurrent_batches` requests in flight."""
+        batches = [texts[i:i + self.embed_batch_size] for i in range(0, len(texts), self.embed_batch_size)]
+        if len(batches) <= 1:
+            return self._post_embeddings(texts) if texts else []
+
+        with ThreadPoolExecutor(max_workers=min(self._max_concurrent_batches, len(batches))) as executor:
+            # map preserves input order, so embeddings line up with texts
+            results = get_tqdm_iterable(executor.map(self._post_embeddings, batches), show_progress, "Generating embeddings")
+            embeddings = [embedding for batch in results for embedding in batch]
+        return embeddings
+
+    def get_text_embedding_batch(
+        self,
+        texts: List[str],
+        show_progress: bool = False,
+        **kwargs: Any,
+    ) -> List[List[float]]:
+        """Get a list of text embeddings, with concurrent batched requests."""
+        with self.callback_manager.event(
+            CBEventType.EMBEDDING,
+            payload={EventPayload.SERIALIZED: self.to_dict()},
+        ) as event:
+            embeddings = self._get_text_embeddings(texts, show_progress=show_progress)
+            event.on_end(
+                payload={
+                    EventPayload.CHUNKS: texts,
+                    EventPayload.EMBEDDINGS: embeddings,
+                },
+            )
+        return embeddings
@@ -0,0 +1,19 @@
+from .lru_cache import (
+    LRUCache,
+)
+
+from .disk_cache import (
+    DiskLRUCache,
+)
+
+from .semantic_cache import (
+    SemanticCache,
+)
+
+from .score_cache import (
+    RerankScoreCache,
+)
+
+from .utils import (
+    normalize_query,
+)
@@ -0,0 +1,133 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# hits whose access time is written in one transaction, instead of one write per hit
+_TOUCH_BATCH_SIZE = 64
+# puts between two recounts of the rows, which other workers sharing the file add and delete too
+_COUNT_SYNC_PUTS = 100
+
+class DiskLRUCache:
+    """
+    Persistent LRU cache of JSON-serializable values in a SQLite file, shared by every worker that opens the same path.
+
+    Entries survive restarts; beyond `maxsize` entries the least recently read or written ones are deleted.
+    Hit/miss counters are kept per process. The row count is tracked in memory and recounted every few puts,
+    and the access times of hits are written in batches, flushed before each eviction, so most reads do not write.
+    """
+
+    def __init__(self, path: str, maxsize: int = 10000) -> None:
+        """
+        Parameters:
+        - path: SQLite file, created with its directory if missing
+        - maxsize: maximum number of entries; 0 disables the cache
+        """
+        self.path = path
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._count = 0
+        self._puts_since_count = 0
+        self._pending_touches: Dict[str, float] = {}
+        if maxsize > 0:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            self._count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def __len__(self) -> int:
+        if self._conn is None:
+            return 0
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if self._conn is None:
+            return default
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return default
+            self._pending_touches[key] = time.time()
+            if len(self._pending_touches) >= _TOUCH_BATCH_SIZE:
+                self._flush_touches()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def _flush_touches(self) -> None:
+        # called with the lock held
+        if not self._pending_touches:
+            return
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.executemany(
+                "UPDATE entries SET last_access = MAX(last_access, ?) WHERE key = ?",
+                [(last_access, key) for key, last_access in self._pending_touches.items()],
+            )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._pending_touches.clear()
+
+    def put(self, key: str, value: Any) -> None:
+        if self._conn is None:
+            return
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            now = time.time()
+            self._pending_touches.pop(key, None)
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO entries (key, value, last_access) VALUES (?, ?, ?)", (key, data, now)
+            ).rowcount
+            if inserted:
+                self._count += 1
+            else:
+                self._conn.execute("UPDATE entries SET value = ?, last_access = ? WHERE key = ?", (data, now, key))
+            self._puts_since_count += 1
+            if self._puts_since_count >= _COUNT_SYNC_PUTS:
+                self._count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                self._puts_since_count = 0
+            excess = self._count - self.maxsize
+            if excess > 0:
+                # evictions follow the recency of the latest hits
+                self._flush_touches()
+                deleted = self._conn.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_access LIMIT ?)", (excess,)
+                ).rowcount
+                self._count -= deleted
+                self.evictions += deleted
+
+    def clear(self) -> None:
+        if self._conn is None:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._pending_touches.clear()
+            self._count = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and fill level of the cache."""
+        size = len(self)
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": size,
+                "maxsize": self.maxsize,
+                "path": self.path,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
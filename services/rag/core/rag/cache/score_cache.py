@@ -0,0 +1,113 @@
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from .utils import normalize_query
+
+# per-entry cost of the OrderedDict slot and linked-list node, on top of the key and value objects
+_ENTRY_OVERHEAD_NBYTES = 30
+
+class RerankScoreCache:
+    """
+    Thread-safe LRU cache of cross-encoder scores of (query, section) pairs.
+
+    Entries are keyed by a 16-byte hash of the normalized query, the node id and an interned (model, index version)
+    partition, so a popular query reranked against the same candidates is scored once per snapshot. Lookups and
+    inserts take the whole candidate list of a request at once. Memory use is tracked as an estimate of the
+    Python objects held by the entries.
+    """
+
+    def __init__(self, maxsize: int = 100000) -> None:
+        """
+        Parameters:
+        - maxsize: maximum number of scored pairs, the least recently used one is evicted beyond it; 0 disables the cache
+        """
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Tuple[bytes, str, int], float]" = OrderedDict()
+        self._partition_ids: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+        self._nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @staticmethod
+    def query_key(query_str: str) -> bytes:
+        return hashlib.blake2b(normalize_query(query_str).encode("utf-8"), digest_size=16).digest()
+
+    @staticmethod
+    def _entry_nbytes(key: Tuple[bytes, str, int], score: float) -> int:
+        return sys.getsizeof(key) + sys.getsizeof(key[0]) + sys.getsizeof(key[1]) + sys.getsizeof(score) + _ENTRY_OVERHEAD_NBYTES
+
+    def _partition_id(self, model: str, index_version: Optional[str]) -> int:
+        return self._partition_ids.setdefault((model, index_version), len(self._partition_ids))
+
+    def get_many(self, query_str: str, node_ids: Sequence[str], model: str, index_version: Optional[str]) -> List[Optional[float]]:
+        """Cached score of every node id for the query, None for the pairs that still have to be scored."""
+        if self.maxsize <= 0:
+            return [None] * len(node_ids)
+        query_key = self.query_key(query_str)
+        scores: List[Optional[float]] = []
+        with self._lock:
+            partition_id = self._partition_id(model, index_version)
+            for node_id in node_ids:
+                key = (query_key, node_id, partition_id)
+                score = self._data.get(key)
+                if score is not None:
+                    self._data.move_to_end(key)
+                scores.append(score)
+            hits = sum(score is not None for score in scores)
+            self.hits += hits
+            self.misses += len(scores) - hits
+        return scores
+
+    def put_many(
+        self,
+        query_str: str,
+        node_ids: Sequence[str],
+        scores: Sequence[float],
+        model: str,
+        index_version: Optional[str],
+    ) -> None:
+        if self.maxsize <= 0:
+            return
+        query_key = self.query_key(query_str)
+        with self._lock:
+            partition_id = self._partition_id(model, index_version)
+            for node_id, score in zip(node_ids, scores):
+                key = (query_key, node_id, partition_id)
+                score = float(score)
+                previous = self._data.pop(key, None)
+                if previous is not None:
+                    self._nbytes -= self._entry_nbytes(key, previous)
+                self._data[key] = score
+                self._nbytes += self._entry_nbytes(key, score)
+            while len(self._data) > self.maxsize:
+                key, score = self._data.popitem(last=False)
+                self._nbytes -= self._entry_nbytes(key, score)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._partition_ids.clear()
+            self._nbytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters, fill level and estimated memory use of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "nbytes": self._nbytes,
+            }
@@ -0,0 +1,141 @@
+import threading
+import time
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+class SemanticCache:
+    """
+    Thread-safe cache keyed by embedding similarity, for answers to queries that are worded differently but mean the same.
+
+    Entries live in one preallocated matrix of normalized embeddings, so a lookup is a single matrix-vector
+    product over the cache. An entry only matches queries of the same partition (e.g. model, language and
+    index version) whose cosine similarity reaches `threshold`. Beyond `maxsize` entries the least recently
+    used one is replaced. A partition is forgotten once its last entry is replaced or expires, so partitions
+    of past index versions do not accumulate.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None, threshold: float = 0.97) -> None:
+        """
+        Parameters:
+        - maxsize: maximum number of entries; 0 disables the cache
+        - ttl: seconds an entry stays valid after it is stored, None keeps entries until replaced
+        - threshold: minimum cosine similarity between a query and a cached query to reuse its value
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._embeddings: Optional[np.ndarray] = None
+        self._values: List[Any] = [None] * max(maxsize, 0)
+        self._partitions = np.full(max(maxsize, 0), -1, dtype=np.int64)
+        self._expires_at = np.full(max(maxsize, 0), np.inf)
+        self._last_used = np.zeros(max(maxsize, 0))
+        self._partition_ids: Dict[Hashable, int] = {}
+        self._partitions_by_id: Dict[int, Hashable] = {}
+        self._next_partition_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return int((self._partitions >= 0).sum())
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _partition_id(self, partition: Hashable) -> int:
+        partition_id = self._partition_ids.get(partition)
+        if partition_id is None:
+            # ids are never reused, so a forgotten partition cannot match the slots of a new one
+            partition_id = self._next_partition_id
+            self._next_partition_id += 1
+            self._partition_ids[partition] = partition_id
+            self._partitions_by_id[partition_id] = partition
+        return partition_id
+
+    def _forget_empty_partitions(self, partition_ids: Sequence[int]) -> None:
+        for partition_id in partition_ids:
+            if partition_id >= 0 and not (self._partitions == partition_id).any():
+                del self._partition_ids[self._partitions_by_id.pop(partition_id)]
+
+    def _expire(self, now: float) -> None:
+        expired = (self._partitions >= 0) & (self._expires_at <= now)
+        if expired.any():
+            expired_partition_ids = np.unique(self._partitions[expired]).tolist()
+            self._partitions[expired] = -1
+            for slot in np.flatnonzero(expired).tolist():
+                self._values[slot] = None
+            self.expirations += int(expired.sum())
+            self._forget_empty_partitions(expired_partition_ids)
+
+    def get(self, embedding: Sequence[float], partition: Hashable, default: Any = None) -> Any:
+        """Return the value of the most similar cached query of `partition`, or `default` if none reaches the threshold."""
+        with self._lock:
+            partition_id = self._partition_ids.get(partition)
+            if self._embeddings is None or partition_id is None:
+                self.misses += 1
+                return default
+            now = time.monotonic()
+            self._expire(now)
+            similarities = self._embeddings @ self._normalize(embedding)
+            similarities[self._partitions != partition_id] = -np.inf
+            slot = int(np.argmax(similarities))
+            if similarities[slot] < self.threshold:
+                self.misses += 1
+                return default
+            self._last_used[slot] = now
+            self.hits += 1
+            return self._values[slot]
+
+    def put(self, embedding: Sequence[float], partition: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self._embeddings is None:
+                self._embeddings = np.zeros((self.maxsize, len(vector)), dtype=np.float32)
+            now = time.monotonic()
+            self._expire(now)
+            partition_id = self._partition_id(partition)
+            free = np.flatnonzero(self._partitions < 0)
+            if len(free):
+                slot = int(free[0])
+            else:
+                slot = int(np.argmin(self._last_used))
+                self.evictions += 1
+            replaced_partition_id = int(self._partitions[slot])
+            self._embeddings[slot] = vector
+            self._values[slot] = value
+            self._partitions[slot] = partition_id
+            self._expires_at[slot] = now + self.ttl if self.ttl else np.inf
+            self._last_used[slot] = now
+            self._forget_empty_partitions([replaced_partition_id])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._embeddings = None
+            self._partitions[:] = -1
+            self._values = [None] * max(self.maxsize, 0)
+            self._partition_ids.clear()
+            self._partitions_by_id.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and fill level of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": int((self._partitions >= 0).sum()),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,7 @@
+import re
+import unicodedata
+
+def normalize_query(query_str: str) -> str:
+    """Normalize a query for cache keys: unicode NFC, casefolded, whitespace collapsed."""
+    query_str = unicodedata.normalize("NFC", query_str)
+    return re.sub(r"\s+", " ", query_str).strip().casefold()
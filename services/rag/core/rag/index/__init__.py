@@ -0,0 +1,27 @@
+from .snapshot import (
+    IndexSnapshot,
+    compute_content_hash,
+    compute_corpus_fingerprint,
+)
+
+from .dense_index import (
+    DenseVectorIndex,
+)
+
+from .bm25_index import (
+    BM25Index,
+    thai_tokenize,
+)
+
+from .reference_graph import (
+    ReferenceGraph,
+)
+
+from .ann_index import (
+    HNSWVectorIndex,
+    build_hnsw_index,
+)
+
+from .const import (
+    SNAPSHOT_FORMAT_VERSION,
+)
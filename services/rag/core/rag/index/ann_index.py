@@ -0,0 +1,141 @@
+import os
+import threading
+from typing import Optional, Tuple, Union
+
+import numpy as np
+from llama_index.core.embeddings import BaseEmbedding
+
+from .dense_index import DenseVectorIndex
+from .docstore import ColumnarDocStore
+from .const import HNSW_INDEX_FILE_TEMPLATE
+
+def _import_hnswlib():
+    try:
+        import hnswlib
+    except ImportError:
+        raise ImportError(
+            "Cannot import hnswlib package, please install it: pip install hnswlib"
+        )
+    return hnswlib
+
+def build_hnsw_index(embeddings: np.ndarray, M: int = 16, ef_construction: int = 200, num_threads: int = -1):
+    """
+    Builds an HNSW graph over L2-normalized embeddings using inner-product distance.
+
+    Parameters:
+    - embeddings: (num_nodes, dim) normalized matrix, row i gets label i
+    - M: graph out-degree, higher improves recall at the cost of memory and build time
+    - ef_construction: candidate list size while building, higher improves graph quality
+    - num_threads: build threads, -1 uses every core
+
+    Returns:
+    - hnswlib.Index
+    """
+    hnswlib = _import_hnswlib()
+    num_nodes, dim = embeddings.shape
+    index = hnswlib.Index(space="ip", dim=dim)
+    index.init_index(max_elements=max(num_nodes, 1), M=M, ef_construction=ef_construction)
+    if num_nodes:
+        index.add_items(np.asarray(embeddings, dtype=np.float32), np.arange(num_nodes), num_threads=num_threads)
+    return index
+
+class HNSWVectorIndex(DenseVectorIndex):
+    """
+    DenseVectorIndex whose search goes through an approximate HNSW graph instead of scoring every node.
+
+    Needs the optional hnswlib package. hnswlib reads the whole graph into process memory and cannot memory-map it,
+    so unlike the embedding matrix each worker holds its own copy, about (4 * dim + 8 * M) bytes per node.
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        docstore: ColumnarDocStore,
+        embed_model: BaseEmbedding,
+        hnsw_index,
+        ef_search: int = 64,
+        normalized: bool = False,
+        dtype: Union[str, np.dtype] = np.float32,
+    ) -> None:
+        """
+        Parameters:
+        - hnsw_index: hnswlib.Index built over the same rows as `embeddings`, with tombstoned rows marked deleted
+        - ef_search: candidate list size at query time, higher improves recall at the cost of latency
+        """
+        super().__init__(embeddings=embeddings, docstore=docstore, embed_model=embed_model, normalized=normalized, dtype=dtype)
+        self._hnsw_index = hnsw_index
+        self._ef_search = ef_search
+        self._ef_lock = threading.Lock()
+        self._hnsw_index.set_ef(ef_search)
+
+    def search(self, query_embeddings: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        queries = queries / norms
+
+        k = min(top_k, self.num_live)
+        if k <= 0:
+            empty = np.empty((len(queries), 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+        # hnswlib needs ef >= k, raise it when a request asks for more than ef_search
+        if k > self._ef_search:
+            with self._ef_lock:
+                if k > self._ef_search:
+                    self._ef_search = k
+                    self._hnsw_index.set_ef(k)
+        labels, distances = self._hnsw_index.knn_query(queries, k=k)
+        # inner-product distance is 1 - cosine for normalized vectors
+        return labels.astype(np.int64), (1.0 - distances).astype(np.float32)
+
+    @classmethod
+    def from_snapshot(
+        cls,
+        snapshot,
+        embed_model: BaseEmbedding,
+        dtype: Optional[Union[str, np.dtype]] = None,
+        M: int = 16,
+        ef_construction: int = 200,
+        ef_search: int = 64,
+    ) -> "HNSWVectorIndex":
+        """
+        Loads the HNSW graph stored next to the snapshot, building and saving it first if it is missing.
+        Graphs are stored per (M, ef_construction) so several parameter sets can coexist.
+
+        A snapshot derived by an incremental update starts from the graph of its parent instead of
+        rebuilding it: upserted rows are (re)inserted and tombstoned rows are marked deleted.
+        """
+        hnswlib = _import_hnswlib()
+        index_file = HNSW_INDEX_FILE_TEMPLATE.format(M=M, ef_construction=ef_construction)
+        index_path = os.path.join(snapshot.path, index_file) if snapshot.path else None
+        parent_path = os.path.join(snapshot.parent.path, index_file) if snapshot.parent is not None and snapshot.parent.path else None
+        if index_path and os.path.exists(index_path):
+            hnsw_index = hnswlib.Index(space="ip", dim=snapshot.embeddings.shape[1])
+            hnsw_index.load_index(index_path, max_elements=len(snapshot))
+        else:
+            if parent_path and os.path.exists(parent_path):
+                hnsw_index = hnswlib.Index(space="ip", dim=snapshot.embeddings.shape[1])
+                hnsw_index.load_index(parent_path, max_elements=max(len(snapshot), 1))
+                # adding an existing label replaces its vector and clears its deleted mark
+                if len(snapshot.upserted_rows):
+                    hnsw_index.add_items(np.asarray(snapshot.embeddings[snapshot.upserted_rows], dtype=np.float32), snapshot.upserted_rows)
+                deleted_rows = snapshot.deleted_rows.tolist()
+            else:
+                hnsw_index = build_hnsw_index(snapshot.embeddings, M=M, ef_construction=ef_construction)
+                deleted_rows = np.flatnonzero(snapshot.deleted).tolist()
+            for row in deleted_rows:
+                hnsw_index.mark_deleted(row)
+            if index_path:
+                tmp_path = f"{index_path}.tmp"
+                hnsw_index.save_index(tmp_path)
+                os.replace(tmp_path, index_path)
+
+        return cls(
+            embeddings=snapshot.embeddings,
+            docstore=snapshot.docstore,
+            embed_model=embed_model,
+            hnsw_index=hnsw_index,
+            ef_search=ef_search,
+            normalized=True,
+            dtype=dtype or snapshot.embeddings.dtype,
+        )
@@ -0,0 +1,126 @@
+"""Recall-vs-exact report for choosing HNSW parameters.
+
+Usage:
+    python -m core.rag.index.ann_report --snapshot-dir /app/data/index --M 16 32 --ef-search 32 64 128
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .ann_index import build_hnsw_index
+from .snapshot import IndexSnapshot
+
+def _exact_top_k(embeddings: np.ndarray, queries: np.ndarray, top_k: int, deleted: Optional[np.ndarray] = None) -> np.ndarray:
+    scores = queries @ embeddings.T
+    if deleted is not None:
+        scores[:, deleted] = -np.inf
+    return np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+
+def sample_queries(
+    embeddings: np.ndarray,
+    num_queries: int = 500,
+    noise: float = 0.05,
+    seed: int = 0,
+    deleted: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Perturbed live corpus rows, normalized, used as stand-in queries when no query log is available."""
+    rng = np.random.default_rng(seed)
+    live_rows = np.arange(len(embeddings)) if deleted is None else np.flatnonzero(~deleted)
+    rows = embeddings[rng.choice(live_rows, size=min(num_queries, len(live_rows)), replace=False)]
+    queries = rows + rng.normal(scale=noise, size=rows.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def ann_recall_report(
+    embeddings: np.ndarray,
+    queries: np.ndarray,
+    top_k: int = 10,
+    M_values: Sequence[int] = (16,),
+    ef_construction_values: Sequence[int] = (200,),
+    ef_search_values: Sequence[int] = (32, 64, 128),
+    deleted: Optional[np.ndarray] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Measures recall@k and per-query latency of HNSW parameter sets against exact search.
+
+    Parameters:
+    - embeddings: (num_nodes, dim) normalized matrix
+    - queries: (num_queries, dim) normalized matrix
+    - top_k: k of recall@k
+    - M_values, ef_construction_values, ef_search_values: parameter grid
+    - deleted: mask of the tombstoned rows, which are left out of the ground truth and marked deleted in the
+      graph, as they are in the served index
+
+    Returns:
+    - one row per parameter set, starting with the exact baseline
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    deleted_rows = np.flatnonzero(deleted).tolist() if deleted is not None else []
+    top_k = min(top_k, len(embeddings) - len(deleted_rows))
+
+    start = time.perf_counter()
+    for query in queries:
+        _exact_top_k(embeddings, query[None, :], top_k, deleted)
+    exact_latency = (time.perf_counter() - start) / len(queries)
+    exact = _exact_top_k(embeddings, queries, top_k, deleted)
+    exact_sets = [set(row) for row in exact.tolist()]
+
+    report = [{"backend": "exact", "recall": 1.0, "latency_ms": exact_latency * 1000}]
+    for M, ef_construction in itertools.product(M_values, ef_construction_values):
+        start = time.perf_counter()
+        hnsw_index = build_hnsw_index(embeddings, M=M, ef_construction=ef_construction)
+        for row in deleted_rows:
+            hnsw_index.mark_deleted(row)
+        build_seconds = time.perf_counter() - start
+        for ef_search in ef_search_values:
+            hnsw_index.set_ef(max(ef_search, top_k))
+            start = time.perf_counter()
+            for query in queries:
+                hnsw_index.knn_query(query[None, :], k=top_k)
+            latency = (time.perf_counter() - start) / len(queries)
+            labels, _ = hnsw_index.knn_query(queries, k=top_k)
+            hits = sum(len(expected & set(row)) for expected, row in zip(exact_sets, labels.tolist()))
+            report.append({
+                "backend": "hnsw",
+                "M": M,
+                "ef_construction": ef_construction,
+                "ef_search": ef_search,
+                "build_seconds": build_seconds,
+                "recall": hits / (len(queries) * top_k),
+                "latency_ms": latency * 1000,
+            })
+    return report
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Report HNSW recall@k and latency against exact search.")
+    parser.add_argument("--snapshot-dir", default=os.getenv("INDEX_SNAPSHOT_DIR", os.path.join(os.getenv("DOCUMENTS_DIR", "/app/data"), "index")))
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--num-queries", type=int, default=500)
+    parser.add_argument("--M", type=int, nargs="+", default=[16])
+    parser.add_argument("--ef-construction", type=int, nargs="+", default=[200])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[32, 64, 128])
+    args = parser.parse_args(argv)
+
+    snapshot = IndexSnapshot.load(args.snapshot_dir)
+    if snapshot is None:
+        raise SystemExit(f"No index snapshot found in {args.snapshot_dir}")
+    embeddings = np.asarray(snapshot.embeddings, dtype=np.float32)
+    report = ann_recall_report(
+        embeddings,
+        sample_queries(embeddings, num_queries=args.num_queries, deleted=snapshot.deleted),
+        top_k=args.top_k,
+        M_values=args.M,
+        ef_construction_values=args.ef_construction,
+        ef_search_values=args.ef_search,
+        deleted=snapshot.deleted,
+    )
+    for row in report:
+        print(json.dumps(row))
+
+if __name__ == "__main__":
+    main()
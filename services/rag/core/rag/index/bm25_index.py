@@ -0,0 +1,348 @@
+import json
+import os
+from collections import Counter
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+from llama_index.core.schema import TextNode
+
+from .docstore import ColumnarDocStore
+
+from .const import (
+    BM25_ARRAYS_FILE_TEMPLATE,
+    BM25_VOCAB_FILE,
+)
+
+def thai_tokenize(text: str, engine: str = "newmm") -> List[str]:
+    """
+    Segments Thai (and mixed Thai/English) text into lowercase word tokens, dropping whitespace and punctuation.
+
+    Parameters:
+    - text: text to tokenize
+    - engine: pythainlp word segmentation engine
+
+    Returns:
+    - list of tokens
+    """
+    try:
+        from pythainlp.tokenize import word_tokenize
+    except ImportError:
+        raise ImportError(
+            "Cannot import pythainlp package, please install it: pip install pythainlp"
+        )
+    tokens = word_tokenize(text, engine=engine, keep_whitespace=False)
+    return [token.lower() for token in tokens if any(char.isalnum() for char in token)]
+
+class BM25Index:
+    """
+    BM25 over section text stored as compact postings arrays.
+
+    Each term owns the slice `term_offsets[t]:term_offsets[t + 1]` of `doc_ids` and `weights`, where the weights
+    already hold the full BM25 term score of that document, so a query is scored with one bincount.
+    """
+
+    def __init__(
+        self,
+        vocab: Dict[str, int],
+        term_offsets: np.ndarray,
+        doc_ids: np.ndarray,
+        weights: np.ndarray,
+        num_docs: int,
+        docstore: Optional[ColumnarDocStore] = None,
+        k1: float = 1.5,
+        b: float = 0.75,
+        tokenizer_engine: str = "newmm",
+        frequencies: Optional[np.ndarray] = None,
+    ) -> None:
+        self._vocab = vocab
+        self._term_offsets = term_offsets
+        self._doc_ids = doc_ids
+        self._weights = weights
+        # raw term frequency of each posting, kept so an update can reweight postings without re-tokenizing
+        self._frequencies = frequencies
+        self._num_docs = num_docs
+        self._docstore = docstore
+        self.k1 = k1
+        self.b = b
+        self.tokenizer_engine = tokenizer_engine
+
+    def __len__(self) -> int:
+        return self._num_docs
+
+    @property
+    def docstore(self) -> Optional[ColumnarDocStore]:
+        return self._docstore
+
+    @property
+    def docs(self) -> Mapping[str, TextNode]:
+        return self._docstore if self._docstore is not None else {}
+
+    def node(self, row: int) -> TextNode:
+        return self._docstore.node(row)
+
+    @staticmethod
+    def _tokenize_postings(
+        texts: List[str],
+        rows: List[int],
+        vocab: Dict[str, int],
+        tokenizer_engine: str,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Tokenize `texts` into (term id, document row, term frequency) postings, adding unseen terms to `vocab`."""
+        term_ids, doc_ids, frequencies = [], [], []
+        for row, text in zip(rows, texts):
+            for term, term_frequency in Counter(thai_tokenize(text, engine=tokenizer_engine)).items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(row)
+                frequencies.append(term_frequency)
+        return (
+            np.asarray(term_ids, dtype=np.int64),
+            np.asarray(doc_ids, dtype=np.int32),
+            np.asarray(frequencies, dtype=np.float32),
+        )
+
+    @classmethod
+    def _from_postings(
+        cls,
+        vocab: Dict[str, int],
+        term_ids: np.ndarray,
+        doc_ids: np.ndarray,
+        frequencies: np.ndarray,
+        num_docs: int,
+        deleted: Optional[np.ndarray] = None,
+        docstore: Optional[ColumnarDocStore] = None,
+        k1: float = 1.5,
+        b: float = 0.75,
+        tokenizer_engine: str = "newmm",
+    ) -> "BM25Index":
+        """
+        Group the postings by term and precompute their BM25 weights.
+
+        Tombstoned rows have no postings and are left out of the document count and the average length,
+        so the weights match an index built over the live rows only.
+        """
+        order = np.lexsort((doc_ids, term_ids))
+        term_ids, doc_ids, frequencies = term_ids[order], doc_ids[order], frequencies[order]
+        document_frequencies = np.bincount(term_ids, minlength=len(vocab))
+        term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(document_frequencies, out=term_offsets[1:])
+
+        doc_lengths = np.bincount(doc_ids, weights=frequencies, minlength=num_docs).astype(np.float32)
+        live_lengths = doc_lengths[~deleted] if deleted is not None else doc_lengths
+        num_live = len(live_lengths)
+        avg_length = float(live_lengths.mean()) if num_live and live_lengths.mean() > 0 else 1.0
+        idf = np.log1p((num_live - document_frequencies + 0.5) / (document_frequencies + 0.5))
+        norm = k1 * (1.0 - b + b * doc_lengths[doc_ids] / avg_length)
+        weights = (idf[term_ids] * frequencies * (k1 + 1.0) / (frequencies + norm)).astype(np.float32)
+        return cls(
+            vocab,
+            term_offsets,
+            doc_ids,
+            weights,
+            num_docs,
+            docstore=docstore,
+            k1=k1,
+            b=b,
+            tokenizer_engine=tokenizer_engine,
+            frequencies=frequencies,
+        )
+
+    @classmethod
+    def build(
+        cls,
+        texts: List[str],
+        docstore: Optional[ColumnarDocStore] = None,
+        k1: float = 1.5,
+        b: float = 0.75,
+        tokenizer_engine: str = "newmm",
+        deleted: Optional[np.ndarray] = None,
+    ) -> "BM25Index":
+        """
+        Tokenize every live text once and precompute BM25 weights for each (term, document) posting.
+
+        Parameters:
+        - texts: text of each row
+        - deleted: mask of the tombstoned rows, whose text is not indexed
+        """
+        vocab: Dict[str, int] = {}
+        rows = list(range(len(texts))) if deleted is None else np.flatnonzero(~deleted).tolist()
+        term_ids, doc_ids, frequencies = cls._tokenize_postings([texts[row] for row in rows], rows, vocab, tokenizer_engine)
+        return cls._from_postings(
+            vocab, term_ids, doc_ids, frequencies, len(texts), deleted=deleted,
+            docstore=docstore, k1=k1, b=b, tokenizer_engine=tokenizer_engine,
+        )
+
+    def update(
+        self,
+        texts: List[str],
+        rows: np.ndarray,
+        deleted: np.ndarray,
+        docstore: Optional[ColumnarDocStore] = None,
+    ) -> "BM25Index":
+        """
+        Returns a new index where `rows` hold `texts` and tombstoned rows hold nothing, tokenizing only `texts`.
+
+        The postings of every other row are reused from this index; the weights of all postings are
+        recomputed, since document frequencies and the average length change with the corpus.
+
+        Parameters:
+        - texts: new text of each upserted row
+        - rows: upserted rows, aligned with texts; rows past the end of this index are appended
+        - deleted: mask of the tombstoned rows of the new index, its length is the number of rows
+        - docstore: text and metadata of the rows of the new index
+        """
+        if self._frequencies is None:
+            raise ValueError("The index was saved without term frequencies and can only be rebuilt.")
+        vocab = dict(self._vocab)
+        term_ids = np.repeat(np.arange(len(self._term_offsets) - 1), np.diff(self._term_offsets))
+        doc_ids = np.asarray(self._doc_ids)
+        keep = ~(np.isin(doc_ids, rows) | deleted[doc_ids])
+        new_term_ids, new_doc_ids, new_frequencies = self._tokenize_postings(texts, rows.tolist(), vocab, self.tokenizer_engine)
+        return self._from_postings(
+            vocab,
+            np.concatenate([term_ids[keep], new_term_ids]),
+            np.concatenate([doc_ids[keep], new_doc_ids]),
+            np.concatenate([np.asarray(self._frequencies)[keep], new_frequencies]),
+            len(deleted),
+            deleted=deleted,
+            docstore=docstore,
+            k1=self.k1,
+            b=self.b,
+            tokenizer_engine=self.tokenizer_engine,
+        )
+
+    def search(self, query_str: str, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Scores every document that shares a term with the query.
+
+        Returns:
+        - indices and BM25 scores of at most top_k matching documents, best first
+        """
+        term_counts = Counter(self._vocab[token] for token in thai_tokenize(query_str, engine=self.tokenizer_engine) if token in self._vocab)
+        if not term_counts or top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        term_ids = np.fromiter(term_counts.keys(), dtype=np.int64)
+        query_frequencies = np.fromiter(term_counts.values(), dtype=np.float32)
+        starts, ends = self._term_offsets[term_ids], self._term_offsets[term_ids + 1]
+        doc_ids = np.concatenate([self._doc_ids[start:end] for start, end in zip(starts, ends)])
+        weights = np.concatenate([self._weights[start:end] * qf for start, end, qf in zip(starts, ends, query_frequencies)])
+        scores = np.bincount(doc_ids, weights=weights, minlength=self._num_docs)
+
+        candidates = np.flatnonzero(scores)
+        k = min(top_k, len(candidates))
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]] if k < len(candidates) else candidates
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return top.astype(np.int64), scores[top].astype(np.float32)
+
+    def as_retriever(self, similarity_top_k: int = 10, **kwargs) -> "LawBM25Retriever":
+        from ..retriever.bm25_retriever import LawBM25Retriever
+
+        return LawBM25Retriever(index=self, similarity_top_k=similarity_top_k, **kwargs)
+
+    def save(self, directory: str) -> None:
+        """Write the postings arrays and vocabulary into `directory`, atomically per file."""
+        # one .npy file per array, since arrays inside an .npz archive cannot be memory-mapped
+        arrays = {"term_offsets": self._term_offsets, "doc_ids": self._doc_ids, "weights": self._weights}
+        if self._frequencies is not None:
+            arrays["frequencies"] = self._frequencies
+        for name, array in arrays.items():
+            array_tmp = os.path.join(directory, f".{BM25_ARRAYS_FILE_TEMPLATE.format(name=name)}.tmp")
+            with open(array_tmp, "wb") as file:
+                np.save(file, array)
+            os.replace(array_tmp, os.path.join(directory, BM25_ARRAYS_FILE_TEMPLATE.format(name=name)))
+        vocab_tmp = os.path.join(directory, f".{BM25_VOCAB_FILE}.tmp")
+        with open(vocab_tmp, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "k1": self.k1,
+                    "b": self.b,
+                    "tokenizer_engine": self.tokenizer_engine,
+                    "num_docs": self._num_docs,
+                    "terms": sorted(self._vocab, key=self._vocab.get),
+                },
+                file,
+                ensure_ascii=False,
+            )
+        os.replace(vocab_tmp, os.path.join(directory, BM25_VOCAB_FILE))
+
+    @classmethod
+    def load(
+        cls,
+        directory: str,
+        docstore: Optional[ColumnarDocStore] = None,
+        k1: float = 1.5,
+        b: float = 0.75,
+        tokenizer_engine: str = "newmm",
+    ) -> Optional["BM25Index"]:
+        """
+        Load a saved index, or return None if it is missing or was built with other parameters.
+
+        The postings arrays are memory-mapped read-only, so worker processes share one copy of them.
+        """
+        try:
+            with open(os.path.join(directory, BM25_VOCAB_FILE), encoding="utf-8") as file:
+                vocab_data = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if (vocab_data["k1"], vocab_data["b"], vocab_data["tokenizer_engine"]) != (k1, b, tokenizer_engine):
+            return None
+        if docstore is not None and docstore.num_rows != vocab_data["num_docs"]:
+            return None
+        try:
+            term_offsets, doc_ids, weights = (
+                np.load(os.path.join(directory, BM25_ARRAYS_FILE_TEMPLATE.format(name=name)), mmap_mode="r")
+                for name in ("term_offsets", "doc_ids", "weights")
+            )
+        except FileNotFoundError:
+            return None
+        frequencies_path = os.path.join(directory, BM25_ARRAYS_FILE_TEMPLATE.format(name="frequencies"))
+        frequencies = np.load(frequencies_path, mmap_mode="r") if os.path.exists(frequencies_path) else None
+        return cls(
+            vocab={term: term_id for term_id, term in enumerate(vocab_data["terms"])},
+            term_offsets=term_offsets,
+            doc_ids=doc_ids,
+            weights=weights,
+            num_docs=vocab_data["num_docs"],
+            docstore=docstore,
+            k1=k1,
+            b=b,
+            tokenizer_engine=tokenizer_engine,
+            frequencies=frequencies,
+        )
+
+    @classmethod
+    def from_snapshot(
+        cls,
+        snapshot,
+        docstore: ColumnarDocStore,
+        k1: float = 1.5,
+        b: float = 0.75,
+        tokenizer_engine: str = "newmm",
+    ) -> "BM25Index":
+        """
+        Load the BM25 index stored next to the snapshot, building and saving it only if it is missing.
+
+        A snapshot derived by an incremental update starts from the index of its parent and only
+        tokenizes its upserted rows; tombstoned rows have no postings.
+        """
+        index = cls.load(snapshot.path, docstore=docstore, k1=k1, b=b, tokenizer_engine=tokenizer_engine) if snapshot.path else None
+        if index is None:
+            parent = snapshot.parent
+            parent_index = (
+                cls.load(parent.path, k1=k1, b=b, tokenizer_engine=tokenizer_engine)
+                if parent is not None and parent.path else None
+            )
+            if parent_index is not None and parent_index._frequencies is not None:
+                index = parent_index.update(
+                    [snapshot.texts[row] for row in snapshot.upserted_rows.tolist()],
+                    snapshot.upserted_rows,
+                    snapshot.deleted,
+                    docstore=docstore,
+                )
+            else:
+                index = cls.build(
+                    snapshot.texts, docstore=docstore, k1=k1, b=b, tokenizer_engine=tokenizer_engine, deleted=snapshot.deleted
+                )
+            if snapshot.path:
+                index.save(snapshot.path)
+        return index
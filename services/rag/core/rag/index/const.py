@@ -0,0 +1,19 @@
+SNAPSHOT_FORMAT_VERSION = 2
+# older formats that can still be loaded, and updated into the current one without re-embedding
+SNAPSHOT_LEGACY_FORMAT_VERSIONS = (1,)
+
+SNAPSHOT_CURRENT_FILE = "CURRENT"
+SNAPSHOT_MANIFEST_FILE = "manifest.json"
+SNAPSHOT_EMBEDDINGS_FILE = "embeddings.npy"
+SNAPSHOT_NODES_FILE = "nodes.json"
+SNAPSHOT_DELETED_FILE = "deleted.npy"
+
+DOCSTORE_MANIFEST_FILE = "docstore.json"
+DOCSTORE_ARRAY_FILE_TEMPLATE = "docstore_{name}.npy"
+
+BM25_ARRAYS_FILE_TEMPLATE = "bm25_{name}.npy"
+BM25_VOCAB_FILE = "bm25_vocab.json"
+
+REFERENCE_GRAPH_FILE = "reference_graph.npz"
+
+HNSW_INDEX_FILE_TEMPLATE = "hnsw_M{M}_efc{ef_construction}.bin"
@@ -0,0 +1,121 @@
+from typing import Mapping, Optional, Tuple, Union
+
+import numpy as np
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.schema import TextNode
+
+from .docstore import ColumnarDocStore
+
+class DenseVectorIndex:
+    """Exact cosine-similarity search over one contiguous, L2-normalized embedding matrix."""
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        docstore: ColumnarDocStore,
+        embed_model: BaseEmbedding,
+        normalized: bool = False,
+        dtype: Union[str, np.dtype] = np.float32,
+    ) -> None:
+        """
+        Parameters:
+        - embeddings: (num_nodes, dim) matrix, row i embeds docstore row i
+        - docstore: text and metadata of the rows; its tombstoned rows are never returned by a search
+        - embed_model: model used to embed queries
+        - normalized: whether the rows are already L2-normalized (snapshot matrices are)
+        - dtype: float32, or float16 to halve memory at some scoring cost; a matrix of another dtype, such as
+          a float16 index over a float32 snapshot, is converted into a private copy instead of staying mapped
+        """
+        assert len(embeddings) == docstore.num_rows, "Embedding matrix and docstore must be aligned"
+        embeddings = np.asarray(embeddings)
+        if embeddings.dtype != np.dtype(dtype):
+            embeddings = embeddings.astype(dtype)
+        if not normalized:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            embeddings = embeddings / norms
+        self._embeddings = np.ascontiguousarray(embeddings)
+        self._docstore = docstore
+        self._deleted = docstore.deleted if docstore.deleted.any() else None
+        self._num_live = len(docstore)
+        self._embed_model = embed_model
+
+    def __len__(self) -> int:
+        return self._docstore.num_rows
+
+    @property
+    def num_live(self) -> int:
+        """Number of rows a search can return, i.e. without the tombstoned ones."""
+        return self._num_live
+
+    @property
+    def embed_model(self) -> BaseEmbedding:
+        return self._embed_model
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        return self._embeddings
+
+    @property
+    def docstore(self) -> ColumnarDocStore:
+        return self._docstore
+
+    @property
+    def docs(self) -> Mapping[str, TextNode]:
+        """Live nodes by id, materialized on access."""
+        return self._docstore
+
+    def node(self, row: int) -> TextNode:
+        return self._docstore.node(row)
+
+    def search(self, query_embeddings: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Scores a batch of queries against every node with one matrix product.
+
+        Parameters:
+        - query_embeddings: (dim,) vector or (num_queries, dim) matrix
+        - top_k: number of nodes to keep per query
+
+        Returns:
+        - (num_queries, k) row indices and cosine scores, best first
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=self._embeddings.dtype))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        queries = queries / norms
+
+        scores = queries @ self._embeddings.T
+        if self._deleted is not None:
+            scores[:, self._deleted] = -np.inf
+        k = min(top_k, self._num_live)
+        if k <= 0:
+            empty = np.empty((len(queries), 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+        if k < scores.shape[1]:
+            indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            indices = np.tile(np.arange(scores.shape[1]), (len(queries), 1))
+        top_scores = np.take_along_axis(scores, indices, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        return np.take_along_axis(indices, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def as_retriever(self, similarity_top_k: int = 10, **kwargs) -> "DenseRetriever":
+        from ..retriever.dense_retriever import DenseRetriever
+
+        return DenseRetriever(index=self, similarity_top_k=similarity_top_k, **kwargs)
+
+    @classmethod
+    def from_snapshot(
+        cls,
+        snapshot,
+        embed_model: BaseEmbedding,
+        dtype: Optional[Union[str, np.dtype]] = None,
+    ) -> "DenseVectorIndex":
+        """Build the index from an IndexSnapshot, whose embedding matrix is already normalized."""
+        return cls(
+            embeddings=snapshot.embeddings,
+            docstore=snapshot.docstore,
+            embed_model=embed_model,
+            normalized=True,
+            dtype=dtype or snapshot.embeddings.dtype,
+        )
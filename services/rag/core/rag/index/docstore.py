@@ -0,0 +1,257 @@
+import json
+import os
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Sequence
+
+import numpy as np
+from llama_index.core.schema import TextNode
+
+from .const import (
+    DOCSTORE_ARRAY_FILE_TEMPLATE,
+    DOCSTORE_MANIFEST_FILE,
+)
+
+def _load_array(directory: str, name: str, mmap_mode: Optional[str]) -> np.ndarray:
+    path = os.path.join(directory, DOCSTORE_ARRAY_FILE_TEMPLATE.format(name=name))
+    try:
+        return np.load(path, mmap_mode=mmap_mode)
+    except ValueError:
+        # empty arrays cannot be memory-mapped
+        return np.load(path)
+
+def _save_array(directory: str, name: str, array: np.ndarray) -> None:
+    np.save(os.path.join(directory, DOCSTORE_ARRAY_FILE_TEMPLATE.format(name=name)), array)
+
+class StringColumn(Sequence):
+    """Strings stored as one UTF-8 blob and the byte offset of each one, decoded only when accessed."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray) -> None:
+        """
+        Parameters:
+        - blob: uint8 array with every string encoded back to back
+        - offsets: int64 array, string i is blob[offsets[i]:offsets[i + 1]]
+        """
+        self._blob = blob
+        self._offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings: Sequence[str]) -> "StringColumn":
+        encoded = [string.encode("utf-8") for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter((len(data) for data in encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("StringColumn index out of range")
+        return self._blob[self._offsets[index]:self._offsets[index + 1]].tobytes().decode("utf-8")
+
+    @property
+    def nbytes(self) -> int:
+        return int(self._blob.nbytes + self._offsets.nbytes)
+
+    def save(self, directory: str, name: str) -> None:
+        _save_array(directory, f"{name}_blob", np.asarray(self._blob))
+        _save_array(directory, f"{name}_offsets", np.asarray(self._offsets))
+
+    @classmethod
+    def load(cls, directory: str, name: str, mmap_mode: Optional[str] = "r") -> "StringColumn":
+        return cls(_load_array(directory, f"{name}_blob", mmap_mode), _load_array(directory, f"{name}_offsets", mmap_mode))
+
+class _RowView(Sequence):
+    """Read-only sequence computing each item from its row."""
+
+    def __init__(self, length: int, get: Callable[[int], Any]) -> None:
+        self._length = length
+        self._get = get
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: int) -> Any:
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("row index out of range")
+        return self._get(index)
+
+class ColumnarDocStore(Mapping):
+    """
+    Ids, text and metadata of the snapshot rows as a few flat arrays instead of one TextNode per section.
+
+    Rows are the integer ids shared with the embedding matrix, the BM25 postings and the reference graph.
+    Text and node ids are StringColumns; every metadata key is interned into a table of its distinct values
+    plus one int32 value id per row, so a law name or URL is stored once per law instead of once per section.
+    Loaded from a snapshot, all arrays are memory-mapped read-only and shared by the worker processes.
+
+    As a mapping it resolves node ids, by binary search over the sorted ids, to TextNodes materialized on
+    access. Tombstoned rows are hidden from the mapping but can still be read by row.
+    """
+
+    def __init__(
+        self,
+        node_ids: StringColumn,
+        texts: StringColumn,
+        content_hashes: StringColumn,
+        id_order: np.ndarray,
+        metadata_keys: List[str],
+        metadata_values: List[StringColumn],
+        metadata_ids: List[np.ndarray],
+        deleted: Optional[np.ndarray] = None,
+    ) -> None:
+        """
+        Parameters:
+        - node_ids, texts, content_hashes: one string per row, "" for a row without content hash
+        - id_order: rows sorted by node id
+        - metadata_keys: metadata keys, aligned with metadata_values and metadata_ids
+        - metadata_values: JSON-encoded distinct values of each key
+        - metadata_ids: index into the values of each key for every row, -1 if the row does not have the key
+        - deleted: tombstone mask of the rows
+        """
+        assert len(node_ids) == len(texts) == len(content_hashes) == len(id_order), "Docstore columns must have the same length"
+        self.node_ids = node_ids
+        self.texts = texts
+        self._content_hashes = content_hashes
+        self._id_order = id_order
+        self._metadata_keys = metadata_keys
+        self._metadata_values = metadata_values
+        self._metadata_ids = metadata_ids
+        self.deleted = deleted if deleted is not None else np.zeros(len(node_ids), dtype=bool)
+
+    @classmethod
+    def build(
+        cls,
+        node_ids: Sequence[str],
+        texts: Sequence[str],
+        metadata: Sequence[Dict[str, Any]],
+        content_hashes: Optional[Sequence[Optional[str]]] = None,
+        deleted: Optional[np.ndarray] = None,
+    ) -> "ColumnarDocStore":
+        """Build the columns from per-row ids, texts and metadata dicts."""
+        metadata_keys: List[str] = []
+        for row_metadata in metadata:
+            metadata_keys.extend(key for key in row_metadata if key not in metadata_keys)
+        metadata_values, metadata_ids = [], []
+        for key in metadata_keys:
+            values: Dict[str, int] = {}
+            ids = np.full(len(node_ids), -1, dtype=np.int32)
+            for row, row_metadata in enumerate(metadata):
+                if key in row_metadata:
+                    ids[row] = values.setdefault(json.dumps(row_metadata[key], ensure_ascii=False), len(values))
+            metadata_values.append(StringColumn.from_strings(list(values)))
+            metadata_ids.append(ids)
+        content_hashes = content_hashes if content_hashes is not None else [None] * len(node_ids)
+        return cls(
+            node_ids=StringColumn.from_strings(node_ids),
+            texts=StringColumn.from_strings(texts),
+            content_hashes=StringColumn.from_strings([content_hash or "" for content_hash in content_hashes]),
+            id_order=np.asarray(sorted(range(len(node_ids)), key=node_ids.__getitem__), dtype=np.int64),
+            metadata_keys=metadata_keys,
+            metadata_values=metadata_values,
+            metadata_ids=metadata_ids,
+            deleted=deleted,
+        )
+
+    @classmethod
+    def from_nodes(cls, nodes: Sequence[TextNode]) -> "ColumnarDocStore":
+        return cls.build([node.node_id for node in nodes], [node.text for node in nodes], [node.metadata for node in nodes])
+
+    @property
+    def num_rows(self) -> int:
+        """Number of rows, tombstoned ones included."""
+        return len(self.node_ids)
+
+    @property
+    def content_hashes(self) -> Sequence[Optional[str]]:
+        return _RowView(self.num_rows, lambda row: self._content_hashes[row] or None)
+
+    @property
+    def metadata(self) -> Sequence[Dict[str, Any]]:
+        return _RowView(self.num_rows, self.get_metadata)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the columns, mapped or in memory."""
+        return (
+            self.node_ids.nbytes + self.texts.nbytes + self._content_hashes.nbytes + self._id_order.nbytes
+            + sum(values.nbytes + ids.nbytes for values, ids in zip(self._metadata_values, self._metadata_ids))
+        )
+
+    def get_metadata(self, row: int) -> Dict[str, Any]:
+        metadata = {}
+        for key, values, ids in zip(self._metadata_keys, self._metadata_values, self._metadata_ids):
+            value_id = int(ids[row])
+            if value_id >= 0:
+                metadata[key] = json.loads(values[value_id])
+        return metadata
+
+    def node(self, row: int) -> TextNode:
+        """Materialize the TextNode of a row."""
+        return TextNode(text=self.texts[row], id_=self.node_ids[row], extra_info=self.get_metadata(row))
+
+    def row_of(self, node_id: str) -> Optional[int]:
+        """Row of a node id, tombstoned or not, or None if the id is unknown."""
+        low, high = 0, len(self._id_order)
+        while low < high:
+            middle = (low + high) // 2
+            if self.node_ids[int(self._id_order[middle])] < node_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self._id_order) and self.node_ids[int(self._id_order[low])] == node_id:
+            return int(self._id_order[low])
+        return None
+
+    def __getitem__(self, node_id: str) -> TextNode:
+        row = self.row_of(node_id)
+        if row is None or self.deleted[row]:
+            raise KeyError(node_id)
+        return self.node(row)
+
+    def __contains__(self, node_id: object) -> bool:
+        if not isinstance(node_id, str):
+            return False
+        row = self.row_of(node_id)
+        return row is not None and not self.deleted[row]
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.node_ids[row] for row in range(self.num_rows) if not self.deleted[row])
+
+    def __len__(self) -> int:
+        return self.num_rows - int(self.deleted.sum())
+
+    def save(self, directory: str) -> None:
+        """Write every column into `directory`, which is expected to be a snapshot version being written."""
+        self.node_ids.save(directory, "ids")
+        self.texts.save(directory, "texts")
+        self._content_hashes.save(directory, "hashes")
+        _save_array(directory, "id_order", np.asarray(self._id_order))
+        for position, (values, ids) in enumerate(zip(self._metadata_values, self._metadata_ids)):
+            values.save(directory, f"metadata{position}_values")
+            _save_array(directory, f"metadata{position}_ids", np.asarray(ids))
+        with open(os.path.join(directory, DOCSTORE_MANIFEST_FILE), "w", encoding="utf-8") as file:
+            json.dump({"num_rows": self.num_rows, "metadata_keys": self._metadata_keys}, file, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str, deleted: Optional[np.ndarray] = None, mmap_mode: Optional[str] = "r") -> Optional["ColumnarDocStore"]:
+        """Memory-map the columns saved in `directory`, or return None if there are none."""
+        try:
+            with open(os.path.join(directory, DOCSTORE_MANIFEST_FILE), encoding="utf-8") as file:
+                manifest = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        metadata_keys = manifest["metadata_keys"]
+        return cls(
+            node_ids=StringColumn.load(directory, "ids", mmap_mode),
+            texts=StringColumn.load(directory, "texts", mmap_mode),
+            content_hashes=StringColumn.load(directory, "hashes", mmap_mode),
+            id_order=_load_array(directory, "id_order", mmap_mode),
+            metadata_keys=metadata_keys,
+            metadata_values=[StringColumn.load(directory, f"metadata{position}_values", mmap_mode) for position in range(len(metadata_keys))],
+            metadata_ids=[_load_array(directory, f"metadata{position}_ids", mmap_mode) for position in range(len(metadata_keys))],
+            deleted=deleted,
+        )
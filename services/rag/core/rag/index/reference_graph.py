@@ -0,0 +1,161 @@
+import os
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+from .const import REFERENCE_GRAPH_FILE
+
+class ReferenceGraph:
+    """
+    Sections cited by each section, stored as a CSR adjacency over snapshot rows.
+
+    The sections cited by row `r` are `indices[indptr[r]:indptr[r + 1]]`, so expanding a retrieved section
+    is one id lookup and one array slice.
+    """
+
+    def __init__(
+        self,
+        node_ids: Sequence[str],
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        row_of: Optional[Callable[[str], Optional[int]]] = None,
+    ) -> None:
+        """
+        Parameters:
+        - node_ids: node id of each row
+        - indptr, indices: CSR adjacency over the rows
+        - row_of: resolves a node id to its row, e.g. ColumnarDocStore.row_of; a dict of the ids is built if None
+        """
+        assert len(indptr) == len(node_ids) + 1, "indptr must have one more entry than there are nodes"
+        self._node_ids = node_ids
+        self._row_of = row_of or {node_id: row for row, node_id in enumerate(node_ids)}.get
+        self._indptr = indptr
+        self._indices = indices
+
+    def __len__(self) -> int:
+        return len(self._node_ids)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self._indices)
+
+    @classmethod
+    def build(
+        cls,
+        node_ids: Sequence[str],
+        references: List[List[str]],
+        row_of: Optional[Callable[[str], Optional[int]]] = None,
+    ) -> "ReferenceGraph":
+        """
+        Builds the graph from the ids cited by each node.
+
+        Parameters:
+        - node_ids: node ids, in snapshot order
+        - references: ids cited by each node, aligned with node_ids; unknown ids, self-citations and repeats are dropped
+        - row_of: id lookup of the returned graph, see __init__
+
+        Returns:
+        - the reference graph
+        """
+        assert len(node_ids) == len(references), "Every node needs a (possibly empty) reference list"
+        rows = {node_id: row for row, node_id in enumerate(node_ids)}
+        indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        indices = []
+        for row, cited_ids in enumerate(references):
+            targets = []
+            for cited_id in cited_ids:
+                target = rows.get(cited_id)
+                if target is not None and target != row and target not in targets:
+                    targets.append(target)
+            indices.extend(targets)
+            indptr[row + 1] = len(indices)
+        return cls(node_ids, indptr, np.asarray(indices, dtype=np.int32), row_of=row_of)
+
+    def neighbors(self, node_id: str) -> List[str]:
+        """Ids of the sections cited directly by `node_id`, empty for unknown ids."""
+        row = self._row_of(node_id)
+        if row is None:
+            return []
+        return [self._node_ids[target] for target in self._indices[self._indptr[row]:self._indptr[row + 1]].tolist()]
+
+    def expand(self, node_ids: List[str], max_hops: int = 1, max_references: Optional[int] = None) -> List[List[str]]:
+        """
+        Collects the sections cited by each retrieved section, following citations breadth-first.
+
+        Sections are added at most once per call: a section already retrieved, or already added for an
+        earlier (better ranked) section, is not repeated, which also stops cycles between sections.
+
+        Parameters:
+        - node_ids: retrieved node ids, best first
+        - max_hops: number of citation hops to follow, 1 only adds directly cited sections
+        - max_references: cap on the number of sections added over all retrieved sections, None for no cap
+
+        Returns:
+        - ids of the sections added for each retrieved node, aligned with node_ids
+        """
+        visited = np.zeros(len(self._node_ids), dtype=bool)
+        seeds = [self._row_of(node_id) for node_id in node_ids]
+        visited[[row for row in seeds if row is not None]] = True
+        budget = max_references if max_references is not None else len(self._node_ids)
+
+        expanded = []
+        for row in seeds:
+            added: List[int] = []
+            frontier = [row] if row is not None else []
+            for _ in range(max_hops):
+                if not frontier or budget <= 0:
+                    break
+                next_frontier = []
+                for source in frontier:
+                    targets = self._indices[self._indptr[source]:self._indptr[source + 1]]
+                    targets = targets[~visited[targets]][:budget]
+                    visited[targets] = True
+                    budget -= len(targets)
+                    next_frontier.extend(targets.tolist())
+                    if budget <= 0:
+                        break
+                added.extend(next_frontier)
+                frontier = next_frontier
+            expanded.append([self._node_ids[target] for target in added])
+        return expanded
+
+    def save(self, directory: str) -> None:
+        """Write the CSR arrays into `directory` atomically."""
+        tmp_path = os.path.join(directory, f".{REFERENCE_GRAPH_FILE}.tmp")
+        with open(tmp_path, "wb") as file:
+            np.savez(file, indptr=self._indptr, indices=self._indices)
+        os.replace(tmp_path, os.path.join(directory, REFERENCE_GRAPH_FILE))
+
+    @classmethod
+    def load(
+        cls,
+        directory: str,
+        node_ids: Sequence[str],
+        row_of: Optional[Callable[[str], Optional[int]]] = None,
+    ) -> Optional["ReferenceGraph"]:
+        """Load a saved graph, or return None if it is missing or was built for another set of nodes."""
+        try:
+            with np.load(os.path.join(directory, REFERENCE_GRAPH_FILE)) as arrays:
+                indptr, indices = arrays["indptr"], arrays["indices"]
+        except FileNotFoundError:
+            return None
+        if len(indptr) != len(node_ids) + 1:
+            return None
+        return cls(node_ids, indptr, indices, row_of=row_of)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, load_references: Callable[[], List[List[str]]]) -> "ReferenceGraph":
+        """
+        Load the graph stored next to the snapshot, building and saving it only if it is missing.
+
+        Parameters:
+        - snapshot: the IndexSnapshot the graph rows are aligned with
+        - load_references: returns the ids cited by each snapshot node, only called when the graph has to be built
+        """
+        row_of = snapshot.docstore.row_of
+        graph = cls.load(snapshot.path, snapshot.node_ids, row_of=row_of) if snapshot.path else None
+        if graph is None:
+            graph = cls.build(snapshot.node_ids, load_references(), row_of=row_of)
+            if snapshot.path:
+                graph.save(snapshot.path)
+        return graph
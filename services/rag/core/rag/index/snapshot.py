@@ -0,0 +1,405 @@
+import contextlib
+import datetime
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core.schema import TextNode
+
+from .const import (
+    SNAPSHOT_FORMAT_VERSION,
+    SNAPSHOT_LEGACY_FORMAT_VERSIONS,
+    SNAPSHOT_CURRENT_FILE,
+    SNAPSHOT_MANIFEST_FILE,
+    SNAPSHOT_EMBEDDINGS_FILE,
+    SNAPSHOT_NODES_FILE,
+    SNAPSHOT_DELETED_FILE,
+)
+from .docstore import ColumnarDocStore
+
+def compute_corpus_fingerprint(file_paths: List[str], embed_model_name: str, instruction: str = "") -> str:
+    """
+    Computes a fingerprint identifying the corpus files and the embedding model used to index them.
+
+    Parameters:
+    - file_paths: paths of every file whose content ends up in the index (law JSON files, url mapper)
+    - embed_model_name: name of the embedding model
+    - instruction: instruction passed to the embedding model
+
+    Returns:
+    - hex digest that changes whenever a file or the embedding model changes
+    """
+    digest = hashlib.sha256()
+    digest.update(f"format={SNAPSHOT_FORMAT_VERSION}\0model={embed_model_name}\0instruction={instruction}\0".encode("utf-8"))
+    for path in sorted(file_paths, key=os.path.basename):
+        with open(path, "rb") as file:
+            file_digest = hashlib.sha256(file.read()).hexdigest()
+        digest.update(f"{os.path.basename(path)}\0{file_digest}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+def compute_content_hash(text: str, embed_model_name: str, instruction: str = "") -> str:
+    """
+    Key of the embedding cache: identifies the exact text a node is embedded from and the model embedding it.
+
+    Parameters:
+    - text: text sent to the embedding model, i.e. the node content with its embed metadata
+    - embed_model_name: name of the embedding model
+    - instruction: instruction passed to the embedding model
+
+    Returns:
+    - hex digest shared by every node, in any snapshot, whose stored embedding can be reused for `text`
+    """
+    return hashlib.sha256(f"{embed_model_name}\0{instruction}\0{text}".encode("utf-8")).hexdigest()
+
+class IndexSnapshot:
+    """
+    Embedding matrix, node ids, text and metadata of the law corpus, persisted as one versioned directory.
+
+    Ids, text and metadata are stored as a ColumnarDocStore. A saved or loaded snapshot reads them from the
+    memory-mapped docstore, so its `node_ids`, `texts`, `metadata` and `content_hashes` are read-only sequences.
+    """
+
+    def __init__(
+        self,
+        node_ids: Sequence[str],
+        texts: Sequence[str],
+        metadata: Sequence[Dict[str, Any]],
+        embeddings: np.ndarray,
+        fingerprint: str,
+        embed_model_name: str,
+        path: Optional[str] = None,
+        content_hashes: Optional[Sequence[Optional[str]]] = None,
+        deleted: Optional[np.ndarray] = None,
+        docstore: Optional[ColumnarDocStore] = None,
+    ) -> None:
+        assert len(node_ids) == len(texts) == len(metadata) == len(embeddings), "Snapshot columns must have the same length"
+        self.node_ids = node_ids
+        self.texts = texts
+        self.metadata = metadata
+        self.embeddings = embeddings
+        self.fingerprint = fingerprint
+        self.embed_model_name = embed_model_name
+        # version directory the snapshot was saved to or loaded from
+        self.path = path
+        # content hash of each row, None for rows of snapshots written before hashes were stored
+        self.content_hashes = content_hashes if content_hashes is not None else [None] * len(node_ids)
+        # tombstones: rows of sections removed from the corpus, kept so the other rows keep their position
+        self.deleted = deleted if deleted is not None else np.zeros(len(node_ids), dtype=bool)
+        # set by upsert: the snapshot this one was derived from and the rows written or tombstoned since,
+        # so derived indexes such as the HNSW graph can be updated instead of rebuilt
+        self.parent: Optional["IndexSnapshot"] = None
+        self.upserted_rows = np.empty(0, dtype=np.int64)
+        self.deleted_rows = np.empty(0, dtype=np.int64)
+        self._docstore = docstore
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def docstore(self) -> ColumnarDocStore:
+        """Columnar store of the rows, built in memory for a snapshot that was never saved."""
+        if self._docstore is None:
+            self._docstore = ColumnarDocStore.build(
+                self.node_ids, self.texts, self.metadata, content_hashes=self.content_hashes, deleted=self.deleted
+            )
+        return self._docstore
+
+    def _use_docstore(self, docstore: ColumnarDocStore) -> None:
+        # read the columns from the docstore instead of keeping one Python object per row
+        self._docstore = docstore
+        self.node_ids = docstore.node_ids
+        self.texts = docstore.texts
+        self.metadata = docstore.metadata
+        self.content_hashes = docstore.content_hashes
+
+    @property
+    def num_deleted(self) -> int:
+        return int(self.deleted.sum())
+
+    @staticmethod
+    def _normalize(embeddings: List[List[float]], num_rows: int) -> np.ndarray:
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(num_rows, -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return np.ascontiguousarray(matrix / norms)
+
+    @classmethod
+    def from_nodes(
+        cls,
+        nodes: List[TextNode],
+        embeddings: List[List[float]],
+        fingerprint: str,
+        embed_model_name: str,
+        content_hashes: Optional[List[str]] = None,
+    ) -> "IndexSnapshot":
+        """Build a snapshot from nodes and their embeddings, L2-normalizing the embedding matrix."""
+        return cls(
+            node_ids=[node.node_id for node in nodes],
+            texts=[node.text for node in nodes],
+            metadata=[node.metadata for node in nodes],
+            embeddings=cls._normalize(embeddings, len(nodes)),
+            fingerprint=fingerprint,
+            embed_model_name=embed_model_name,
+            content_hashes=content_hashes,
+        )
+
+    def embedding_rows(self) -> Dict[str, int]:
+        """Row of the stored embedding for each content hash, tombstoned rows included, to be reused by an update."""
+        return {content_hash: row for row, content_hash in enumerate(self.content_hashes) if content_hash is not None}
+
+    def diff(self, node_ids: List[str], content_hashes: List[str]) -> Dict[str, List[str]]:
+        """
+        Compares the snapshot with the current nodes of the corpus.
+
+        Parameters:
+        - node_ids: ids of the current nodes
+        - content_hashes: content hash of each current node, aligned with node_ids
+
+        Returns:
+        - ids of the `added` nodes (unknown or tombstoned here), the `changed` ones and the `deleted` ones
+        """
+        rows = {node_id: row for row, node_id in enumerate(self.node_ids)}
+        current = set(node_ids)
+        added, changed = [], []
+        for node_id, content_hash in zip(node_ids, content_hashes):
+            row = rows.get(node_id)
+            if row is None or self.deleted[row]:
+                added.append(node_id)
+            elif self.content_hashes[row] != content_hash:
+                changed.append(node_id)
+        deleted = [node_id for row, node_id in enumerate(self.node_ids) if not self.deleted[row] and node_id not in current]
+        return {"added": added, "changed": changed, "deleted": deleted}
+
+    def upsert(
+        self,
+        nodes: List[TextNode],
+        embeddings: List[List[float]],
+        content_hashes: List[str],
+        delete_ids: List[str],
+        fingerprint: str,
+    ) -> "IndexSnapshot":
+        """
+        Derives the next snapshot version: `nodes` replace the row of their id in place or are appended,
+        and the rows of `delete_ids` are tombstoned. Every other row, and its position, is kept.
+
+        Parameters:
+        - nodes: added or changed nodes
+        - embeddings: embedding of each node, aligned with nodes
+        - content_hashes: content hash of each node, aligned with nodes
+        - delete_ids: ids of the nodes removed from the corpus
+        - fingerprint: corpus fingerprint of the new version
+
+        Returns:
+        - the new, unsaved snapshot, with `parent`, `upserted_rows` and `deleted_rows` set
+        """
+        rows = {node_id: row for row, node_id in enumerate(self.node_ids)}
+        node_ids, texts, metadata = list(self.node_ids), list(self.texts), list(self.metadata)
+        hashes = list(self.content_hashes)
+        upserted_rows = []
+        for node, content_hash in zip(nodes, content_hashes):
+            row = rows.get(node.node_id)
+            if row is None:
+                row = rows[node.node_id] = len(node_ids)
+                node_ids.append(node.node_id)
+                texts.append(node.text)
+                metadata.append(node.metadata)
+                hashes.append(content_hash)
+            else:
+                texts[row], metadata[row], hashes[row] = node.text, node.metadata, content_hash
+            upserted_rows.append(row)
+        upserted_rows = np.asarray(upserted_rows, dtype=np.int64)
+        deleted_rows = np.asarray([rows[node_id] for node_id in delete_ids], dtype=np.int64)
+
+        matrix = np.empty((len(node_ids), self.embeddings.shape[1]), dtype=np.float32)
+        matrix[:len(self)] = self.embeddings
+        if len(nodes):
+            matrix[upserted_rows] = self._normalize(embeddings, len(nodes))
+        deleted = np.zeros(len(node_ids), dtype=bool)
+        deleted[:len(self)] = self.deleted
+        deleted[upserted_rows] = False
+        deleted[deleted_rows] = True
+
+        snapshot = IndexSnapshot(
+            node_ids=node_ids,
+            texts=texts,
+            metadata=metadata,
+            embeddings=matrix,
+            fingerprint=fingerprint,
+            embed_model_name=self.embed_model_name,
+            content_hashes=hashes,
+            deleted=deleted,
+        )
+        snapshot.parent = self
+        snapshot.upserted_rows = upserted_rows
+        snapshot.deleted_rows = deleted_rows
+        return snapshot
+
+    def compact(self) -> "IndexSnapshot":
+        """Returns a copy of the snapshot without its tombstoned rows, renumbering the remaining ones."""
+        keep = np.flatnonzero(~self.deleted)
+        return IndexSnapshot(
+            node_ids=[self.node_ids[row] for row in keep],
+            texts=[self.texts[row] for row in keep],
+            metadata=[self.metadata[row] for row in keep],
+            embeddings=np.ascontiguousarray(self.embeddings[keep]),
+            fingerprint=self.fingerprint,
+            embed_model_name=self.embed_model_name,
+            content_hashes=[self.content_hashes[row] for row in keep],
+        )
+
+    def save(self, snapshot_dir: str) -> str:
+        """
+        Writes the snapshot into `snapshot_dir/<fingerprint>` and atomically points `CURRENT` at it.
+
+        Returns:
+        - path of the written version directory
+        """
+        os.makedirs(snapshot_dir, exist_ok=True)
+        version = self.fingerprint[:16]
+        version_dir = os.path.join(snapshot_dir, version)
+        tmp_dir = tempfile.mkdtemp(prefix=f".{version}-", dir=snapshot_dir)
+        try:
+            os.chmod(tmp_dir, 0o755)
+            np.save(os.path.join(tmp_dir, SNAPSHOT_EMBEDDINGS_FILE), self.embeddings)
+            np.save(os.path.join(tmp_dir, SNAPSHOT_DELETED_FILE), self.deleted)
+            self.docstore.save(tmp_dir)
+            manifest = {
+                "format_version": SNAPSHOT_FORMAT_VERSION,
+                "fingerprint": self.fingerprint,
+                "embed_model_name": self.embed_model_name,
+                "num_nodes": len(self),
+                "dimension": int(self.embeddings.shape[1]) if self.embeddings.ndim == 2 else 0,
+                "created_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            with open(os.path.join(tmp_dir, SNAPSHOT_MANIFEST_FILE), "w", encoding="utf-8") as file:
+                json.dump(manifest, file, indent=4)
+            shutil.rmtree(version_dir, ignore_errors=True)
+            os.replace(tmp_dir, version_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        current_tmp = os.path.join(snapshot_dir, f".{SNAPSHOT_CURRENT_FILE}.tmp")
+        with open(current_tmp, "w") as file:
+            file.write(version)
+        os.replace(current_tmp, os.path.join(snapshot_dir, SNAPSHOT_CURRENT_FILE))
+        self.path = version_dir
+        # drop the private copies of the matrix and the rows for the mapped files, like a worker that loads the snapshot
+        self.embeddings = np.load(os.path.join(version_dir, SNAPSHOT_EMBEDDINGS_FILE), mmap_mode="r")
+        self._use_docstore(ColumnarDocStore.load(version_dir, deleted=self.deleted))
+        return version_dir
+
+    @classmethod
+    def load(
+        cls,
+        snapshot_dir: str,
+        fingerprint: Optional[str] = None,
+        mmap_mode: Optional[str] = "r",
+    ) -> Optional["IndexSnapshot"]:
+        """
+        Loads the current snapshot from `snapshot_dir`.
+
+        The embedding matrix and the docstore are memory-mapped read-only by default, so every worker process
+        of the host searches the same page-cache copy of the files instead of holding its own.
+
+        Parameters:
+        - snapshot_dir: directory the snapshot was saved into
+        - fingerprint: expected corpus fingerprint; a snapshot with a different one is treated as stale
+        - mmap_mode: numpy memory-map mode of the embedding matrix and docstore, None reads them into process memory
+
+        Returns:
+        - the snapshot, or None if it is missing, stale or written by an unsupported format version
+        """
+        try:
+            with open(os.path.join(snapshot_dir, SNAPSHOT_CURRENT_FILE)) as file:
+                version_dir = os.path.join(snapshot_dir, file.read().strip())
+            with open(os.path.join(version_dir, SNAPSHOT_MANIFEST_FILE), encoding="utf-8") as file:
+                manifest = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        format_version = manifest.get("format_version")
+        if format_version != SNAPSHOT_FORMAT_VERSION and format_version not in SNAPSHOT_LEGACY_FORMAT_VERSIONS:
+            return None
+        if fingerprint is not None and manifest.get("fingerprint") != fingerprint:
+            return None
+
+        embeddings = np.load(os.path.join(version_dir, SNAPSHOT_EMBEDDINGS_FILE), mmap_mode=mmap_mode)
+        if format_version == SNAPSHOT_FORMAT_VERSION:
+            deleted = np.load(os.path.join(version_dir, SNAPSHOT_DELETED_FILE))
+            docstore = ColumnarDocStore.load(version_dir, deleted=deleted, mmap_mode=mmap_mode)
+            if docstore is None:
+                return None
+            return cls(
+                node_ids=docstore.node_ids,
+                texts=docstore.texts,
+                metadata=docstore.metadata,
+                embeddings=embeddings,
+                fingerprint=manifest["fingerprint"],
+                embed_model_name=manifest["embed_model_name"],
+                path=version_dir,
+                content_hashes=docstore.content_hashes,
+                deleted=deleted,
+                docstore=docstore,
+            )
+
+        # format 1 stored the rows as one JSON list, its fingerprint never matches so it is only loaded to be updated
+        with open(os.path.join(version_dir, SNAPSHOT_NODES_FILE), encoding="utf-8") as file:
+            nodes = json.load(file)
+        return cls(
+            node_ids=[node["id"] for node in nodes],
+            texts=[node["text"] for node in nodes],
+            metadata=[node["metadata"] for node in nodes],
+            embeddings=embeddings,
+            fingerprint=manifest["fingerprint"],
+            embed_model_name=manifest["embed_model_name"],
+            path=version_dir,
+            content_hashes=[node.get("hash") for node in nodes],
+            deleted=np.asarray([node.get("deleted", False) for node in nodes], dtype=bool),
+        )
+
+    @staticmethod
+    @contextlib.contextmanager
+    def lock(snapshot_dir: str) -> Iterator[None]:
+        """Exclusive lock across processes, held while a version is built so concurrent workers build it only once."""
+        os.makedirs(snapshot_dir, exist_ok=True)
+        with open(os.path.join(snapshot_dir, ".lock"), "w") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def current_version(snapshot_dir: str) -> Optional[str]:
+        """Version `CURRENT` points at, to notice cheaply that another process saved a new snapshot."""
+        try:
+            with open(os.path.join(snapshot_dir, SNAPSHOT_CURRENT_FILE)) as file:
+                return file.read().strip()
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def prune(snapshot_dir: str, keep: int = 2) -> List[str]:
+        """
+        Deletes all but the `keep` most recent version directories; the current one is always kept.
+        Processes still searching a deleted version keep their memory-mapped files until they swap.
+
+        Returns:
+        - the deleted version directories
+        """
+        current = IndexSnapshot.current_version(snapshot_dir)
+        versions = [
+            entry.path for entry in os.scandir(snapshot_dir)
+            if entry.is_dir() and not entry.name.startswith(".") and entry.name != current
+        ]
+        versions.sort(key=os.path.getmtime, reverse=True)
+        removed = versions[max(keep - 1, 0):]
+        for path in removed:
+            shutil.rmtree(path, ignore_errors=True)
+        return removed
@@ -4,10 +4,25 @@ from .llm_manager import (
     initialize_llm,
 )
 
+from .registry import (
+    get_llm,
+    aclose_llms,
+)
+
+from .tokenizer import (
+    get_token_counter,
+    estimate_token_counts,
+)
+
+from .vllm_server import (
+    LawVllmServer,
+)
+
 from .const import (
     LLM_CONFIG,
     PROMPT_TEMPLATE_SELECTION_DICT,
     LLM_SELECTION_DICT,
+    TOKENIZER_SELECTION_DICT,
 )
 
 from .completion import (
@@ -50,3 +50,10 @@ else:
 PROMPT_TEMPLATE_SELECTION_DICT = {
     "llama3": LLAMA_3_PROMPT_TEMPLATE
 }
+
+if os.getenv("TOKENIZER_SELECTION_DICT"):
+    TOKENIZER_SELECTION_DICT = ast.literal_eval(os.getenv("TOKENIZER_SELECTION_DICT"))
+else:
+    TOKENIZER_SELECTION_DICT = {
+        "llama3": "meta-llama/Meta-Llama-3-8B-Instruct"
+    }
\ No newline at end of file
@@ -1,4 +1,4 @@
-from llama_index.llms.vllm import VllmServer
+from .vllm_server import LawVllmServer
 
 import copy
 from typing import Any
@@ -12,7 +12,7 @@ def init_vllm(port: str,
                 base_llm: str,
                 ip_address: str = "localhost",
                 prompt_language: str = "en",
-                **kwargs: Any) -> VllmServer:
+                **kwargs: Any) -> LawVllmServer:
     """
     Initializes a connection to the Nvidia vllm server.
 
@@ -22,12 +22,12 @@ def init_vllm(port: str,
         **kwargs: Additional keyword arguments for the VllmServer constructor.
 
     Returns:
-        VllmServer: An instance of the VllmServer class.
+        LawVllmServer: A VllmServer with a non-blocking async client.
     """
     completion_template = completion_manager(base_llm=base_llm, prompt_language=prompt_language)
     full_ip = ":".join([ip_address, port]) + "/generate"
     
-    return VllmServer(api_url=full_ip,
+    return LawVllmServer(api_url=full_ip,
                         completion_to_prompt=completion_template,
                         **kwargs,
                         )
@@ -0,0 +1,46 @@
+import threading
+from typing import Dict, Optional
+
+from ...llms.base import BaseLLM
+
+from ..cache.disk_cache import DiskLRUCache
+from .const import LLM_SELECTION_DICT
+from .llm_manager import initialize_llm
+
+_LLMS: Dict[str, BaseLLM] = {}
+_LLMS_LOCK = threading.Lock()
+
+def get_llm(model_id: str, completion_cache: Optional[DiskLRUCache] = None) -> BaseLLM:
+    """
+    Returns the long-lived client of a model, created the first time it is requested and shared for the rest of the process.
+
+    The client only holds the model's defaults and its connection pool: temperature and other sampling
+    parameters are passed per call, e.g. llm.complete(prompt, temperature=0.2), and the system prompt
+    of the request language through completion_to_prompt(prompt, system_prompt=...).
+
+    Parameters:
+    - model_id: a key of LLM_SELECTION_DICT
+    - completion_cache: cache of completions, only used when the client is created
+
+    Returns:
+    - the shared LLM client
+    """
+    if model_id not in LLM_SELECTION_DICT:
+        raise ValueError(f"Model ID {model_id} not supported.")
+    llm = _LLMS.get(model_id)
+    if llm is None:
+        with _LLMS_LOCK:
+            llm = _LLMS.get(model_id)
+            if llm is None:
+                llm = initialize_llm(model_id, completion_cache=completion_cache)
+                _LLMS[model_id] = llm
+    return llm
+
+async def aclose_llms() -> None:
+    """Close the connection pools of every client created so far, e.g. when the server shuts down."""
+    with _LLMS_LOCK:
+        llms = list(_LLMS.values())
+    for llm in llms:
+        # only clients with a pooled async connection have something to close
+        if hasattr(llm, "aclose"):
+            await llm.aclose()
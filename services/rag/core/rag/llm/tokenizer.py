@@ -0,0 +1,62 @@
+import logging
+import math
+import os
+import threading
+from typing import Callable, Dict, List
+
+from .const import LLM_SELECTION_DICT, TOKENIZER_SELECTION_DICT
+
+TokenCounter = Callable[[List[str]], List[int]]
+
+_TOKEN_COUNTERS: Dict[str, TokenCounter] = {}
+_TOKEN_COUNTERS_LOCK = threading.Lock()
+
+def estimate_token_counts(texts: List[str], chars_per_token: float = float(os.getenv("CHARS_PER_TOKEN", "2.5"))) -> List[int]:
+    """Approximate token counts from the text length, for models without a loadable tokenizer."""
+    return [math.ceil(len(text) / chars_per_token) for text in texts]
+
+def _load_token_counter(tokenizer_name: str) -> TokenCounter:
+    try:
+        from transformers import AutoTokenizer
+    except ImportError:
+        raise ImportError(
+            "Cannot import transformers package, please install it: pip install transformers"
+        )
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+
+    def count_tokens(texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        return [len(input_ids) for input_ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+    return count_tokens
+
+def get_token_counter(model_id: str) -> TokenCounter:
+    """
+    Returns a batch token counter for the tokenizer of a model, loaded the first time it is requested and shared for the rest of the process.
+
+    Falls back to estimate_token_counts, with a warning, when the model has no tokenizer configured or it cannot be loaded.
+
+    Parameters:
+    - model_id: a key of LLM_SELECTION_DICT
+
+    Returns:
+    - function mapping a list of texts to their token counts
+    """
+    counter = _TOKEN_COUNTERS.get(model_id)
+    if counter is None:
+        with _TOKEN_COUNTERS_LOCK:
+            counter = _TOKEN_COUNTERS.get(model_id)
+            if counter is None:
+                base_llm = LLM_SELECTION_DICT.get(model_id, {}).get("base_llm", "")
+                tokenizer_name = TOKENIZER_SELECTION_DICT.get(base_llm)
+                counter = estimate_token_counts
+                if tokenizer_name:
+                    try:
+                        counter = _load_token_counter(tokenizer_name)
+                    except Exception as e:
+                        logging.warning(f"Cannot load tokenizer {tokenizer_name} of {model_id}, estimating token counts instead: {e}")
+                else:
+                    logging.warning(f"No tokenizer configured for {model_id}, estimating token counts instead")
+                _TOKEN_COUNTERS[model_id] = counter
+    return counter
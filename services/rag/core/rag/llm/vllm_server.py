@@ -0,0 +1,232 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Iterator, List, Optional
+
+import httpx
+import requests
+from llama_index.core.base.llms.types import (
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+)
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.llms.vllm import VllmServer
+
+from ..cache.disk_cache import DiskLRUCache
+
+class LawVllmServer(VllmServer):
+    """VllmServer that keeps pooled HTTP connections, a requests.Session for sync calls and an httpx.AsyncClient for async ones."""
+
+    _timeout: float = PrivateAttr()
+    _max_connections: int = PrivateAttr()
+    _session: requests.Session = PrivateAttr()
+    _async_client: Optional[httpx.AsyncClient] = PrivateAttr()
+    _async_loop: Optional[asyncio.AbstractEventLoop] = PrivateAttr()
+    _completion_cache: Optional[DiskLRUCache] = PrivateAttr()
+
+    def __init__(
+        self,
+        timeout: float = float(os.getenv("LLM_TIMEOUT", "120")),
+        max_connections: int = int(os.getenv("LLM_MAX_CONNECTIONS", "32")),
+        completion_cache: Optional[DiskLRUCache] = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self._completion_cache = completion_cache
+        self._timeout = timeout
+        self._max_connections = max(1, max_connections)
+        # one server per client, so a single pool sized like the async client
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self._max_connections)
+        self._session = requests.Session()
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        # The async client is bound to an event loop, so it is created on first use
+        self._async_client = None
+        self._async_loop = None
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LawVllmServer"
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """Return the pooled async client of the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            if self._async_client is not None:
+                self._close_async_client(self._async_client, self._async_loop)
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self._timeout),
+                limits=httpx.Limits(
+                    max_connections=self._max_connections,
+                    max_keepalive_connections=self._max_connections,
+                ),
+            )
+            self._async_loop = loop
+        return self._async_client
+
+    @staticmethod
+    def _close_async_client(client: httpx.AsyncClient, loop: asyncio.AbstractEventLoop) -> None:
+        """Close a client replaced by the one of another event loop, on the loop its connections belong to."""
+        if loop.is_closed():
+            # asyncio cannot close transports of a closed loop, the garbage collector closes their sockets
+            logging.warning("The event loop of the LLM client was closed before the client, its connections were not closed cleanly.")
+            return
+
+        def _log_failure(future) -> None:
+            if not future.cancelled() and future.exception() is not None:
+                logging.warning("Failed to close the LLM client of a previous event loop.", exc_info=future.exception())
+
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop).add_done_callback(_log_failure)
+
+    async def aclose(self) -> None:
+        """Close the async client, on the event loop it was created on."""
+        if self._async_client is not None:
+            if self._async_loop is asyncio.get_running_loop():
+                await self._async_client.aclose()
+            else:
+                self._close_async_client(self._async_client, self._async_loop)
+            self._async_client = None
+            self._async_loop = None
+
+    def _sampling_params(self, prompt: str, stream: bool, **kwargs: Any) -> dict:
+        return {**self._model_kwargs, **kwargs, "prompt": prompt, "stream": stream}
+
+    def _completion_cache_key(self, prompt: str, kwargs: dict) -> Optional[str]:
+        """
+        Pops the `use_completion_cache` flag from the call kwargs and returns the cache key of the completion.
+
+        Only greedy completions (temperature 0) are deterministic enough to cache; callers opt in for others
+        with use_completion_cache=True. Returns None when the completion must be generated and not stored.
+        """
+        use_completion_cache = kwargs.pop("use_completion_cache", False)
+        if self._completion_cache is None:
+            return None
+        params = self._sampling_params(prompt, stream=False, **kwargs)
+        if not use_completion_cache and params.get("temperature", 1.0) != 0:
+            return None
+        content = json.dumps({"api_url": self.api_url, "params": params}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _cached_completion(text: str, deltas: List[str]) -> dict:
+        return {"text": text, "deltas": deltas}
+
+    @staticmethod
+    def _replay_completion(cached: dict) -> Iterator[CompletionResponse]:
+        """Yields a cached completion with the same deltas it was streamed with."""
+        text = cached["text"]
+        prefix_len = len(text) - sum(len(delta) for delta in cached["deltas"])
+        for delta in cached["deltas"]:
+            prefix_len += len(delta)
+            yield CompletionResponse(text=text[:prefix_len], delta=delta)
+
+    @staticmethod
+    def _completion_frame(frame: bytes, prev_prefix_len: int) -> CompletionResponse:
+        increasing_concat = json.loads(frame.decode("utf-8"))["text"][0]
+        return CompletionResponse(text=increasing_concat, delta=increasing_concat[prev_prefix_len:])
+
+    @llm_completion_callback()
+    def complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        cache_key = self._completion_cache_key(prompt, kwargs)
+        cached = self._completion_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            return CompletionResponse(text=cached["text"])
+        response = self._session.post(self.api_url, json=self._sampling_params(prompt, stream=False, **kwargs), timeout=self._timeout)
+        response.raise_for_status()
+        text = response.json()["text"][0]
+        if cache_key:
+            self._completion_cache.put(cache_key, self._cached_completion(text, [text[len(prompt):] if text.startswith(prompt) else text]))
+        return CompletionResponse(text=text)
+
+    @llm_completion_callback()
+    def stream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseGen:
+        cache_key = self._completion_cache_key(prompt, kwargs)
+        cached = self._completion_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            return self._replay_completion(cached)
+        response = self._session.post(self.api_url, json=self._sampling_params(prompt, stream=True, **kwargs), stream=True, timeout=self._timeout)
+        response.raise_for_status()
+
+        def gen() -> CompletionResponseGen:
+            prev_prefix_len = len(prompt)
+            text, deltas = prompt, []
+            # closing the response hands the connection back to the pool
+            with response:
+                for frame in response.iter_lines(chunk_size=8192, decode_unicode=False, delimiter=b"\0"):
+                    if frame.strip():
+                        completion = self._completion_frame(frame, prev_prefix_len)
+                        prev_prefix_len = len(completion.text)
+                        text = completion.text
+                        deltas.append(completion.delta)
+                        yield completion
+            # only completions streamed to the end are stored
+            if cache_key:
+                self._completion_cache.put(cache_key, self._cached_completion(text, deltas))
+
+        return gen()
+
+    @llm_completion_callback()
+    async def acomplete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        cache_key = self._completion_cache_key(prompt, kwargs)
+        cached = await asyncio.to_thread(self._completion_cache.get, cache_key) if cache_key else None
+        if cached is not None:
+            return CompletionResponse(text=cached["text"])
+        response = await self._get_async_client().post(self.api_url, json=self._sampling_params(prompt, stream=False, **kwargs))
+        response.raise_for_status()
+        text = response.json()["text"][0]
+        if cache_key:
+            await asyncio.to_thread(
+                self._completion_cache.put, cache_key, self._cached_completion(text, [text[len(prompt):] if text.startswith(prompt) else text])
+            )
+        return CompletionResponse(text=text)
+
+    @llm_completion_callback()
+    async def astream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseAsyncGen:
+        cache_key = self._completion_cache_key(prompt, kwargs)
+        cached = await asyncio.to_thread(self._completion_cache.get, cache_key) if cache_key else None
+        client = self._get_async_client()
+        sampling_params = self._sampling_params(prompt, stream=True, **kwargs)
+
+        async def replay() -> CompletionResponseAsyncGen:
+            for completion in self._replay_completion(cached):
+                yield completion
+
+        async def gen() -> CompletionResponseAsyncGen:
+            # vLLM sends the prompt plus the text generated so far, as "\0"-delimited JSON frames
+            prev_prefix_len = len(prompt)
+            text, deltas = prompt, []
+            buffer = b""
+            async with client.stream("POST", self.api_url, json=sampling_params) as response:
+                response.raise_for_status()
+                async for data in response.aiter_bytes():
+                    buffer += data
+                    *frames, buffer = buffer.split(b"\0")
+                    for frame in frames:
+                        if frame.strip():
+                            completion = self._completion_frame(frame, prev_prefix_len)
+                            prev_prefix_len = len(completion.text)
+                            text = completion.text
+                            deltas.append(completion.delta)
+                            yield completion
+            if buffer.strip():
+                completion = self._completion_frame(buffer, prev_prefix_len)
+                text = completion.text
+                deltas.append(completion.delta)
+                yield completion
+            # only completions streamed to the end are stored
+            if cache_key:
+                await asyncio.to_thread(self._completion_cache.put, cache_key, self._cached_completion(text, deltas))
+
+        return replay() if cached is not None else gen()
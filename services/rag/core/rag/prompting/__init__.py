@@ -24,8 +24,10 @@ from .template import (
     EN_REFERENCE_QA_TEMPLATE_STR,
     EN_REFINE_REFERENCE_TEMPLATE_STR,
     EN_REFINE_TEMPLATE_STR,
+    EN_COMBINE_TEMPLATE_STR,
     TH_DEFAULT_REFERENCE_TEMPLATE_STR,
     TH_REFERENCE_QA_TEMPLATE_STR,
     TH_REFINE_REFERENCE_TEMPLATE_STR,
     TH_REFINE_TEMPLATE_STR,
+    TH_COMBINE_TEMPLATE_STR,
 )
\ No newline at end of file
@@ -1,10 +1,123 @@
 """clean special tokens in response in case LLM return special tokens"""
 import re
+from typing import AsyncGenerator, AsyncIterable, Generator, Iterable, Optional
+
+# substituted one after the other, each with the pattern of the text that may still become a match once more text arrives
+SPECIAL_TOKEN_PATTERNS = (
+    (re.compile(r"\[/\w+\]"), re.compile(r"\[(/\w*)?$")),
+    (re.compile(r"\<\|\w+\|\>"), re.compile(r"\<(\|(\w+\|?)?)?$")),
+)
+ANSWER_PREFIX_PATTERN = re.compile(r"(^ตอบ\:?|^คำตอบ\:?)")
+# enough text to tell whether the answer prefix is there
+ANSWER_PREFIX_MAX_LENGTH = len("คำตอบ:")
 
 def clean_special_tokens(response: str) -> str:
     """clean special tokens in response in case LLM return special tokens"""
     response = response.strip()
-    response = re.sub(r"\[/\w+\]", "", response)
-    response = re.sub(r"\<\|\w+\|\>", "", response)
-    response = re.sub(r"(^ตอบ\:?|^คำตอบ\:?)", "", response)
-    return response.strip()
\ No newline at end of file
+    for pattern, _ in SPECIAL_TOKEN_PATTERNS:
+        response = pattern.sub("", response)
+    response = ANSWER_PREFIX_PATTERN.sub("", response)
+    return response.strip()
+
+class _StreamSubstitution:
+    """Incremental pattern.sub("", text): emits the text before any possible match, holds back a match still being written."""
+
+    def __init__(self, pattern: re.Pattern, partial_pattern: re.Pattern) -> None:
+        self._pattern = pattern
+        self._partial_pattern = partial_pattern
+        self._buffer = ""
+
+    def push(self, text: str) -> str:
+        buffer = self._buffer + text
+        output, position = [], 0
+        # same leftmost, non-overlapping scan as re.sub, so text uncovered by a removal is not matched again
+        for match in self._pattern.finditer(buffer):
+            output.append(buffer[position:match.start()])
+            position = match.end()
+        partial = self._partial_pattern.search(buffer, position)
+        hold = partial.start() if partial else len(buffer)
+        output.append(buffer[position:hold])
+        self._buffer = buffer[hold:]
+        return "".join(output)
+
+    def finish(self) -> str:
+        buffer, self._buffer = self._buffer, ""
+        return buffer
+
+class SpecialTokenStreamCleaner:
+    """
+    Incremental clean_special_tokens.
+
+    The chunks go through the same steps as the batch function, in the same order: leading whitespace, each special
+    token pattern, the answer prefix, then leading and trailing whitespace of the result. Every step only holds back
+    the text it cannot decide yet, so the joined output equals clean_special_tokens of the joined input.
+    """
+
+    def __init__(self) -> None:
+        self._substitutions = [_StreamSubstitution(pattern, partial) for pattern, partial in SPECIAL_TOKEN_PATTERNS]
+        self._input_started = False
+        self._prefix_buffer: Optional[str] = ""
+        self._output_started = False
+        self._trailing_space = ""
+
+    def push(self, token: str) -> str:
+        """Add a chunk and return the text that is safe to emit, possibly empty."""
+        if not self._input_started:
+            token = token.lstrip()
+            self._input_started = bool(token)
+        for substitution in self._substitutions:
+            token = substitution.push(token)
+        return self._strip(self._remove_prefix(token, final=False))
+
+    def finish(self) -> str:
+        """Return the text still held back once the stream has ended."""
+        text = ""
+        for substitution in self._substitutions:
+            text = substitution.push(text) + substitution.finish()
+        text = self._strip(self._remove_prefix(text, final=True))
+        self._trailing_space = ""
+        return text
+
+    def _remove_prefix(self, text: str, final: bool) -> str:
+        if self._prefix_buffer is None:
+            return text
+        buffer = self._prefix_buffer + text
+        if len(buffer) < ANSWER_PREFIX_MAX_LENGTH and not final:
+            self._prefix_buffer = buffer
+            return ""
+        self._prefix_buffer = None
+        return ANSWER_PREFIX_PATTERN.sub("", buffer)
+
+    def _strip(self, text: str) -> str:
+        if not self._output_started:
+            text = text.lstrip()
+            self._output_started = bool(text)
+        if not text:
+            return ""
+        # trailing whitespace is only emitted once more text follows it
+        text = self._trailing_space + text
+        stripped = text.rstrip()
+        self._trailing_space = text[len(stripped):]
+        return stripped
+
+def stream_clean_special_tokens(tokens: Iterable[str]) -> Generator[str, None, None]:
+    """Streaming version of clean_special_tokens."""
+    cleaner = SpecialTokenStreamCleaner()
+    for token in tokens:
+        text = cleaner.push(token)
+        if text:
+            yield text
+    text = cleaner.finish()
+    if text:
+        yield text
+
+async def astream_clean_special_tokens(tokens: AsyncIterable[str]) -> AsyncGenerator[str, None]:
+    """Async streaming version of clean_special_tokens."""
+    cleaner = SpecialTokenStreamCleaner()
+    async for token in tokens:
+        text = cleaner.push(token)
+        if text:
+            yield text
+    text = cleaner.finish()
+    if text:
+        yield text
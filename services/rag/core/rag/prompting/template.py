@@ -170,6 +170,33 @@ New Context and Retrieved Documents:
 คำตอบที่ปรับปรุงแล้ว:
 """
 
+EN_COMBINE_TEMPLATE_STR = """The original question is as follows: {query_str}
+
+Each answer below was written from a different retrieved document of Thai law.
+
+------------
+Answers:
+{context_str}
+------------
+
+Combine these answers into a single, accurate answer to the question. Keep the legal details and section references that are relevant to the question, merge answers that agree, and leave out answers that are not relevant.
+You must answer in Thai.
+Answer:
+"""
+
+TH_COMBINE_TEMPLATE_STR = """คำถามจากผู้ใช้: {query_str}
+
+คำตอบด้านล่างแต่ละข้อ ได้มาจากข้อกฎหมายที่เกี่ยวข้องคนละฉบับ
+
+------------
+คำตอบ:
+{context_str}
+------------
+
+ให้คุณรวมคำตอบเหล่านี้เป็นคำตอบเดียวที่ถูกต้องและครบถ้วน โดยคงรายละเอียดของข้อกฎหมายและมาตราที่เกี่ยวข้องกับคำถามไว้ รวมคำตอบที่มีใจความเดียวกัน และตัดคำตอบที่ไม่เกี่ยวข้องกับคำถามออก
+คำตอบ:
+"""
+
 SINGLE_QA_CRAFTING_TEMPLATE_STR = """
 Crafting First-Person Perspective, Law-Related Quiz Questions in a Conversational Tone
 
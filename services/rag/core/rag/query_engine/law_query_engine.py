@@ -1,5 +1,5 @@
 from llama_index.core.query_engine import RetrieverQueryEngine
-from llama_index.core.schema import QueryBundle, QueryType
+from llama_index.core.schema import NodeWithScore, QueryBundle, QueryType
 from llama_index.core.base.response.schema import RESPONSE_TYPE
 from llama_index.core.base.base_retriever import BaseRetriever
 from llama_index.core.prompts import BasePromptTemplate
@@ -19,9 +19,18 @@ from llama_index.core.settings import (
 from ..synthesizer.reference_synthesizer import (
     LawReferenceSynthesizer,
 )
-from ..response.schema import LawResponse
+from ..synthesizer.context_packer import ContextPacker
+from ..response.schema import LawResponse, LawStreamingResponse, LawAsyncStreamingResponse
+from ..retriever.utils import get_retriever_docs
+from ..index.reference_graph import ReferenceGraph
 
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List, Any
+import asyncio
+import contextvars
+import functools
+import os
+import threading
 
 from llama_index.core.instrumentation.events.query import (
     QueryEndEvent,
@@ -32,6 +41,21 @@ import llama_index.core.instrumentation as instrument
 
 dispatcher = instrument.get_dispatcher(__name__)
 
+_postprocess_executor: Optional[ThreadPoolExecutor] = None
+_postprocess_executor_lock = threading.Lock()
+
+def _get_postprocess_executor() -> ThreadPoolExecutor:
+    """Bounded pool for CPU-bound postprocessors without an async path, shared by every async query."""
+    global _postprocess_executor
+    if _postprocess_executor is None:
+        with _postprocess_executor_lock:
+            if _postprocess_executor is None:
+                _postprocess_executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("RERANKER_MAX_WORKERS", "2")),
+                    thread_name_prefix="postprocess",
+                )
+    return _postprocess_executor
+
 class LawQueryEngine(RetrieverQueryEngine):
     """xxx"""
     
@@ -50,6 +74,12 @@ class LawQueryEngine(RetrieverQueryEngine):
         use_async: bool = False,
         streaming: bool = False,
         prompt_language: str = "en",
+        llm_kwargs: Optional[dict] = None,
+        reference_graph: Optional[ReferenceGraph] = None,
+        reference_hops: int = 1,
+        max_references: Optional[int] = None,
+        context_packer: Optional[ContextPacker] = None,
+        map_concurrency: int = 8,
         # deprecated
         service_context: Optional[ServiceContext] = None,
         **kwargs: Any,
@@ -58,11 +88,12 @@ class LawQueryEngine(RetrieverQueryEngine):
 
         Args:
             retriever (BaseRetriever): A retriever object.
+            llm (Optional[LLM]): The LLM answering the query, Settings.llm when None.
             service_context (Optional[ServiceContext]): A ServiceContext object.
             node_postprocessors (Optional[List[BaseNodePostprocessor]]): A list of
                 node postprocessors.
             verbose (bool): Whether to print out debug info.
-            response_mode (ResponseMode): A ResponseMode object.
+            response_mode (str): "default", "refine" or "map_reduce".
             reference_qa_template (Optional[BasePromptTemplate]): A BasePromptTemplate
                 object.
             refine_template (Optional[BasePromptTemplate]): A BasePromptTemplate object.
@@ -70,6 +101,14 @@ class LawQueryEngine(RetrieverQueryEngine):
 
             use_async (bool): Whether to use async.
             streaming (bool): Whether to use streaming.
+            prompt_language (str): Language of the prompts and the system prompt.
+            llm_kwargs (Optional[dict]): Sampling parameters passed with every LLM call, e.g. temperature.
+            reference_graph (Optional[ReferenceGraph]): Citations between sections, used to add the
+                sections cited by the retrieved ones to the prompt.
+            reference_hops (int): Number of citation hops to follow.
+            max_references (Optional[int]): Cap on the number of cited sections added to the prompt.
+            context_packer (Optional[ContextPacker]): Ranks, deduplicates and budgets the prompt sections.
+            map_concurrency (int): Per-section LLM calls in flight at once in map_reduce mode.
             optimizer (Optional[BaseTokenUsageOptimizer]): A BaseTokenUsageOptimizer
                 object.
 
@@ -83,6 +122,12 @@ class LawQueryEngine(RetrieverQueryEngine):
             output_cls=output_cls,
             prompt_language=prompt_language,
             streaming=streaming,
+            llm_kwargs=llm_kwargs,
+            reference_graph=reference_graph,
+            reference_hops=reference_hops,
+            max_references=max_references,
+            context_packer=context_packer,
+            map_concurrency=map_concurrency,
         )
 
         callback_manager = callback_manager_from_settings_or_context(
@@ -103,20 +148,31 @@ class LawQueryEngine(RetrieverQueryEngine):
             CBEventType.QUERY, payload={EventPayload.QUERY_STR: query_bundle.query_str}
         ) as query_event:
             nodes = self.retrieve(query_bundle)
-            reference_nodes_dict = self.retriever._index.docstore.docs
-            response, format_input, reference_nodes_content = self._response_synthesizer.synthesize(
+            reference_nodes_dict = get_retriever_docs(self.retriever)
+            response, format_input, reference_nodes_content, prompt_tokens = self._response_synthesizer.synthesize(
                 query=query_bundle,
                 nodes=nodes,
                 reference_nodes_dict=reference_nodes_dict
             )
             
-            response = LawResponse(
-                query = query_bundle.query_str,
-                response = response,
-                nodes = nodes,
-                format_input = format_input,
-                reference = reference_nodes_content
-            )
+            if isinstance(response, str):
+                response = LawResponse(
+                    query = query_bundle.query_str,
+                    response = response,
+                    nodes = nodes,
+                    format_input = format_input,
+                    reference = reference_nodes_content,
+                    prompt_tokens = prompt_tokens
+                )
+            else:
+                response = LawStreamingResponse(
+                    query = query_bundle.query_str,
+                    response_gen = response,
+                    nodes = nodes,
+                    format_input = format_input,
+                    reference = reference_nodes_content,
+                    prompt_tokens = prompt_tokens
+                )
             
             query_event.on_end(payload={EventPayload.RESPONSE: response})
 
@@ -129,8 +185,74 @@ class LawQueryEngine(RetrieverQueryEngine):
             if isinstance(str_or_query_bundle, str):
                 str_or_query_bundle = QueryBundle(str_or_query_bundle)
             response, format_input, reference_nodes_content = self._query(str_or_query_bundle)
+        # a streaming response is still being generated, consuming it here would block until the end
+        response_str = None if isinstance(response, LawStreamingResponse) else response.get_response()
+        dispatcher.event(
+            QueryEndEvent(query=str_or_query_bundle, response={EventPayload.RESPONSE: response_str})
+        )
+        return response, format_input, reference_nodes_content
+
+    async def aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        nodes = await self._retriever.aretrieve(query_bundle)
+        for node_postprocessor in self._node_postprocessors:
+            if hasattr(node_postprocessor, "apostprocess_nodes"):
+                # batched rerankers score on their own thread, awaiting them lets every concurrent request join a batch
+                nodes = await node_postprocessor.apostprocess_nodes(nodes, query_bundle=query_bundle)
+                continue
+            # keep other postprocessors off the event loop, bounded so concurrent requests queue instead of oversubscribing the CPU
+            postprocess = functools.partial(
+                contextvars.copy_context().run, node_postprocessor.postprocess_nodes, nodes, query_bundle=query_bundle
+            )
+            nodes = await asyncio.get_running_loop().run_in_executor(_get_postprocess_executor(), postprocess)
+        return nodes
+
+    @dispatcher.span
+    async def _aquery(self, query_bundle: QueryBundle) -> RESPONSE_TYPE:
+        """Answer a query."""
+        with self.callback_manager.event(
+            CBEventType.QUERY, payload={EventPayload.QUERY_STR: query_bundle.query_str}
+        ) as query_event:
+            nodes = await self.aretrieve(query_bundle)
+            reference_nodes_dict = get_retriever_docs(self.retriever)
+            response, format_input, reference_nodes_content, prompt_tokens = await self._response_synthesizer.asynthesize(
+                query=query_bundle,
+                nodes=nodes,
+                reference_nodes_dict=reference_nodes_dict
+            )
+
+            if isinstance(response, str):
+                response = LawResponse(
+                    query = query_bundle.query_str,
+                    response = response,
+                    nodes = nodes,
+                    format_input = format_input,
+                    reference = reference_nodes_content,
+                    prompt_tokens = prompt_tokens
+                )
+            else:
+                response = LawAsyncStreamingResponse(
+                    query = query_bundle.query_str,
+                    async_response_gen = response,
+                    nodes = nodes,
+                    format_input = format_input,
+                    reference = reference_nodes_content,
+                    prompt_tokens = prompt_tokens
+                )
+
+            query_event.on_end(payload={EventPayload.RESPONSE: response})
+
+        return response, format_input, reference_nodes_content
+
+    @dispatcher.span
+    async def aquery(self, str_or_query_bundle: QueryType) -> RESPONSE_TYPE:
+        dispatcher.event(QueryStartEvent(query=str_or_query_bundle))
+        with self.callback_manager.as_trace("query"):
+            if isinstance(str_or_query_bundle, str):
+                str_or_query_bundle = QueryBundle(str_or_query_bundle)
+            response, format_input, reference_nodes_content = await self._aquery(str_or_query_bundle)
+        response_str = None if isinstance(response, LawAsyncStreamingResponse) else response.get_response()
         dispatcher.event(
-            QueryEndEvent(query=str_or_query_bundle, response={EventPayload.RESPONSE: response.get_response()})
+            QueryEndEvent(query=str_or_query_bundle, response={EventPayload.RESPONSE: response_str})
         )
         return response, format_input, reference_nodes_content
 
@@ -1,3 +1,14 @@
 from .const import (
     RERANKER_SELECTION_DICT
-)
\ No newline at end of file
+)
+
+from .batcher import (
+    RerankerBatcher,
+)
+
+from .registry import (
+    LawReranker,
+    get_reranker_batcher,
+    get_reranker_batcher_stats,
+    get_reranker_model,
+)
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+class _ScoreRequest:
+    __slots__ = ("pairs", "future", "enqueued_at")
+
+    def __init__(self, pairs: List[Tuple[str, str]]) -> None:
+        self.pairs = pairs
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+
+class RerankerBatcher:
+    """
+    Scores (query, passage) pairs of concurrent requests with shared forward passes of one cross-encoder.
+
+    Requests are queued and a single worker thread gathers them until the batch holds `max_batch_size`
+    pairs or the first request has waited `max_wait_ms`. The pairs are sorted by length, so each forward
+    pass pads little, scored in one call and handed back to every request through its future.
+    """
+
+    def __init__(self, model: Any, max_batch_size: int = 32, max_wait_ms: float = 5.0) -> None:
+        """
+        Parameters:
+        - model: cross-encoder with a FlagReranker-style compute_score(pairs, batch_size=...)
+        - max_batch_size: pairs scored per forward pass; a single request with more pairs is scored on its own
+        - max_wait_ms: how long the first queued request waits for others to join its batch
+        """
+        self.model = model
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_wait_ms = max_wait_ms
+        self._queue: "queue.Queue[_ScoreRequest]" = queue.Queue()
+        self._carry: Optional[_ScoreRequest] = None
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.pairs = 0
+        self.wait_ms_total = 0.0
+
+    def submit(self, pairs: Sequence[Tuple[str, str]]) -> Future:
+        """Queue pairs for scoring; the future resolves to their scores, in order."""
+        request = _ScoreRequest(list(pairs))
+        if not request.pairs:
+            request.future.set_result([])
+            return request.future
+        self._ensure_worker()
+        self._queue.put(request)
+        return request.future
+
+    def score(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        return self.submit(pairs).result()
+
+    async def ascore(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        return await asyncio.wrap_future(self.submit(pairs))
+
+    def _ensure_worker(self) -> None:
+        # started on first use, so a batcher created before a server forks its workers gets a thread in each of them
+        if self._thread is None or not self._thread.is_alive():
+            with self._thread_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="reranker-batcher", daemon=True)
+                    self._thread.start()
+
+    def _next_batch(self) -> List[_ScoreRequest]:
+        """
+        Gathers the next batch; each request is claimed as it joins, so a request cancelled while queued is
+        dropped and one that joined can no longer be cancelled before its scores are set.
+        """
+        while True:
+            first = self._carry or self._queue.get()
+            self._carry = None
+            if first.future.set_running_or_notify_cancel():
+                break
+        batch, size = [first], len(first.pairs)
+        deadline = first.enqueued_at + self.max_wait_ms / 1000
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                request = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if size + len(request.pairs) > self.max_batch_size:
+                # starts the next batch instead of overflowing this one
+                self._carry = request
+                break
+            if not request.future.set_running_or_notify_cancel():
+                continue
+            batch.append(request)
+            size += len(request.pairs)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            started_at = time.monotonic()
+            pairs = [pair for request in batch for pair in request.pairs]
+            order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+            try:
+                sorted_scores = self.model.compute_score([pairs[i] for i in order], batch_size=len(pairs))
+                # a single pair is scored as a float
+                if isinstance(sorted_scores, float):
+                    sorted_scores = [sorted_scores]
+                scores = [0.0] * len(pairs)
+                for position, i in enumerate(order):
+                    scores[i] = float(sorted_scores[position])
+            except Exception as e:
+                logging.exception("Reranker batch failed")
+                for request in batch:
+                    self._deliver(request, error=e)
+                continue
+
+            offset = 0
+            for request in batch:
+                self._deliver(request, scores=scores[offset:offset + len(request.pairs)])
+                offset += len(request.pairs)
+            with self._stats_lock:
+                self.requests += len(batch)
+                self.batches += 1
+                self.pairs += len(pairs)
+                self.wait_ms_total += sum((started_at - request.enqueued_at) * 1000 for request in batch)
+
+    @staticmethod
+    def _deliver(request: _ScoreRequest, scores: Optional[List[float]] = None, error: Optional[BaseException] = None) -> None:
+        # one request whose future cannot take its result must not stop the worker serving every other one
+        try:
+            if error is not None:
+                request.future.set_exception(error)
+            else:
+                request.future.set_result(scores)
+        except Exception:
+            logging.exception("Failed to hand reranker scores back to a request")
+
+    def stats(self) -> Dict[str, Any]:
+        """Batching counters of the process."""
+        with self._stats_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "requests": self.requests,
+                "batches": self.batches,
+                "pairs": self.pairs,
+                "mean_batch_pairs": self.pairs / self.batches if self.batches else 0.0,
+                "mean_queue_wait_ms": self.wait_ms_total / self.requests if self.requests else 0.0,
+                "queued": self._queue.qsize() + (1 if self._carry is not None else 0),
+            }
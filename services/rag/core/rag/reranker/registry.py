@@ -0,0 +1,178 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.callbacks import CBEventType, EventPayload
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+
+from ..cache import RerankScoreCache
+from .batcher import RerankerBatcher
+
+_RERANKER_MODELS: Dict[Tuple[str, bool], Any] = {}
+_RERANKER_MODELS_LOCK = threading.Lock()
+_RERANKER_BATCHERS: Dict[Tuple[str, bool], RerankerBatcher] = {}
+_RERANKER_BATCHERS_LOCK = threading.Lock()
+
+def get_reranker_model(model_name: str, use_fp16: bool = True) -> Any:
+    """Load a FlagReranker the first time it is requested and share it for the rest of the process."""
+    key = (model_name, use_fp16)
+    model = _RERANKER_MODELS.get(key)
+    if model is None:
+        with _RERANKER_MODELS_LOCK:
+            model = _RERANKER_MODELS.get(key)
+            if model is None:
+                try:
+                    from FlagEmbedding import FlagReranker
+                except ImportError:
+                    raise ImportError(
+                        "Cannot import FlagReranker package, please install it: pip install FlagEmbedding"
+                    )
+                model = FlagReranker(model_name, use_fp16=use_fp16)
+                _RERANKER_MODELS[key] = model
+    return model
+
+def get_reranker_batcher(model_name: str, use_fp16: bool = True) -> RerankerBatcher:
+    """
+    Returns the batcher of a reranker model, shared by every request of the process so their pairs are scored together.
+
+    Batch size and wait are read from RERANKER_MAX_BATCH_SIZE and RERANKER_MAX_WAIT_MS when the batcher is created.
+    """
+    key = (model_name, use_fp16)
+    batcher = _RERANKER_BATCHERS.get(key)
+    if batcher is None:
+        with _RERANKER_BATCHERS_LOCK:
+            batcher = _RERANKER_BATCHERS.get(key)
+            if batcher is None:
+                batcher = RerankerBatcher(
+                    get_reranker_model(model_name, use_fp16=use_fp16),
+                    max_batch_size=int(os.getenv("RERANKER_MAX_BATCH_SIZE", "32")),
+                    max_wait_ms=float(os.getenv("RERANKER_MAX_WAIT_MS", "5")),
+                )
+                _RERANKER_BATCHERS[key] = batcher
+    return batcher
+
+def get_reranker_batcher_stats() -> Dict[str, Dict[str, Any]]:
+    """Batching counters of every reranker batcher of the process, by model name."""
+    return {model_name: batcher.stats() for (model_name, _), batcher in list(_RERANKER_BATCHERS.items())}
+
+class LawReranker(BaseNodePostprocessor):
+    """
+    Cross-encoder reranker backed by the process-wide model registry, cheap to build per request.
+
+    Scores go through the model's shared RerankerBatcher, so the pairs of concurrent requests are scored in the
+    same forward passes. With a score cache, only the pairs it misses are sent to the batcher.
+    """
+
+    model: str = Field(description="BAAI Reranker model name.")
+    top_n: int = Field(description="Number of nodes to return sorted by score.")
+    use_fp16: bool = Field(description="Whether to use fp16 for inference.")
+    index_version: Optional[str] = Field(default=None, description="Version of the index the nodes come from, part of the score cache key.")
+    _batcher: RerankerBatcher = PrivateAttr()
+    _score_cache: Optional[RerankScoreCache] = PrivateAttr()
+
+    def __init__(
+        self,
+        top_n: int = 2,
+        model: str = "BAAI/bge-reranker-v2-m3",
+        use_fp16: bool = True,
+        score_cache: Optional[RerankScoreCache] = None,
+        index_version: Optional[str] = None,
+    ) -> None:
+        super().__init__(top_n=top_n, model=model, use_fp16=use_fp16, index_version=index_version)
+        self._batcher = get_reranker_batcher(model, use_fp16=use_fp16)
+        self._score_cache = score_cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LawReranker"
+
+    def _pairs(self, nodes: List[NodeWithScore], query_bundle: QueryBundle) -> List[Tuple[str, str]]:
+        return [
+            (query_bundle.query_str, node.node.get_content(metadata_mode=MetadataMode.EMBED))
+            for node in nodes
+        ]
+
+    def _event_payload(self, nodes: List[NodeWithScore], query_bundle: QueryBundle) -> Dict[str, Any]:
+        return {
+            EventPayload.NODES: nodes,
+            EventPayload.MODEL_NAME: self.model,
+            EventPayload.QUERY_STR: query_bundle.query_str,
+            EventPayload.TOP_K: self.top_n,
+        }
+
+    def _cached_scores(self, nodes: List[NodeWithScore], query_bundle: QueryBundle) -> Tuple[List[Optional[float]], List[int]]:
+        """Cached score of every node, None if missing, and the positions of the nodes still to be scored."""
+        if self._score_cache is None:
+            return [None] * len(nodes), list(range(len(nodes)))
+        scores = self._score_cache.get_many(
+            query_bundle.query_str, [node.node.node_id for node in nodes], self.model, self.index_version
+        )
+        return scores, [position for position, score in enumerate(scores) if score is None]
+
+    def _merge_scores(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: QueryBundle,
+        scores: List[Optional[float]],
+        missing: List[int],
+        computed: List[float],
+    ) -> List[float]:
+        for position, score in zip(missing, computed):
+            scores[position] = score
+        if self._score_cache is not None and missing:
+            self._score_cache.put_many(
+                query_bundle.query_str, [nodes[position].node.node_id for position in missing], computed, self.model, self.index_version
+            )
+        return scores
+
+    def _rank(self, nodes: List[NodeWithScore], scores: List[float]) -> List[NodeWithScore]:
+        assert len(scores) == len(nodes)
+
+        for node, score in zip(nodes, scores):
+            node.score = score
+
+        return sorted(nodes, key=lambda x: -x.score if x.score else 0)[: self.top_n]
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if query_bundle is None:
+            raise ValueError("Missing query bundle in extra info.")
+        if len(nodes) == 0:
+            return []
+
+        with self.callback_manager.event(CBEventType.RERANKING, payload=self._event_payload(nodes, query_bundle)) as event:
+            scores, missing = self._cached_scores(nodes, query_bundle)
+            computed = self._batcher.score(self._pairs([nodes[position] for position in missing], query_bundle))
+            new_nodes = self._rank(nodes, self._merge_scores(nodes, query_bundle, scores, missing, computed))
+            event.on_end(payload={EventPayload.NODES: new_nodes})
+
+        return new_nodes
+
+    async def apostprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+        query_str: Optional[str] = None,
+    ) -> List[NodeWithScore]:
+        """Rerank without blocking the event loop: the pairs join the batcher queue and the future is awaited."""
+        if query_str is not None and query_bundle is not None:
+            raise ValueError("Cannot specify both query_str and query_bundle")
+        elif query_str is not None:
+            query_bundle = QueryBundle(query_str)
+        if query_bundle is None:
+            raise ValueError("Missing query bundle in extra info.")
+        if len(nodes) == 0:
+            return []
+
+        with self.callback_manager.event(CBEventType.RERANKING, payload=self._event_payload(nodes, query_bundle)) as event:
+            scores, missing = self._cached_scores(nodes, query_bundle)
+            computed = await self._batcher.ascore(self._pairs([nodes[position] for position in missing], query_bundle))
+            new_nodes = self._rank(nodes, self._merge_scores(nodes, query_bundle, scores, missing, computed))
+            event.on_end(payload={EventPayload.NODES: new_nodes})
+
+        return new_nodes
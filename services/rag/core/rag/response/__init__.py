@@ -1,5 +1,13 @@
 from .schema import (
-    LawResponse
+    LawResponse,
+    LawStreamingResponse,
+    LawAsyncStreamingResponse,
+)
+
+from .stream import (
+    STREAM_PROTOCOL_VERSION,
+    STREAM_MEDIA_TYPE,
+    encode_stream_event,
 )
 
 from .utils import (
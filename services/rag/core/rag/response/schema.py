@@ -1,14 +1,16 @@
-from typing import List
+from typing import AsyncGenerator, AsyncIterator, Generator, Iterator, List, Optional
 
 from llama_index.core.schema import NodeWithScore
 
 class LawResponse:
-    def __init__(self, query: str, response: str, nodes: List[NodeWithScore], format_input: str, reference: List[List[str]]) -> None:
+    def __init__(self, query: str, response: str, nodes: List[NodeWithScore], format_input: str, reference: List[List[str]], prompt_tokens: Optional[int] = None) -> None:
         self.query = query
         self.response = response
         self.nodes = nodes
         self.format_input = format_input
         self.reference = reference
+        # token count of format_input when the synthesizer already knows it
+        self.prompt_tokens = prompt_tokens
         
     def __repr__(self):
         return f'LawResponse(query={self.query!r}, response={self.response!r}, nodes={self.nodes!r}, format_input={self.format_input!r}, reference={self.reference!r})'
@@ -29,4 +31,51 @@ class LawResponse:
         return self.format_input
     
     def get_reference(self) -> List[List[str]]:
-        return self.reference
\ No newline at end of file
+        return self.reference
+
+class LawStreamingResponse(LawResponse):
+    def __init__(self, query: str, response_gen: Iterator[str], nodes: List[NodeWithScore], format_input: str, reference: List[List[str]], prompt_tokens: Optional[int] = None) -> None:
+        super().__init__(query=query, response=None, nodes=nodes, format_input=format_input, reference=reference, prompt_tokens=prompt_tokens)
+        self._tokens: List[str] = []
+        self.response_gen = self._record(response_gen)
+
+    def _record(self, response_gen: Iterator[str]) -> Generator[str, None, None]:
+        for token in response_gen:
+            self._tokens.append(token)
+            yield token
+        self.response = "".join(self._tokens)
+
+    def __repr__(self):
+        return f'LawStreamingResponse(query={self.query!r}, nodes={self.nodes!r}, format_input={self.format_input!r}, reference={self.reference!r})'
+
+    def get_response(self) -> str:
+        """Consume the tokens not streamed yet and return the full response."""
+        for _ in self.response_gen:
+            pass
+        return "".join(self._tokens)
+
+
+class LawAsyncStreamingResponse(LawResponse):
+    def __init__(self, query: str, async_response_gen: AsyncIterator[str], nodes: List[NodeWithScore], format_input: str, reference: List[List[str]], prompt_tokens: Optional[int] = None) -> None:
+        super().__init__(query=query, response=None, nodes=nodes, format_input=format_input, reference=reference, prompt_tokens=prompt_tokens)
+        self._tokens: List[str] = []
+        self.async_response_gen = self._record(async_response_gen)
+
+    async def _record(self, async_response_gen: AsyncIterator[str]) -> AsyncGenerator[str, None]:
+        async for token in async_response_gen:
+            self._tokens.append(token)
+            yield token
+        self.response = "".join(self._tokens)
+
+    def __repr__(self):
+        return f'LawAsyncStreamingResponse(query={self.query!r}, nodes={self.nodes!r}, format_input={self.format_input!r}, reference={self.reference!r})'
+
+    def get_response(self) -> str:
+        """Return the tokens streamed so far."""
+        return "".join(self._tokens)
+
+    async def aget_response(self) -> str:
+        """Consume the tokens not streamed yet and return the full response."""
+        async for _ in self.async_response_gen:
+            pass
+        return "".join(self._tokens)
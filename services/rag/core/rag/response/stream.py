@@ -0,0 +1,21 @@
+import json
+from typing import Any
+
+STREAM_PROTOCOL_VERSION = 1
+STREAM_MEDIA_TYPE = "application/x-ndjson"
+STREAM_EVENT_TYPES = ("references", "token", "usage", "done", "error")
+
+def encode_stream_event(event: str, **data: Any) -> str:
+    """
+    Serializes one frame of the /generate stream as a single JSON line.
+
+    Parameters:
+    - event: one of STREAM_EVENT_TYPES
+    - data: event fields
+
+    Returns:
+    - newline-terminated JSON object with the protocol version `v` and the `event` type
+    """
+    assert event in STREAM_EVENT_TYPES, f"Unknown stream event: {event}"
+    # json.dumps escapes every line break inside strings, so one frame is always exactly one line
+    return json.dumps({"v": STREAM_PROTOCOL_VERSION, "event": event, **data}) + "\n"
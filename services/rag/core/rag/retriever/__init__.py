@@ -6,11 +6,27 @@ from .fusion_retriever import (
     FusionRetriever,
 )
 
+from .dense_retriever import (
+    DenseRetriever,
+)
+
+from .bm25_retriever import (
+    LawBM25Retriever,
+)
+
+from .fusion import (
+    FUSION_SCORE_KEY,
+    reciprocal_rank_fusion,
+    weighted_score_fusion,
+)
+
 from .utils import (
     visualize_retrieved_nodes,
+    get_retriever_docs,
 )
 
 from .const import (
     HF_RETRIEVER_SELECTION_DICT,
     BM25_RETRIEVER_SELECTION_DICT,
+    FUSION_MODE_SELECTION_DICT,
 )
\ No newline at end of file
@@ -0,0 +1,41 @@
+from llama_index.core.callbacks.base import CallbackManager
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from typing import List, Mapping, Optional
+import asyncio
+
+class LawBM25Retriever(BaseRetriever):
+    """Retrieve the top-k sections of a precomputed BM25Index for a Thai legal query."""
+
+    def __init__(
+        self,
+        index,
+        similarity_top_k: int = 10,
+        callback_manager: Optional[CallbackManager] = None,
+        verbose: bool = False,
+    ) -> None:
+        assert index.docstore is not None, "BM25Index must be built or loaded with its docstore to be used as a retriever"
+        self._index = index
+        self._similarity_top_k = similarity_top_k
+        super().__init__(callback_manager=callback_manager, verbose=verbose)
+
+    @property
+    def similarity_top_k(self) -> int:
+        return self._similarity_top_k
+
+    @similarity_top_k.setter
+    def similarity_top_k(self, value: int) -> None:
+        self._similarity_top_k = value
+
+    @property
+    def docs(self) -> Mapping[str, TextNode]:
+        return self._index.docs
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        indices, scores = self._index.search(query_bundle.query_str, self._similarity_top_k)
+        return [NodeWithScore(node=self._index.node(i), score=float(score)) for i, score in zip(indices.tolist(), scores.tolist())]
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        # Tokenizing and scoring are CPU-bound, keep them off the event loop
+        return await asyncio.to_thread(self._retrieve, query_bundle)
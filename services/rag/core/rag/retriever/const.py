@@ -1,5 +1,8 @@
 from llama_index.retrievers.bm25 import BM25Retriever
 
+from .bm25_retriever import LawBM25Retriever
+from .fusion import reciprocal_rank_fusion, weighted_score_fusion
+
 HF_RETRIEVER_SELECTION_DICT = {
     "bge-m3": "BAAI/bge-m3",
     "me5-large": "intfloat/multilingual-e5-large",
@@ -9,4 +12,10 @@ HF_RETRIEVER_SELECTION_DICT = {
 
 BM25_RETRIEVER_SELECTION_DICT = {
     "bm25": BM25Retriever,
+    "law-bm25": LawBM25Retriever,
+}
+
+FUSION_MODE_SELECTION_DICT = {
+    "rrf": reciprocal_rank_fusion,
+    "weighted": weighted_score_fusion,
 }
\ No newline at end of file
@@ -0,0 +1,54 @@
+from llama_index.core.callbacks.base import CallbackManager
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from typing import List, Mapping, Optional
+
+import numpy as np
+
+class DenseRetriever(BaseRetriever):
+    """Retrieve the top-k nodes of a DenseVectorIndex with a vectorized matrix-vector product."""
+
+    def __init__(
+        self,
+        index,
+        similarity_top_k: int = 10,
+        callback_manager: Optional[CallbackManager] = None,
+        verbose: bool = False,
+    ) -> None:
+        self._index = index
+        self._similarity_top_k = similarity_top_k
+        super().__init__(callback_manager=callback_manager, verbose=verbose)
+
+    @property
+    def similarity_top_k(self) -> int:
+        return self._similarity_top_k
+
+    @similarity_top_k.setter
+    def similarity_top_k(self, value: int) -> None:
+        self._similarity_top_k = value
+
+    @property
+    def docs(self) -> Mapping[str, TextNode]:
+        return self._index.docs
+
+    def _build_nodes(self, indices: np.ndarray, scores: np.ndarray) -> List[NodeWithScore]:
+        # only the retrieved rows are materialized as nodes
+        return [NodeWithScore(node=self._index.node(i), score=float(score)) for i, score in zip(indices.tolist(), scores.tolist())]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self._index.embed_model.get_agg_embedding_from_queries(query_bundle.embedding_strs)
+        indices, scores = self._index.search(np.asarray(query_bundle.embedding), self._similarity_top_k)
+        return self._build_nodes(indices[0], scores[0])
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        if query_bundle.embedding is None:
+            query_bundle.embedding = await self._index.embed_model.aget_agg_embedding_from_queries(query_bundle.embedding_strs)
+        indices, scores = self._index.search(np.asarray(query_bundle.embedding), self._similarity_top_k)
+        return self._build_nodes(indices[0], scores[0])
+
+    def retrieve_batch(self, query_embeddings: np.ndarray) -> List[List[NodeWithScore]]:
+        """Retrieve for several already-embedded queries, given as a (num_queries, dim) matrix, in one product."""
+        indices, scores = self._index.search(query_embeddings, self._similarity_top_k)
+        return [self._build_nodes(row_indices, row_scores) for row_indices, row_scores in zip(indices, scores)]
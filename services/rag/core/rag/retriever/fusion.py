@@ -0,0 +1,108 @@
+from llama_index.core.schema import NodeWithScore
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# metadata key of the fused score, kept out of the text embedded, reranked and sent to the LLM
+FUSION_SCORE_KEY = "fusion_score"
+
+def _flatten(result_lists: Sequence[List[NodeWithScore]]) -> Tuple[List[NodeWithScore], np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Give every distinct node a column and flatten the ranked lists into aligned (list, column, rank, score) arrays."""
+    columns: Dict[str, int] = {}
+    unique_nodes = []
+    list_ids, node_columns, ranks, scores = [], [], [], []
+    for list_id, results in enumerate(result_lists):
+        for rank, n in enumerate(results):
+            column = columns.get(n.node.node_id)
+            if column is None:
+                column = columns[n.node.node_id] = len(unique_nodes)
+                unique_nodes.append(n)
+            list_ids.append(list_id)
+            node_columns.append(column)
+            ranks.append(rank)
+            scores.append(n.score if n.score is not None else 0.0)
+    return (
+        unique_nodes,
+        np.asarray(list_ids, dtype=np.int64),
+        np.asarray(node_columns, dtype=np.int64),
+        np.asarray(ranks, dtype=np.float64),
+        np.asarray(scores, dtype=np.float64),
+    )
+
+def _top_nodes(unique_nodes: List[NodeWithScore], fused_scores: np.ndarray, top_n: Optional[int]) -> List[NodeWithScore]:
+    # stable sort keeps first-seen order between equal scores
+    order = np.argsort(-fused_scores, kind="stable")
+    if top_n is not None:
+        order = order[:top_n]
+    return [_with_fusion_score(unique_nodes[i], float(fused_scores[i])) for i in order.tolist()]
+
+def _with_fusion_score(node_with_score: NodeWithScore, fused_score: float) -> NodeWithScore:
+    # the node may be shared with the docstore of a retriever, the fused score goes on a copy
+    node = node_with_score.node.copy()
+    node.metadata = {**node.metadata, FUSION_SCORE_KEY: fused_score}
+    node.excluded_embed_metadata_keys = [*node.excluded_embed_metadata_keys, FUSION_SCORE_KEY]
+    node.excluded_llm_metadata_keys = [*node.excluded_llm_metadata_keys, FUSION_SCORE_KEY]
+    return NodeWithScore(node=node, score=node_with_score.score)
+
+def _list_weights(num_lists: int, weights: Optional[Sequence[float]]) -> np.ndarray:
+    if weights is None:
+        return np.ones(num_lists, dtype=np.float64)
+    assert len(weights) == num_lists, f"Expected {num_lists} weights, got {len(weights)}"
+    return np.asarray(weights, dtype=np.float64)
+
+def reciprocal_rank_fusion(
+    result_lists: Sequence[List[NodeWithScore]],
+    k: int = 60,
+    weights: Optional[Sequence[float]] = None,
+    top_n: Optional[int] = None,
+) -> List[NodeWithScore]:
+    """
+    Fuses ranked result lists with (weighted) reciprocal-rank fusion, sum of weight / (k + rank).
+
+    Parameters:
+    - result_lists: ranked results, one list per (query, retriever)
+    - k: rank smoothing constant, larger values flatten the contribution of top ranks
+    - weights: optional weight per result list
+    - top_n: number of fused nodes to keep, None keeps all
+
+    Returns:
+    - distinct nodes ordered by their fused score, best first. Each keeps the score of the first list it appears in,
+      e.g. its cosine similarity when the dense results come first, and the fused score in metadata[FUSION_SCORE_KEY]
+    """
+    unique_nodes, list_ids, node_columns, ranks, _ = _flatten(result_lists)
+    if not unique_nodes:
+        return []
+    contributions = _list_weights(len(result_lists), weights)[list_ids] / (k + ranks + 1.0)
+    fused_scores = np.bincount(node_columns, weights=contributions, minlength=len(unique_nodes))
+    return _top_nodes(unique_nodes, fused_scores, top_n)
+
+def weighted_score_fusion(
+    result_lists: Sequence[List[NodeWithScore]],
+    weights: Optional[Sequence[float]] = None,
+    top_n: Optional[int] = None,
+) -> List[NodeWithScore]:
+    """
+    Fuses result lists by a weighted sum of their scores, min-max normalized per list so cosine and BM25 scores are comparable.
+
+    Parameters:
+    - result_lists: scored results, one list per (query, retriever)
+    - weights: optional weight per result list
+    - top_n: number of fused nodes to keep, None keeps all
+
+    Returns:
+    - distinct nodes ordered by their fused score, best first, with the same scores as reciprocal_rank_fusion
+    """
+    unique_nodes, list_ids, node_columns, _, scores = _flatten(result_lists)
+    if not unique_nodes:
+        return []
+    num_lists = len(result_lists)
+    list_min = np.full(num_lists, np.inf)
+    list_max = np.full(num_lists, -np.inf)
+    np.minimum.at(list_min, list_ids, scores)
+    np.maximum.at(list_max, list_ids, scores)
+    spread = list_max[list_ids] - list_min[list_ids]
+    normalized = np.divide(scores - list_min[list_ids], spread, out=np.ones_like(scores), where=spread > 0)
+    contributions = _list_weights(num_lists, weights)[list_ids] * normalized
+    fused_scores = np.bincount(node_columns, weights=contributions, minlength=len(unique_nodes))
+    return _top_nodes(unique_nodes, fused_scores, top_n)
@@ -1,17 +1,22 @@
 from llama_index.core.retrievers import BaseRetriever
-from llama_index.core.schema import QueryBundle, NodeWithScore
-from llama_index.core.response.notebook_utils import (display_source_node,
-                                                      display_response)
+from llama_index.core.schema import BaseNode, QueryBundle, NodeWithScore
 from llama_index.core.llms.llm import LLM
 from llama_index.core.postprocessor.types import BaseNodePostprocessor
 from llama_index.retrievers.bm25 import BM25Retriever
 
-from typing import List, Union
+from typing import Dict, List, Optional, Union
+import asyncio
 import logging
 
 from .hybrid_retriever import (
     HybridRetriever
 )
+from .utils import (
+    get_retriever_docs
+)
+from .const import (
+    FUSION_MODE_SELECTION_DICT
+)
 
 from ..prompting import (
     generate_queries
@@ -33,19 +38,39 @@ class FusionRetriever(BaseRetriever):
         top_k: int = 10,
         top_n: int = 10,
         num_queries: int = 1,
+        fusion_mode: str = "rrf",
+        weights: Optional[List[float]] = None,
+        timeout: Optional[float] = None,
         verbose: bool = False,
     ) -> None:
-        """Initialize FusionRetriever."""
+        """
+        Initialize FusionRetriever.
+
+        Parameters:
+        - top_k: number of nodes asked from each retriever, and number of fused nodes passed to the reranker
+        - top_n: number of nodes kept by the reranker
+        - fusion_mode: "rrf" for reciprocal-rank fusion or "weighted" for normalized score fusion
+        - weights: optional weight per retriever, in the order of `retrievers` followed by `bm25_retriever`
+        - timeout: seconds to wait for each retriever
+        """
         super().__init__()
+        assert fusion_mode in FUSION_MODE_SELECTION_DICT, f"fusion_mode must be one of {list(FUSION_MODE_SELECTION_DICT)}"
         self.llm = llm
         self._top_k = top_k
         self._top_n = top_n
+        self.fusion_mode = fusion_mode
+        self.weights = weights
+        self.timeout = timeout
         self.bm25_retriever = bm25_retriever
         self.reference_nodes = reference_nodes
         self._initialize_retrievers(retrievers)
         self.reranker = reranker
         self._num_queries = num_queries
         self.verbose = verbose
+
+    @property
+    def docs(self) -> Dict[str, BaseNode]:
+        return self.reference_nodes
         
     @property
     def top_k(self) -> int:
@@ -55,7 +80,7 @@ class FusionRetriever(BaseRetriever):
     def top_k(self, value: int) -> None:
         if isinstance(value, int) and value >= 0:
             self._top_k = value
-            self.retrievers = HybridRetriever(self.retrievers.retrievers, value)
+            self.retrievers = HybridRetriever(self.retrievers.retrievers, value, timeout=self.retrievers.timeout)
         else:
             raise ValueError("top_k must be a non-negative integer")
 
@@ -92,7 +117,7 @@ class FusionRetriever(BaseRetriever):
 
     def _initialize_single_retriever(self, retriever: BaseRetriever) -> None:
         """Initialize with a single retriever."""
-        self.reference_nodes = self.reference_nodes if self.reference_nodes else retriever._index.docstore.docs
+        self.reference_nodes = self.reference_nodes if self.reference_nodes else get_retriever_docs(retriever)
         retrievers_list = [retriever]
         self._initialize_hybrid_retriever(retrievers_list)
 
@@ -108,14 +133,14 @@ class FusionRetriever(BaseRetriever):
 
     def _initialize_hybrid_retriever(self, retrievers_list: List[BaseRetriever]) -> None:
         """Initialize hybrid retriever."""
-        self.retrievers = HybridRetriever(retrievers_list, self._top_k)
+        self.retrievers = HybridRetriever(retrievers_list, self._top_k, timeout=self.timeout)
 
     def _check_reference_nodes(self, retriever: BaseRetriever) -> None:
         """Check default nodes."""
         if self.reference_nodes:
-            assert self.reference_nodes == retriever._index.docstore.docs, "Default nodes from all retrievers must be the same"
+            assert self.reference_nodes == get_retriever_docs(retriever), "Default nodes from all retrievers must be the same"
         else:
-            self.reference_nodes = retriever._index.docstore.docs
+            self.reference_nodes = get_retriever_docs(retriever)
         
     def update_config(self, **kwargs) -> None:
         """Update configuration of the FusionRetriever with a warning for invalid attributes."""
@@ -125,7 +150,7 @@ class FusionRetriever(BaseRetriever):
                     self._initialize_retrievers(value)
                 elif key == "top_k":
                     self._top_k = value
-                    self.retrievers = HybridRetriever(self.retrievers.retrievers, value)
+                    self.retrievers = HybridRetriever(self.retrievers.retrievers, value, timeout=self.retrievers.timeout)
                 elif key == "reranker":
                     self.reranker = value
                     if self.reranker:
@@ -139,64 +164,63 @@ class FusionRetriever(BaseRetriever):
             else:
                 logging.warning(f"{key} is not a valid configuration attribute for FusionRetriever and will be ignored.")
 
-    def _retrieve(self, query_str: str) -> List[NodeWithScore]:
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
         """Retrieve."""
         assert len(self.retrievers) > 0, "FusionRetriever must have at least one retriever"
-        queries = generate_queries(self.llm, query_str, num_queries=self._num_queries)
+        queries = generate_queries(self.llm, query_bundle.query_str, num_queries=self._num_queries)
         results = self.run_queries(queries, self.retrievers)
         
         if self.reranker:
-            final_results = self.reranker.postprocess_nodes(results, query_str)
+            final_results = self.reranker.postprocess_nodes(results, query_bundle=query_bundle)
         else:
             final_results = results
         
         if self.verbose:
+            from llama_index.core.response.notebook_utils import display_source_node
             for node in final_results:
                 display_source_node(node)
 
         return final_results
     
-    async def _aretrieve(self, query_str: str) -> List[NodeWithScore]:
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
         """Retrieve."""
-        assert len(self.retrievers) < 1, "FusionRetriever must have at least one retriever"
-        queries = generate_queries(self.llm, query_str, num_queries=self._num_queries)
+        assert len(self.retrievers) > 0, "FusionRetriever must have at least one retriever"
+        # query variants need an LLM call, the query alone is used as is
+        if self._num_queries > 1:
+            queries = await asyncio.to_thread(generate_queries, self.llm, query_bundle.query_str, num_queries=self._num_queries)
+        else:
+            queries = [query_bundle.query_str]
         results = await self.arun_queries(queries, self.retrievers)
         
-        if self.reranker:
-            final_results = self.reranker.postprocess_nodes(results, query_str)
+        if self.reranker and hasattr(self.reranker, "apostprocess_nodes"):
+            final_results = await self.reranker.apostprocess_nodes(results, query_bundle=query_bundle)
+        elif self.reranker:
+            final_results = await asyncio.to_thread(self.reranker.postprocess_nodes, results, query_bundle=query_bundle)
         else:
             final_results = results
         
         if self.verbose:
+            from llama_index.core.response.notebook_utils import display_source_node
             for node in final_results:
                 display_source_node(node)
 
         return final_results
+
+    def fuse(self, results: List[List[Optional[List[NodeWithScore]]]]) -> List[NodeWithScore]:
+        """Fuse results[q][r] of every query and retriever into the top_k candidates, dropping retrievers that timed out."""
+        weights = self.weights or [1.0] * len(self.retrievers)
+        result_lists, list_weights = [], []
+        for query_results in results:
+            for nodes, weight in zip(query_results, weights):
+                if nodes is not None:
+                    result_lists.append(nodes)
+                    list_weights.append(weight)
+        return FUSION_MODE_SELECTION_DICT[self.fusion_mode](result_lists, weights=list_weights, top_n=self._top_k)
     
     def run_queries(self, queries: list, hybrid_retriever: HybridRetriever) -> List[NodeWithScore]:
-        """Run queries using hybrid retriever and rerank the results."""
-        retrieved_results = [hybrid_retriever.retrieve(query) for query in queries]
-        
-        all_nodes = []
-        node_ids = set()
-
-        for nodes in retrieved_results:
-            for n in nodes:
-                if n.node.node_id not in node_ids:
-                    all_nodes.append(n)
-                    node_ids.add(n.node.node_id)
-        return all_nodes
+        """Run all queries on all retrievers concurrently and fuse the results."""
+        return self.fuse(hybrid_retriever.retrieve_all(queries))
     
     async def arun_queries(self, queries: list, hybrid_retriever: HybridRetriever) -> List[NodeWithScore]:
-        """Run queries using hybrid retriever and rerank the results."""
-        retrieved_results = [await hybrid_retriever.aretrieve(query) for query in queries]
-        
-        all_nodes = []
-        node_ids = set()
-
-        for nodes in retrieved_results:
-            for n in nodes:
-                if n.node.node_id not in node_ids:
-                    all_nodes.append(n)
-                    node_ids.add(n.node.node_id)
-        return retrieved_results
\ No newline at end of file
+        """Run all queries on all retrievers concurrently and fuse the results."""
+        return self.fuse(await hybrid_retriever.aretrieve_all(queries))
@@ -1,44 +1,133 @@
 from llama_index.core.retrievers import BaseRetriever
-from typing import List
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle, QueryType
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+
+from .utils import get_retriever_docs
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Shared pool for sync fan-out, so a timed-out retriever never blocks the caller on pool shutdown."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("RETRIEVER_MAX_WORKERS", "8")),
+                    thread_name_prefix="hybrid-retriever",
+                )
+    return _executor
 
 class HybridRetriever(BaseRetriever):
     """get all retrievers and return all retrieved results"""
-    def __init__(self, retrievers: List[BaseRetriever] = [], top_k: int = 10) -> None:
+    def __init__(self, retrievers: List[BaseRetriever] = [], top_k: int = 10, timeout: Optional[float] = None) -> None:
+        """
+        Parameters:
+        - retrievers: retrievers queried concurrently, results are merged in this order
+        - top_k: number of nodes asked from each retriever
+        - timeout: seconds to wait for each retriever, results of slower retrievers are dropped; None waits forever.
+          A retriever that fails is skipped the same way, unless every retriever failed
+        """
         self.retrievers = retrievers
         self.top_k = top_k
+        self.timeout = timeout
         super().__init__()
-        
+
     def __len__(self) -> int:
         return len(self.retrievers)
 
-    def _retrieve(self, query, **kwargs) -> List:
+    @property
+    def docs(self) -> Dict[str, BaseNode]:
+        return get_retriever_docs(self.retrievers[0])
+
+    @staticmethod
+    def _merge(results: List[Optional[List[NodeWithScore]]]) -> List[NodeWithScore]:
         all_nodes = []
         node_ids = set()
 
-        # Synchronously gather results from all retrievers
-        for retriever in self.retrievers:
-            retriever._similarity_top_k = self.top_k
-            nodes = retriever.retrieve(query, **kwargs)
-
-            # Combine results while avoiding duplicates
-            for n in nodes:
+        # Combine results while avoiding duplicates, skipping retrievers that timed out or failed
+        for nodes in results:
+            for n in nodes or []:
                 if n.node.node_id not in node_ids:
                     all_nodes.append(n)
                     node_ids.add(n.node.node_id)
         return all_nodes
-    
-    async def _aretrieve(self, query, **kwargs) -> List:
-        all_nodes = []
-        node_ids = set()
 
-        # Synchronously gather results from all retrievers
+    def retrieve_all(self, queries: List[QueryType], **kwargs) -> List[List[Optional[List[NodeWithScore]]]]:
+        """
+        Runs every (query, retriever) pair concurrently under one per-retriever timeout.
+
+        Returns:
+        - results[q][r], the nodes of retriever r for query q, or None if it timed out or failed
+        """
         for retriever in self.retrievers:
             retriever._similarity_top_k = self.top_k
-            nodes = await retriever.aretrieve(query, **kwargs)
+        pairs = [(query, retriever) for query in queries for retriever in self.retrievers]
 
-            # Combine results while avoiding duplicates
-            for n in nodes:
-                if n.node.node_id not in node_ids:
-                    all_nodes.append(n)
-                    node_ids.add(n.node.node_id)
-        return all_nodes
\ No newline at end of file
+        # All pairs start together, so one deadline is a per-retriever timeout
+        executor = _get_executor()
+        futures = [
+            executor.submit(contextvars.copy_context().run, retriever.retrieve, query, **kwargs)
+            for query, retriever in pairs
+        ]
+        wait(futures, timeout=self.timeout)
+
+        results, errors = [], []
+        for (_, retriever), future in zip(pairs, futures):
+            if not future.done():
+                future.cancel()
+                logging.warning(f"{type(retriever).__name__} timed out after {self.timeout}s, its results are skipped.")
+                results.append(None)
+            elif future.exception() is not None:
+                self._log_failure(retriever, future.exception())
+                errors.append(future.exception())
+                results.append(None)
+            else:
+                results.append(future.result())
+        return self._by_query(results, errors)
+
+    async def aretrieve_all(self, queries: List[QueryType], **kwargs) -> List[List[Optional[List[NodeWithScore]]]]:
+        """Async version of retrieve_all, gathering every (query, retriever) pair on the event loop."""
+        for retriever in self.retrievers:
+            retriever._similarity_top_k = self.top_k
+
+        async def _aretrieve_one(query: QueryType, retriever: BaseRetriever) -> Optional[List[NodeWithScore]]:
+            try:
+                return await asyncio.wait_for(retriever.aretrieve(query, **kwargs), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                logging.warning(f"{type(retriever).__name__} timed out after {self.timeout}s, its results are skipped.")
+                return None
+            except Exception as e:
+                self._log_failure(retriever, e)
+                errors.append(e)
+                return None
+
+        errors: List[BaseException] = []
+        results = await asyncio.gather(*[_aretrieve_one(query, retriever) for query in queries for retriever in self.retrievers])
+        return self._by_query(results, errors)
+
+    @staticmethod
+    def _log_failure(retriever: BaseRetriever, error: BaseException) -> None:
+        logging.error(f"{type(retriever).__name__} failed, its results are skipped.", exc_info=error)
+
+    def _by_query(
+        self, results: List[Optional[List[NodeWithScore]]], errors: List[BaseException]
+    ) -> List[List[Optional[List[NodeWithScore]]]]:
+        # partial results are only worth returning when at least one retriever answered
+        if errors and len(errors) == len(results):
+            raise errors[0]
+        num_retrievers = len(self.retrievers)
+        return [results[i:i + num_retrievers] for i in range(0, len(results), num_retrievers)]
+
+    def _retrieve(self, query_bundle: QueryBundle, **kwargs) -> List:
+        return self._merge(self.retrieve_all([query_bundle], **kwargs)[0])
+
+    async def _aretrieve(self, query_bundle: QueryBundle, **kwargs) -> List:
+        return self._merge((await self.aretrieve_all([query_bundle], **kwargs))[0])
@@ -1,5 +1,8 @@
 from typing import List, Callable, Dict, Any
 
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import BaseNode
+
 def visualize_retrieved_nodes(nodes: List[Callable]) -> List[Dict[str, Any]]:
     """
     Visualizes the retrieved nodes by creating a DataFrame from the given nodes.
@@ -21,4 +24,18 @@ def visualize_retrieved_nodes(nodes: List[Callable]) -> List[Dict[str, Any]]:
         result_dict = {"score": node.score, "text": node_text, "law_name": law_name, "url": node_url, "law_code": law_code}
         result_nodes.append(result_dict)
 
-    return result_nodes
\ No newline at end of file
+    return result_nodes
+
+def get_retriever_docs(retriever: BaseRetriever) -> Dict[str, BaseNode]:
+    """
+    Returns the nodes known to a retriever, keyed by node id.
+
+    Parameters:
+    - retriever: a DenseRetriever or a llama_index retriever backed by an index docstore
+
+    Returns:
+    - dict of node id to node
+    """
+    if hasattr(retriever, "docs"):
+        return retriever.docs
+    return retriever._index.docstore.docs
\ No newline at end of file
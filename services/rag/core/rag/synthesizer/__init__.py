@@ -1,3 +1,7 @@
 from .reference_synthesizer import (
     LawReferenceSynthesizer,
+)
+
+from .context_packer import (
+    ContextPacker,
 )
\ No newline at end of file
@@ -0,0 +1,85 @@
+import re
+from typing import Callable, List, Optional, Set, Tuple
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+def _normalize(text: str) -> str:
+    return WHITESPACE_PATTERN.sub(" ", text).strip().lower()
+
+def _shingles(text: str, size: int) -> Set[str]:
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+class ContextPacker:
+    """
+    Selects the sections that go into the prompt, most relevant first, under a token budget.
+
+    Retrieved sections are ranked by their score and come before the sections they cite, which keep the rank
+    of the first section citing them. Exact duplicates (up to whitespace and case) and near duplicates, whose
+    character shingles overlap by at least `near_duplicate_threshold`, are dropped. A section that does not
+    fit in the remaining budget is skipped, so a shorter, less relevant one can still be packed.
+    """
+
+    def __init__(
+        self,
+        count_tokens: Callable[[List[str]], List[int]],
+        token_budget: Optional[int] = None,
+        near_duplicate_threshold: float = 0.9,
+        shingle_size: int = 5,
+    ) -> None:
+        self._count_tokens = count_tokens
+        self.token_budget = token_budget
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.shingle_size = shingle_size
+
+    def count_tokens(self, text: str) -> int:
+        return self._count_tokens([text])[0]
+
+    def pack(
+        self,
+        retrieved: List[Tuple[str, Optional[float]]],
+        references: List[List[str]],
+    ) -> Tuple[List[str], List[str], int]:
+        """
+        Packs retrieved sections and their references.
+
+        Parameters:
+        - retrieved: (text, score) of each retrieved section
+        - references: texts cited by each retrieved section, aligned with retrieved
+
+        Returns:
+        - packed retrieved texts, packed reference texts, and their total token count
+        """
+        order = sorted(
+            range(len(retrieved)),
+            key=lambda i: retrieved[i][1] if retrieved[i][1] is not None else float("-inf"),
+            reverse=True,
+        )
+        candidates = [(retrieved[i][0], False) for i in order]
+        candidates += [(text, True) for i in order if i < len(references) for text in references[i]]
+        token_counts = self._count_tokens([text for text, _ in candidates])
+
+        packed_retrieved: List[str] = []
+        packed_references: List[str] = []
+        seen_texts: Set[str] = set()
+        seen_shingles: List[Set[str]] = []
+        num_tokens = 0
+        for (text, is_reference), text_tokens in zip(candidates, token_counts):
+            normalized = _normalize(text)
+            if not normalized or normalized in seen_texts:
+                continue
+            shingles = _shingles(normalized, self.shingle_size)
+            if any(self._similarity(shingles, other) >= self.near_duplicate_threshold for other in seen_shingles):
+                continue
+            if self.token_budget is not None and num_tokens + text_tokens > self.token_budget:
+                continue
+            seen_texts.add(normalized)
+            seen_shingles.append(shingles)
+            num_tokens += text_tokens
+            (packed_references if is_reference else packed_retrieved).append(text)
+        return packed_retrieved, packed_references, num_tokens
+
+    @staticmethod
+    def _similarity(a: Set[str], b: Set[str]) -> float:
+        return len(a & b) / len(a | b)
@@ -21,10 +21,35 @@ from llama_index.core.base.response.schema import (
     StreamingResponse,
 )
 
-from typing import Optional, Callable, List, Any, Generator, AsyncGenerator, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Callable, List, Any, Generator, AsyncGenerator, Dict, Tuple
+import asyncio
+import contextvars
+import os
+import threading
 
 from ..prompting.prompt_manager import init_prompts
-from ..prompting.postprocess import clean_special_tokens
+from ..llm.completion import init_system_prompt
+from ..llm.tokenizer import estimate_token_counts
+from ..index.reference_graph import ReferenceGraph
+from ..retriever.fusion import FUSION_SCORE_KEY
+from .context_packer import ContextPacker
+from ..prompting.postprocess import clean_special_tokens, stream_clean_special_tokens, astream_clean_special_tokens
+
+_map_executor: Optional[ThreadPoolExecutor] = None
+_map_executor_lock = threading.Lock()
+
+def _get_map_executor() -> ThreadPoolExecutor:
+    """Pool for the concurrent per-section LLM calls of sync map_reduce synthesis, shared by every request."""
+    global _map_executor
+    if _map_executor is None:
+        with _map_executor_lock:
+            if _map_executor is None:
+                _map_executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("MAP_REDUCE_MAX_WORKERS", "8")),
+                    thread_name_prefix="map_reduce",
+                )
+    return _map_executor
 
 def empty_response_generator() -> Generator[str, None, None]:
     yield "Empty Response"
@@ -52,6 +77,12 @@ class LawReferenceSynthesizer(BaseSynthesizer):
         service_context: Optional[ServiceContext] = None,
         response_mode: str = "default",
         prompt_language: str = "en",
+        llm_kwargs: Optional[Dict[str, Any]] = None,
+        reference_graph: Optional[ReferenceGraph] = None,
+        reference_hops: int = 1,
+        max_references: Optional[int] = None,
+        context_packer: Optional[ContextPacker] = None,
+        map_concurrency: int = 8,
     ) -> None:
         if service_context is not None:
             prompt_helper = service_context.prompt_helper
@@ -67,10 +98,20 @@ class LawReferenceSynthesizer(BaseSynthesizer):
         self._refine_template = refine_template or prompt_template["REFINE_TEMPLATE"]
         self._refine_reference_template = prompt_template["REFINE_REFERENCE_TEMPLATE"]
         self._default_reference_template = prompt_template["DEFAULT_REFERENCE_TEMPLATE"]
+        self._combine_template = prompt_template["COMBINE_TEMPLATE"]
         self._verbose = verbose
         self._structured_answer_filtering = structured_answer_filtering
         self._output_cls = output_cls
         self._response_mode = response_mode
+        # the LLM is shared between requests, so the language and sampling parameters of this one go with every call
+        self._system_prompt = init_system_prompt(prompt_language)
+        self._llm_kwargs = llm_kwargs or {}
+        self._reference_graph = reference_graph
+        self._reference_hops = reference_hops
+        self._max_references = max_references
+        # without a model tokenizer and budget, sections are still ranked and deduplicated
+        self._context_packer = context_packer or ContextPacker(estimate_token_counts)
+        self._map_concurrency = max(1, map_concurrency)
 
         if self._streaming and self._structured_answer_filtering:
             raise ValueError(
@@ -92,77 +133,288 @@ class LawReferenceSynthesizer(BaseSynthesizer):
 
         if len(nodes) == 0:
             if self._streaming:
-                empty_response = StreamingResponse(
-                    response_gen=empty_response_generator()
-                )
-                return empty_response
+                return empty_response_generator(), "", [], None
             else:
-                empty_response = Response("Empty Response")
-                return empty_response
+                return "Empty Response", "", [], None
 
         if isinstance(query, QueryBundle):
             query = query.query_str
             
-        retrieved_nodes_content = [node.get_content() for node in nodes]
-        retrieved_reference_id = [node.metadata["reference_nodes"] for node in nodes]
-        reference_nodes_content = [[reference_nodes_dict[ref_id].sectionContent for ref_id in reference] for reference in retrieved_reference_id]
-        response_str, format_input = self.get_response(
+        retrieved_nodes_content, reference_nodes_content = self._get_nodes_content(nodes, reference_nodes_dict)
+        response_str, format_input, prompt_tokens = self.get_response(
+            query_str=query,
+            retrieved_nodes_content = retrieved_nodes_content,
+            reference_nodes_content = reference_nodes_content,
+            retrieved_scores = self._get_nodes_scores(nodes),
+            **response_kwargs,
+        )
+
+        return response_str, format_input, reference_nodes_content, prompt_tokens
+
+    async def asynthesize(
+        self,
+        query: QueryType,
+        nodes: List[NodeWithScore],
+        reference_nodes_dict: Dict[str, TextNode],
+        **response_kwargs: Any,
+    ) -> RESPONSE_TYPE:
+
+        if len(nodes) == 0:
+            if self._streaming:
+                return empty_response_agenerator(), "", [], None
+            else:
+                return "Empty Response", "", [], None
+
+        if isinstance(query, QueryBundle):
+            query = query.query_str
+
+        retrieved_nodes_content, reference_nodes_content = self._get_nodes_content(nodes, reference_nodes_dict)
+        response_str, format_input, prompt_tokens = await self.aget_response(
             query_str=query,
             retrieved_nodes_content = retrieved_nodes_content,
             reference_nodes_content = reference_nodes_content,
+            retrieved_scores = self._get_nodes_scores(nodes),
             **response_kwargs,
         )
 
-        return response_str, format_input, reference_nodes_content
+        return response_str, format_input, reference_nodes_content, prompt_tokens
+
+    @staticmethod
+    def _get_nodes_scores(nodes: List[NodeWithScore]) -> List[Optional[float]]:
+        """
+        Returns:
+        - the score the packer ranks each node by: its reranker or similarity score, which orders the nodes as they
+          arrive. A fused node that was not reranked keeps the score of its first retriever, and those do not compare
+          across retrievers, so it is ranked by its fused score instead.
+        """
+        scores = [node.score for node in nodes]
+        is_ordered = all(
+            a is not None and b is not None and a >= b for a, b in zip(scores, scores[1:])
+        )
+        fused_scores = [node.metadata.get(FUSION_SCORE_KEY) for node in nodes]
+        if not is_ordered and all(score is not None for score in fused_scores):
+            return fused_scores
+        return scores
+
+    def _get_nodes_content(self, nodes: List[NodeWithScore], reference_nodes_dict: Dict[str, TextNode]):
+        retrieved_nodes_content = [node.get_content() for node in nodes]
+        if self._reference_graph is not None:
+            retrieved_reference_id = self._reference_graph.expand(
+                [node.node.node_id for node in nodes],
+                max_hops=self._reference_hops,
+                max_references=self._max_references,
+            )
+        else:
+            retrieved_reference_id = [node.metadata.get("reference_nodes", []) for node in nodes]
+        reference_nodes_content = [
+            [reference_nodes_dict[ref_id].get_content() for ref_id in reference if ref_id in reference_nodes_dict]
+            for reference in retrieved_reference_id
+        ]
+        return retrieved_nodes_content, reference_nodes_content
+
+    def _refine_prompt(self, query_str: str, retrieve_node: str, reference_node: List[str], prev_response: Optional[str]) -> str:
+        if reference_node:
+            reference_augment = self._refine_reference_template.format(context_str=retrieve_node, reference_str='\n\n'.join(reference_node))
+        else:
+            reference_augment = self._refine_reference_template.format(context_str=retrieve_node, reference_str="no reference")
+
+        if prev_response is None:
+            # if this is the first chunk, and text chunk already
+            # is an answer, then return it
+            return self._reference_qa_template.format(query_str = query_str, context_str = reference_augment)
+        # refine response if possible
+        return self._refine_template.format(query_str = query_str, context_str = reference_augment, existing_answer=prev_response)
+
+    def _default_prompt(
+        self,
+        query_str: str,
+        retrieved_nodes_content: List[str],
+        reference_nodes_content: List[List[str]],
+        retrieved_scores: Optional[List[Optional[float]]] = None,
+    ) -> Tuple[str, int]:
+        """
+        Returns:
+        - the prompt, and its token count: the packer already counted the sections, so only the rest of the
+          prompt is tokenized, which is within a few tokens of counting the whole prompt
+        """
+        retrieved_scores = retrieved_scores or [None] * len(retrieved_nodes_content)
+        packed_retrieved, packed_references, section_tokens = self._context_packer.pack(
+            list(zip(retrieved_nodes_content, retrieved_scores)), reference_nodes_content
+        )
+        scaffold = self._format_default_prompt(query_str, [], [])
+        prompt_tokens = section_tokens + self._context_packer.count_tokens(scaffold)
+        return self._format_default_prompt(query_str, packed_retrieved, packed_references), prompt_tokens
+
+    def _format_default_prompt(self, query_str: str, packed_retrieved: List[str], packed_references: List[str]) -> str:
+        retrieve_augment = '\n\n'.join(packed_retrieved)
+        reference_augment = '\n\n'.join(packed_references)
+        context = self._default_reference_template.format(context_str=retrieve_augment, reference_str=reference_augment)
+        format_input = self._reference_qa_template.format(query_str = query_str, context_str = context)
+        return self._llm.completion_to_prompt(format_input, system_prompt=self._system_prompt)
+
+    def _map_prompts(self, query_str: str, retrieved_nodes_content: List[str], reference_nodes_content: List[List[str]]) -> List[str]:
+        return [
+            self._llm.completion_to_prompt(
+                self._refine_prompt(query_str, retrieve_node, reference_node, None), system_prompt=self._system_prompt
+            )
+            for reference_node, retrieve_node in zip(reference_nodes_content, retrieved_nodes_content)
+        ]
+
+    def _combine_prompt(self, query_str: str, answers: List[str]) -> str:
+        context = '\n\n'.join(f"{i + 1}. {answer.strip()}" for i, answer in enumerate(answers) if answer.strip())
+        format_input = self._combine_template.format(query_str=query_str, context_str=context)
+        return self._llm.completion_to_prompt(format_input, system_prompt=self._system_prompt)
+
+    def _map(self, prompts: List[str]) -> List[str]:
+        """Answer every per-section prompt concurrently, in the order of the prompts, with at most map_concurrency calls in flight per request."""
+        def answer(prompt: str) -> str:
+            return self._clean_response(self._llm.complete(prompt, **self._llm_kwargs), prompt)
+
+        executor = _get_map_executor()
+        # acquired before submitting, so calls waiting for a slot hold no thread of the shared pool
+        semaphore = threading.Semaphore(self._map_concurrency)
+        futures = []
+        for prompt in prompts:
+            semaphore.acquire()
+            future = executor.submit(contextvars.copy_context().run, answer, prompt)
+            future.add_done_callback(lambda _: semaphore.release())
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    async def _amap(self, prompts: List[str]) -> List[str]:
+        """Async version of _map, with at most map_concurrency calls in flight per request."""
+        semaphore = asyncio.Semaphore(self._map_concurrency)
+
+        async def answer(prompt: str) -> str:
+            async with semaphore:
+                return self._clean_response(await self._llm.acomplete(prompt, **self._llm_kwargs), prompt)
+
+        return await asyncio.gather(*(answer(prompt) for prompt in prompts))
+
+    @staticmethod
+    def _clean_response(response: Any, format_input: str) -> str:
+        if not isinstance(response, str):
+            response = response.text
+        assert isinstance(response, str), f"Response must be a string, got {type(response)}"
+        if format_input in response:
+            response = response.replace(format_input, "")
+        return clean_special_tokens(response)
     
+    def _get_response_mode(self, retrieved_nodes_content: List[str]) -> str:
+        response_mode = self._response_mode.lower()
+        # a single section has nothing to combine, answering it directly saves the reduce call
+        if response_mode == "map_reduce" and len(retrieved_nodes_content) <= 1:
+            return "default"
+        return response_mode
+
     def get_response(
         self,
         query_str: str,
         retrieved_nodes_content: List[str],
         reference_nodes_content: List[List[str]],
         prev_response: Optional[str] = None,
+        retrieved_scores: Optional[List[Optional[float]]] = None,
         **response_kwargs: Any,
     ) -> str:
-        """Give response over chunks."""
+        """
+        Give response over chunks.
+
+        Returns:
+        - the response, or a generator of response tokens when streaming, the prompt sent to the LLM, and its token
+          count when the context packer built it (default mode), None otherwise
+        """
         response: Optional[str] = None
-        
-        if self._response_mode.lower() == "refine":
+        prompt_tokens: Optional[int] = None
+        response_mode = self._get_response_mode(retrieved_nodes_content)
+
+        if response_mode == "refine":
             for reference_node, retrieve_node in zip(reference_nodes_content, retrieved_nodes_content):
-                if reference_node:
-                    reference_augment = self._refine_reference_template.format(context_str=retrieve_node, reference_str='\n\n'.join(reference_node))
-                else:
-                    reference_augment = self._refine_reference_template.format(context_str=retrieve_node, reference_str="no reference")
-                    
-                if prev_response is None:
-                    # if this is the first chunk, and text chunk already
-                    # is an answer, then return it
-                    format_input = self._reference_qa_template.format(query_str = query_str, context_str = "\n".join(reference_augment))
-                    response = self._llm.complete(format_input).text
-                else:
-                    # refine response if possible
-                    format_input = self._refine_template.format(query_str = query_str, context_str = "\n".join(reference_augment), existing_answer=prev_response)
-                    response = self._llm.complete(format_input).text
+                format_input = self._refine_prompt(query_str, retrieve_node, reference_node, prev_response)
+                response = self._llm.complete(format_input, **self._llm_kwargs).text
                 prev_response = response
-        
-        elif self._response_mode.lower() == "default":
-            reference_nodes_content = sorted(set([item for sublist in reference_nodes_content for item in sublist]))
-            retrieve_augment = '\n\n'.join(retrieved_nodes_content)
-            reference_augment = '\n\n'.join(reference_nodes_content)
-            context = self._default_reference_template.format(context_str=retrieve_augment, reference_str=reference_augment)
-            format_input = self._reference_qa_template.format(query_str = query_str, context_str = context)
-            format_input = self._llm.completion_to_prompt(format_input)
-            response = self._llm.complete(format_input)
-            if not isinstance(response, str):
-                response = response.text
-            assert isinstance(response, str), f"Response must be a string, got {type(response)}"
-            if format_input in response:
-                response = response.replace(format_input, "")
-            response = clean_special_tokens(response)
+
+        elif response_mode == "map_reduce":
+            answers = self._map(self._map_prompts(query_str, retrieved_nodes_content, reference_nodes_content))
+            format_input = self._combine_prompt(query_str, answers)
+            if self._streaming:
+                return self._stream_response(format_input), format_input, prompt_tokens
+            response = self._clean_response(self._llm.complete(format_input, **self._llm_kwargs), format_input)
+
+        elif response_mode == "default":
+            format_input, prompt_tokens = self._default_prompt(query_str, retrieved_nodes_content, reference_nodes_content, retrieved_scores)
+            if self._streaming:
+                return self._stream_response(format_input), format_input, prompt_tokens
+            response = self._clean_response(self._llm.complete(format_input, **self._llm_kwargs), format_input)
         else:
-            raise ValueError(f"Unknown synthesize mode: {self._synthesize_mode}")
+            raise ValueError(f"Unknown synthesize mode: {self._response_mode}")
             
         assert isinstance(response, str), f"Response must be a string, got {type(response)}"
-        return response, format_input
+        if self._streaming:
+            # refine only streams its final answer, as a single token
+            return iter([response]), format_input, prompt_tokens
+        return response, format_input, prompt_tokens
+
+    def _stream_response(self, format_input: str) -> Generator[str, None, None]:
+        """Forward completion deltas from the LLM as they arrive, without special tokens."""
+        deltas = (completion.delta for completion in self._llm.stream_complete(format_input, **self._llm_kwargs) if completion.delta)
+        yield from stream_clean_special_tokens(deltas)
+
+    async def aget_response(
+        self,
+        query_str: str,
+        retrieved_nodes_content: List[str],
+        reference_nodes_content: List[List[str]],
+        prev_response: Optional[str] = None,
+        retrieved_scores: Optional[List[Optional[float]]] = None,
+        **response_kwargs: Any,
+    ) -> str:
+        """Async version of get_response, awaiting the LLM instead of blocking on it."""
+        response: Optional[str] = None
+        prompt_tokens: Optional[int] = None
+        response_mode = self._get_response_mode(retrieved_nodes_content)
+
+        if response_mode == "refine":
+            for reference_node, retrieve_node in zip(reference_nodes_content, retrieved_nodes_content):
+                format_input = self._refine_prompt(query_str, retrieve_node, reference_node, prev_response)
+                response = (await self._llm.acomplete(format_input, **self._llm_kwargs)).text
+                prev_response = response
+
+        elif response_mode == "map_reduce":
+            answers = await self._amap(self._map_prompts(query_str, retrieved_nodes_content, reference_nodes_content))
+            format_input = self._combine_prompt(query_str, answers)
+            if self._streaming:
+                return self._astream_response(format_input), format_input, prompt_tokens
+            response = self._clean_response(await self._llm.acomplete(format_input, **self._llm_kwargs), format_input)
+
+        elif response_mode == "default":
+            format_input, prompt_tokens = self._default_prompt(query_str, retrieved_nodes_content, reference_nodes_content, retrieved_scores)
+            if self._streaming:
+                return self._astream_response(format_input), format_input, prompt_tokens
+            response = self._clean_response(await self._llm.acomplete(format_input, **self._llm_kwargs), format_input)
+        else:
+            raise ValueError(f"Unknown synthesize mode: {self._response_mode}")
+
+        assert isinstance(response, str), f"Response must be a string, got {type(response)}"
+        if self._streaming:
+            # refine only streams its final answer, as a single token
+            return self._as_agenerator(response), format_input, prompt_tokens
+        return response, format_input, prompt_tokens
+
+    async def _astream_response(self, format_input: str) -> AsyncGenerator[str, None]:
+        """Forward completion deltas from the LLM as they arrive, without special tokens."""
+        completions = await self._llm.astream_complete(format_input, **self._llm_kwargs)
+
+        async def deltas() -> AsyncGenerator[str, None]:
+            async for completion in completions:
+                if completion.delta:
+                    yield completion.delta
+
+        async for token in astream_clean_special_tokens(deltas()):
+            yield token
+
+    @staticmethod
+    async def _as_agenerator(response: str) -> AsyncGenerator[str, None]:
+        yield response
     
     def _get_prompts(self) -> dict:
         """Get prompts."""
@@ -170,7 +422,8 @@ class LawReferenceSynthesizer(BaseSynthesizer):
             "reference_qa_template": self._reference_qa_template,
             "refine_template": self._refine_template,
             "refine_reference_template": self._refine_reference_template,
-            "default_reference_template": self._default_reference_template
+            "default_reference_template": self._default_reference_template,
+            "combine_template": self._combine_template
         }
     
     def _update_prompts(self, prompts: PromptDictType) -> None:
@@ -183,54 +436,5 @@ class LawReferenceSynthesizer(BaseSynthesizer):
             self._refine_reference_template = prompts["refine_reference_template"]
         if "default_reference_template" in prompts:
             self._default_reference_template = prompts["default_reference_template"]
-            
-    async def aget_response(
-        self) -> None:
-        raise NotImplementedError("Async version not implemented")
-
-    # async def asynthesize(
-    #     self,
-    #     query: QueryType,
-    #     nodes: List[NodeWithScore],
-    #     additional_source_nodes: Optional[Sequence[NodeWithScore]] = None,
-    #     **response_kwargs: Any,
-    # ) -> RESPONSE_TYPE:
-    #     if len(nodes) == 0:
-    #         if self._streaming:
-    #             empty_response = AsyncStreamingResponse(
-    #                 response_gen=empty_response_agenerator()
-    #             )
-    #             dispatcher.event(
-    #                 SynthesizeEndEvent(query=query, response=empty_response)
-    #             )
-    #             return empty_response
-    #         else:
-    #             empty_response = Response("Empty Response")
-    #             dispatcher.event(
-    #                 SynthesizeEndEvent(query=query, response=empty_response)
-    #             )
-    #             return empty_response
-
-    #     if isinstance(query, str):
-    #         query = QueryBundle(query_str=query)
-
-    #     with self._callback_manager.event(
-    #         CBEventType.SYNTHESIZE, payload={EventPayload.QUERY_STR: query.query_str}
-    #     ) as event:
-    #         response_str = await self.aget_response(
-    #             query_str=query.query_str,
-    #             text_chunks=[
-    #                 n.node.get_content(metadata_mode=MetadataMode.LLM) for n in nodes
-    #             ],
-    #             **response_kwargs,
-    #         )
-
-    #         additional_source_nodes = additional_source_nodes or []
-    #         source_nodes = list(nodes) + list(additional_source_nodes)
-
-    #         response = self._prepare_response_output(response_str, source_nodes)
-
-    #         event.on_end(payload={EventPayload.RESPONSE: response})
-
-    #     dispatcher.event(SynthesizeEndEvent(query=query, response=response))
-    #     return response
\ No newline at end of file
+        if "combine_template" in prompts:
+            self._combine_template = prompts["combine_template"]
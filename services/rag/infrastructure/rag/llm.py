@@ -1,4 +1,17 @@
 from core.rag.llm import initialize_llm as package_initialize_llm
+from core.rag.llm import get_llm as package_get_llm
+from core.rag.llm import aclose_llms as package_aclose_llms
+from core.rag.llm import get_token_counter as package_get_token_counter
+from core.rag.llm import LLM_SELECTION_DICT
 
 def initialize_llm(model_id: str, prompt_language: str, temperature: float):
-    return package_initialize_llm(model_id=model_id, prompt_language=prompt_language, temperature=temperature)
\ No newline at end of file
+    return package_initialize_llm(model_id=model_id, prompt_language=prompt_language, temperature=temperature)
+
+def get_llm(model_id: str, completion_cache=None):
+    return package_get_llm(model_id=model_id, completion_cache=completion_cache)
+
+async def aclose_llms():
+    await package_aclose_llms()
+
+def get_token_counter(model_id: str):
+    return package_get_token_counter(model_id=model_id)
\ No newline at end of file
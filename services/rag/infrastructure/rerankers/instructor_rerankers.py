@@ -1,4 +1,7 @@
-from llama_index.postprocessor.flag_embedding_reranker import FlagEmbeddingReranker
+from core.rag.reranker import LawReranker, get_reranker_batcher_stats
 
-def get_instructor_reranker_model(model_name: str, use_fp16: bool, top_n: int):
-    return FlagEmbeddingReranker(model=model_name, use_fp16=use_fp16, top_n=top_n)
\ No newline at end of file
+def get_instructor_reranker_model(model_name: str, use_fp16: bool, top_n: int, score_cache=None, index_version=None):
+    return LawReranker(model=model_name, use_fp16=use_fp16, top_n=top_n, score_cache=score_cache, index_version=index_version)
+
+def get_reranker_stats():
+    return get_reranker_batcher_stats()
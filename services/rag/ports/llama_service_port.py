@@ -3,4 +3,16 @@ class LlamaServicePort:
         raise NotImplementedError
 
     def generate_response(self, request):
+        raise NotImplementedError
+
+    async def aretrieve_documents(self, request):
+        raise NotImplementedError
+
+    async def agenerate_response(self, request):
+        raise NotImplementedError
+
+    def get_cache_stats(self):
+        raise NotImplementedError
+
+    def update_index(self):
         raise NotImplementedError
\ No newline at end of file
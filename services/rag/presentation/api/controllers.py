@@ -1,15 +1,27 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+import hmac
+import os
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import JSONResponse
 from domain.models.requests import QueryRequest, RetrievalRequest
-from adapters.llama_index_adapter import LlamaIndexAdapter
+from presentation.api.index_watcher import IndexWatcher
+from presentation.api.warmup import AdapterWarmup
 
 router = APIRouter()
-llama_index_adapter = LlamaIndexAdapter()
-llama_index_adapter.initialize_retrievers()
+# the adapter is created by the warmup started with the app, not at import time
+warmup = AdapterWarmup()
+index_watcher = IndexWatcher(lambda: warmup.adapter, interval=float(os.getenv("INDEX_WATCH_INTERVAL", "0")))
+
+def get_llama_index_adapter():
+    if warmup.adapter is None:
+        raise HTTPException(status_code=503, detail="Index is still loading, see /readyz.")
+    return warmup.adapter
 
 @router.post("/retrieval")
 async def retrieve_documents(request: RetrievalRequest):
     try:
-        return llama_index_adapter.retrieve_documents(request)
+        return await get_llama_index_adapter().aretrieve_documents(request)
     except HTTPException as exc:
         raise exc
     except Exception as e:
@@ -18,12 +30,35 @@ async def retrieve_documents(request: RetrievalRequest):
 @router.post("/generate")
 async def generate_response(request: QueryRequest):
     try:
-        return llama_index_adapter.generate_response(request)
+        return await get_llama_index_adapter().agenerate_response(request)
     except HTTPException as exc:
         raise exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/cache/stats")
+async def cache_stats():
+    return get_llama_index_adapter().get_cache_stats()
+
+@router.post("/admin/index/update")
+async def update_index(x_admin_key: Optional[str] = Header(None)):
+    admin_key = os.getenv("ADMIN_API_KEY")
+    # without a configured key the endpoint does not exist, it must never be open by default
+    if not admin_key:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_key is None or not hmac.compare_digest(x_admin_key.encode("utf-8"), admin_key.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Invalid admin key.")
+    adapter = get_llama_index_adapter()
+    try:
+        return await asyncio.to_thread(adapter.update_index)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/healthz")
 async def health_check():
     return {"status": "ok"}
+
+@router.get("/readyz")
+async def readiness_check():
+    status = warmup.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
\ No newline at end of file
@@ -0,0 +1,60 @@
+import logging
+import os
+import threading
+from glob import glob
+from typing import Callable, Optional, Tuple
+
+class IndexWatcher:
+    """
+    Polls DOCUMENTS_DIR and updates the adapter's index when a law file is added, changed or removed.
+
+    Only file names, sizes and modification times are compared on each poll; the update itself hashes the
+    files and is a no-op when their content did not change. Every worker runs its own watcher, so workers
+    that did not build the new snapshot version load the one saved by the worker that did.
+    """
+
+    def __init__(self, get_adapter: Callable[[], Optional[object]], interval: float) -> None:
+        """
+        Parameters:
+        - get_adapter: returns the adapter, or None while it is still loading
+        - interval: seconds between polls
+        """
+        self._get_adapter = get_adapter
+        self.interval = interval
+        self._signature: Optional[Tuple] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def signature() -> Tuple:
+        documents_dir = os.getenv("DOCUMENTS_DIR", "/app/data")
+        signature = []
+        for path in sorted(glob(os.path.join(documents_dir, "*.json"))):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            signature.append((os.path.basename(path), stat.st_size, stat.st_mtime_ns))
+        return tuple(signature)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="index-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            adapter = self._get_adapter()
+            if adapter is None:
+                continue
+            signature = self.signature()
+            if signature == self._signature:
+                continue
+            try:
+                adapter.update_index()
+                self._signature = signature
+            except Exception:
+                logging.exception("Index update failed, retrying on the next poll")
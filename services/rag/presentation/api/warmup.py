@@ -0,0 +1,95 @@
+import asyncio
+import copy
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+class AdapterWarmup:
+    """
+    Creates the LlamaIndexAdapter off the startup path and tracks its progress.
+
+    The adapter module, and with it llama_index and the embedding, reranker and LLM clients, is only imported
+    by the warmup, so the app binds its port right away and serves /healthz and /readyz while the index loads.
+    """
+
+    COMPONENTS = ("index", "reranker", "llm")
+
+    def __init__(self) -> None:
+        self.adapter = None
+        self.error: Optional[str] = None
+        self._components: Dict[str, Dict[str, Any]] = {name: {"status": "pending"} for name in self.COMPONENTS}
+        self._lock = threading.Lock()
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        self._task: Optional[asyncio.Future] = None
+
+    def start(self) -> asyncio.Future:
+        """Start the warmup in a worker thread of the running event loop, once."""
+        if self._task is None:
+            self._started_at = time.monotonic()
+            self._task = asyncio.ensure_future(asyncio.to_thread(self._run))
+        return self._task
+
+    def preload(self) -> None:
+        """
+        Load the reranker weights in the current process, before a pre-forking server forks its workers.
+
+        Run by the app module when PRELOAD_MODELS=true, so with `gunicorn --preload` the workers share the
+        master's copy of the weights. Skipped on CUDA hosts, where a CUDA context cannot be used across fork.
+        The index itself is not preloaded: every worker maps the same snapshot files read-only instead.
+        """
+        try:
+            import torch
+        except ImportError:
+            raise ImportError("Cannot import torch package, please install it: pip install torch")
+        if torch.cuda.is_available():
+            logging.warning("PRELOAD_MODELS is ignored on CUDA hosts, every worker loads its own reranker")
+            return
+        from core.rag.reranker import get_reranker_model
+
+        get_reranker_model(os.getenv("RERANKER_MODEL", "BAAI/bge-reranker-v2-m3"), use_fp16=True)
+
+    def update(self, component: str, **fields: Any) -> None:
+        with self._lock:
+            self._components[component].update(fields)
+
+    def _run(self) -> None:
+        component = "index"
+        try:
+            self.update("index", status="loading", stage="importing")
+            from adapters.llama_index_adapter import LlamaIndexAdapter
+
+            adapter = LlamaIndexAdapter()
+            adapter.initialize_retrievers(on_progress=lambda **fields: self.update("index", **fields))
+            self.update("index", status="ready", stage="ready")
+            # retrieval and generation only need the index, models not loaded yet are loaded by the first request
+            self.adapter = adapter
+            for component in ("reranker", "llm"):
+                self.update(component, status="loading")
+                adapter.warmup_models(component, on_progress=lambda _component=component, **fields: self.update(_component, **fields))
+                self.update(component, status="ready")
+        except Exception as e:
+            logging.exception(f"Warmup of {component} failed")
+            self.error = f"{component}: {e}"
+            self.update(component, status="failed")
+        finally:
+            self._finished_at = time.monotonic()
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return all(component["status"] == "ready" for component in self._components.values())
+
+    def status(self) -> Dict[str, Any]:
+        """Readiness of every component, with the progress of the ones still loading."""
+        with self._lock:
+            components = copy.deepcopy(self._components)
+        end = self._finished_at or time.monotonic()
+        return {
+            "ready": all(component["status"] == "ready" for component in components.values()),
+            "elapsed_s": round(end - self._started_at, 1) if self._started_at else None,
+            "components": components,
+            "error": self.error,
+        }
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the service is run from its own directory, e.g. `uvicorn app.main:app`, so its packages are imported from there
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from core.rag.index.ann_report import _exact_top_k, ann_recall_report, sample_queries
+
+def normalized_rows(num_rows: int, dim: int = 16, seed: int = 0) -> np.ndarray:
+    rows = np.random.default_rng(seed).normal(size=(num_rows, dim)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+def test_queries_are_sampled_from_live_rows():
+    embeddings = normalized_rows(20)
+    deleted = np.zeros(20, dtype=bool)
+    deleted[:15] = True
+
+    queries = sample_queries(embeddings, num_queries=20, noise=0.0, deleted=deleted)
+
+    assert len(queries) == 5
+    nearest = _exact_top_k(embeddings, queries, 1)[:, 0]
+    assert set(nearest.tolist()) == set(range(15, 20))
+
+def test_ground_truth_leaves_out_tombstoned_rows():
+    embeddings = normalized_rows(20)
+    deleted = np.zeros(20, dtype=bool)
+    deleted[::2] = True
+
+    exact = _exact_top_k(embeddings, embeddings[::2], 3, deleted)
+
+    assert not deleted[exact].any()
+
+def test_recall_is_measured_against_live_rows():
+    pytest.importorskip("hnswlib")
+    embeddings = normalized_rows(200)
+    deleted = np.zeros(200, dtype=bool)
+    deleted[:100] = True
+
+    report = ann_recall_report(
+        embeddings,
+        sample_queries(embeddings, num_queries=20, deleted=deleted),
+        top_k=5,
+        ef_search_values=(200,),
+        deleted=deleted,
+    )
+
+    assert report[-1]["recall"] == pytest.approx(1.0)
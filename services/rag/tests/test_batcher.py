@@ -0,0 +1,54 @@
+import asyncio
+import threading
+
+from core.rag.reranker.batcher import RerankerBatcher
+
+class BlockingModel:
+    """Scores a pair by the length of its passage, holding its first batch until released."""
+
+    def __init__(self) -> None:
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.batches = []
+
+    def compute_score(self, pairs, batch_size=None):
+        self.batches.append(list(pairs))
+        self.started.set()
+        self.release.wait(timeout=5)
+        scores = [float(len(passage)) for _, passage in pairs]
+        return scores[0] if len(scores) == 1 else scores
+
+async def wait_until(event: threading.Event) -> None:
+    assert await asyncio.to_thread(event.wait, 5)
+
+def test_scores_are_returned_in_order():
+    batcher = RerankerBatcher(BlockingModel(), max_batch_size=8, max_wait_ms=1)
+    batcher.model.release.set()
+    assert batcher.score([("q", "abc"), ("q", "a"), ("q", "ab")]) == [3.0, 1.0, 2.0]
+    assert batcher.score([]) == []
+
+def test_cancelled_requests_do_not_stop_the_worker():
+    async def main():
+        model = BlockingModel()
+        batcher = RerankerBatcher(model, max_batch_size=8, max_wait_ms=0)
+        # scored in the first batch, cancelled while the model runs
+        running = asyncio.ensure_future(batcher.ascore([("q", "a")]))
+        await wait_until(model.started)
+        # queued behind it, one of them cancelled before the next batch is formed
+        cancelled = asyncio.ensure_future(batcher.ascore([("q", "bb")]))
+        waiting = asyncio.ensure_future(batcher.ascore([("q", "ccc")]))
+        await asyncio.sleep(0.01)
+        running.cancel()
+        cancelled.cancel()
+        # lets the cancellations reach the futures of the batcher before the batch finishes
+        await asyncio.sleep(0.01)
+        model.release.set()
+
+        assert await asyncio.wait_for(waiting, timeout=5) == [3.0]
+        assert await asyncio.wait_for(batcher.ascore([("q", "dddd")]), timeout=5) == [4.0]
+        assert running.cancelled() and cancelled.cancelled()
+        # the cancelled request was never scored
+        assert [("q", "bb")] not in model.batches
+        assert batcher._thread.is_alive()
+
+    asyncio.run(main())
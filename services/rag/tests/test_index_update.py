@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+from typing import List
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.schema import MetadataMode
+
+from adapters.llama_index_adapter import LlamaIndexAdapter
+from domain.models.requests import QueryRequest, RetrievalRequest
+from core.rag.index import BM25Index, IndexSnapshot, compute_content_hash
+from core.rag.index.const import (
+    SNAPSHOT_CURRENT_FILE,
+    SNAPSHOT_EMBEDDINGS_FILE,
+    SNAPSHOT_FORMAT_VERSION,
+    SNAPSHOT_MANIFEST_FILE,
+    SNAPSHOT_NODES_FILE,
+)
+from presentation.api.controllers import router
+
+LAWS = {
+    "civil": [
+        ("1", "ประมวลกฎหมายแพ่ง", "บุคคลย่อมมีสิทธิและหน้าที่ตามกฎหมาย"),
+        ("2", "ประมวลกฎหมายแพ่ง", "สัญญาย่อมเกิดขึ้นเมื่อคำเสนอและคำสนองถูกต้องตรงกัน"),
+        ("3", "ประมวลกฎหมายแพ่ง", "ผู้ใดทำละเมิดต้องชดใช้ค่าสินไหมทดแทน"),
+    ],
+    "criminal": [
+        ("1", "ประมวลกฎหมายอาญา", "ผู้ใดฆ่าผู้อื่นต้องระวางโทษประหารชีวิต"),
+        ("2", "ประมวลกฎหมายอาญา", "ผู้ใดลักทรัพย์ของผู้อื่นมีความผิดฐานลักทรัพย์"),
+    ],
+}
+
+class HashEmbedding(BaseEmbedding):
+    """Deterministic embeddings derived from the text, recording every text it embeds."""
+
+    instruction: str = "Represent a document for semantic search:"
+    embedded: List[str] = []
+
+    def _embed(self, text: str) -> List[float]:
+        seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+        return np.random.default_rng(seed).standard_normal(8).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    def get_text_embedding_batch(self, texts: List[str], show_progress: bool = False, **kwargs) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return [self._embed(text) for text in texts]
+
+def write_laws(documents_dir, laws):
+    for law_code, sections in laws.items():
+        with open(os.path.join(documents_dir, f"{law_code}.json"), "w", encoding="utf-8") as file:
+            json.dump(
+                [{"section_num": num, "law_name": name, "section_content": content, "reference": []} for num, name, content in sections],
+                file,
+                ensure_ascii=False,
+            )
+
+@pytest.fixture
+def adapter(tmp_path, monkeypatch):
+    documents_dir = tmp_path / "docs"
+    documents_dir.mkdir()
+    write_laws(documents_dir, LAWS)
+    monkeypatch.setenv("DOCUMENTS_DIR", str(documents_dir))
+    monkeypatch.setenv("INDEX_SNAPSHOT_DIR", str(tmp_path / "index"))
+    monkeypatch.setenv("COMPLETION_CACHE_SIZE", "0")
+    monkeypatch.setenv("VECTOR_INDEX_BACKEND", "exact")
+    monkeypatch.setenv("INDEX_COMPACTION_RATIO", "1")
+    adapter = LlamaIndexAdapter()
+    adapter.embed_model = HashEmbedding(model_name="hash-embedding")
+    return adapter
+
+def live_texts(snapshot):
+    return {snapshot.node_ids[row]: snapshot.texts[row] for row in range(len(snapshot)) if not snapshot.deleted[row]}
+
+def test_update_only_embeds_new_and_changed_sections(adapter):
+    adapter.initialize_retrievers()
+    assert len(adapter.embed_model.embedded) == 5
+    previous_version = adapter.index_version
+
+    laws = {law_code: list(sections) for law_code, sections in LAWS.items()}
+    laws["civil"][1] = ("2", "ประมวลกฎหมายแพ่ง", "สัญญาย่อมเกิดขึ้นเมื่อคู่สัญญาตกลงกัน")
+    laws["civil"].append(("4", "ประมวลกฎหมายแพ่ง", "หนี้ย่อมระงับเมื่อชำระหนี้"))
+    del laws["criminal"][0]
+    write_laws(os.environ["DOCUMENTS_DIR"], laws)
+    adapter.embed_model.embedded.clear()
+
+    result = adapter.update_index()
+
+    assert result["status"] == "updated"
+    assert (result["added"], result["changed"], result["deleted"]) == (1, 1, 1)
+    assert (result["embedded"], result["reused"]) == (2, 0)
+    assert sorted(adapter.embed_model.embedded) == sorted(
+        node.get_content(metadata_mode=MetadataMode.EMBED)
+        for node in adapter.load_law_nodes(adapter.list_law_files(os.environ["DOCUMENTS_DIR"]))
+        if node.node_id in ("civil_2", "civil_4")
+    )
+    assert result["previous_version"] == previous_version[:16]
+    assert adapter.index_version != previous_version
+    assert adapter.update_index()["status"] == "unchanged"
+
+def test_update_tombstones_removed_sections(adapter):
+    adapter.initialize_retrievers()
+    laws = {"civil": LAWS["civil"], "criminal": LAWS["criminal"][1:]}
+    write_laws(os.environ["DOCUMENTS_DIR"], laws)
+    adapter.update_index()
+
+    snapshot = adapter.snapshot
+    row = snapshot.docstore.row_of("criminal_1")
+    assert row is not None and snapshot.deleted[row]
+    assert "criminal_1" not in snapshot.docstore
+    assert len(snapshot) - snapshot.num_deleted == 4
+
+    # the tombstone survives a reload from disk, and is never returned by a search
+    loaded = IndexSnapshot.load(os.environ["INDEX_SNAPSHOT_DIR"], fingerprint=adapter.index_version)
+    assert loaded.deleted.tolist() == snapshot.deleted.tolist()
+    rows, _ = adapter.vector_index.search(np.asarray([snapshot.embeddings[row]]), top_k=len(snapshot))
+    assert row not in rows[0].tolist()
+    assert len(rows[0]) == 4
+
+def test_incremental_bm25_matches_a_rebuild(adapter):
+    adapter.initialize_retrievers()
+    laws = {"civil": LAWS["civil"] + [("4", "ประมวลกฎหมายแพ่ง", "ผู้ใดทำสัญญาต้องชำระหนี้")], "criminal": LAWS["criminal"][1:]}
+    write_laws(os.environ["DOCUMENTS_DIR"], laws)
+    adapter.update_index()
+
+    # scores of the updated index, which has a tombstone, match an index built from the live sections only
+    snapshot = adapter.snapshot
+    live = snapshot.compact()
+    rebuilt = BM25Index.build(list(live.texts))
+    for query in ("ผู้ใดทำสัญญา", "ลักทรัพย์", "ผู้ใด ต้อง ชำระหนี้"):
+        rows, scores = adapter.bm25_index.search(query, top_k=10)
+        rebuilt_rows, rebuilt_scores = rebuilt.search(query, top_k=10)
+        assert len(rows)
+        assert dict(zip((snapshot.node_ids[row] for row in rows.tolist()), scores.tolist())) == pytest.approx(
+            dict(zip((live.node_ids[row] for row in rebuilt_rows.tolist()), rebuilt_scores.tolist())), rel=1e-5
+        )
+
+def test_update_serves_the_urls_of_a_changed_mapper(adapter):
+    mapper_path = os.path.join(os.environ["DOCUMENTS_DIR"], "wcx_law_url_mapper.json")
+    with open(mapper_path, "w") as file:
+        json.dump({"civil": "https://example.com/civil"}, file)
+    adapter.law_url_mapper = adapter.load_law_url_mapper()
+    adapter.initialize_retrievers()
+    assert adapter.vector_index.docs["civil_1"].metadata["url"] == "https://example.com/civil"
+
+    with open(mapper_path, "w") as file:
+        json.dump({"civil": "https://example.com/civil-code", "criminal": "https://example.com/criminal"}, file)
+    result = adapter.update_index()
+
+    assert result["status"] == "updated"
+    assert result["changed"] == 5
+    assert adapter.vector_index.docs["civil_1"].metadata["url"] == "https://example.com/civil-code"
+    assert adapter.bm25_index.docs["criminal_2"].metadata["url"] == "https://example.com/criminal"
+
+def test_update_swaps_the_index_state_as_a_whole(adapter):
+    adapter.initialize_retrievers()
+    previous = adapter.index_state
+    request = QueryRequest(query="สัญญา", model="model", language="th")
+    previous_partition = adapter.answer_cache_partition(request, previous)
+
+    write_laws(os.environ["DOCUMENTS_DIR"], {"civil": LAWS["civil"][:1], "criminal": LAWS["criminal"]})
+    adapter.update_index()
+
+    # a request that read the state before the swap keeps retrieving from, and caching under, that version
+    assert previous.version == previous.snapshot.fingerprint != adapter.index_version
+    assert previous.vector_index.docstore is previous.snapshot.docstore
+    assert adapter.index_state.vector_index.docstore is adapter.snapshot.docstore
+    assert adapter.answer_cache_partition(request, previous) == previous_partition
+    assert adapter.answer_cache_partition(request, adapter.index_state) != previous_partition
+    references = adapter.retrieve_documents(RetrievalRequest(query="สัญญา", top_k=5, reranker=False))
+    assert "civil_2" not in {reference["law_code"] for reference in references}
+
+def test_answers_are_cached_per_temperature(adapter):
+    adapter.initialize_retrievers()
+    state = adapter.index_state
+    greedy = QueryRequest(query="สัญญา", model="model", language="th", temperature=0.0)
+    sampled = QueryRequest(query="สัญญา", model="model", language="th", temperature=0.8)
+
+    assert adapter.answer_cache_partition(greedy, state) != adapter.answer_cache_partition(sampled, state)
+    assert adapter.answer_cache_partition(greedy, state) == adapter.answer_cache_partition(
+        QueryRequest(query="สัญญา", model="model", language="th", temperature=0.0), state
+    )
+
+def write_legacy_snapshot(snapshot_dir, nodes, embeddings, embed_model_name):
+    """A snapshot as format 1 wrote it: rows as one JSON list, without content hashes."""
+    version_dir = os.path.join(snapshot_dir, "legacy")
+    os.makedirs(version_dir)
+    np.save(os.path.join(version_dir, SNAPSHOT_EMBEDDINGS_FILE), np.asarray(embeddings, dtype=np.float32))
+    with open(os.path.join(version_dir, SNAPSHOT_NODES_FILE), "w", encoding="utf-8") as file:
+        json.dump([{"id": node.node_id, "text": node.text, "metadata": node.metadata} for node in nodes], file, ensure_ascii=False)
+    with open(os.path.join(version_dir, SNAPSHOT_MANIFEST_FILE), "w", encoding="utf-8") as file:
+        json.dump({"format_version": 1, "fingerprint": "legacy", "embed_model_name": embed_model_name}, file)
+    with open(os.path.join(snapshot_dir, SNAPSHOT_CURRENT_FILE), "w") as file:
+        file.write("legacy")
+
+def test_legacy_snapshot_is_converted_without_embedding_again(adapter):
+    nodes = adapter.load_law_nodes(adapter.list_law_files(os.environ["DOCUMENTS_DIR"]))
+    texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+    write_legacy_snapshot(
+        os.environ["INDEX_SNAPSHOT_DIR"], nodes, adapter.embed_model.get_text_embedding_batch(texts), "hash-embedding"
+    )
+    adapter.embed_model.embedded.clear()
+
+    legacy = IndexSnapshot.load(os.environ["INDEX_SNAPSHOT_DIR"])
+    assert legacy.content_hashes == [None] * len(nodes)
+    adapter.initialize_retrievers()
+
+    assert adapter.embed_model.embedded == []
+    with open(os.path.join(adapter.snapshot.path, SNAPSHOT_MANIFEST_FILE), encoding="utf-8") as file:
+        assert json.load(file)["format_version"] == SNAPSHOT_FORMAT_VERSION
+    loaded = IndexSnapshot.load(os.environ["INDEX_SNAPSHOT_DIR"], fingerprint=adapter.index_version)
+    assert list(loaded.content_hashes) == [
+        compute_content_hash(text, "hash-embedding", adapter.embed_model.instruction) for text in texts
+    ]
+    assert live_texts(loaded) == {node.node_id: node.text for node in nodes}
+    np.testing.assert_allclose(loaded.embeddings, legacy.embeddings, rtol=1e-6)
+
+def test_legacy_snapshot_of_another_model_is_embedded_again(adapter):
+    nodes = adapter.load_law_nodes(adapter.list_law_files(os.environ["DOCUMENTS_DIR"]))
+    write_legacy_snapshot(os.environ["INDEX_SNAPSHOT_DIR"], nodes, np.ones((len(nodes), 8)), "other-embedding")
+    adapter.initialize_retrievers()
+    assert len(adapter.embed_model.embedded) == len(nodes)
+
+@pytest.mark.parametrize(
+    "admin_key, headers, status_code",
+    [(None, {"X-Admin-Key": "secret"}, 404), ("secret", {}, 403), ("secret", {"X-Admin-Key": "wrong"}, 403), ("secret", {"X-Admin-Key": "secret"}, 503)],
+)
+def test_update_endpoint_requires_the_admin_key(monkeypatch, admin_key, headers, status_code):
+    if admin_key is None:
+        monkeypatch.delenv("ADMIN_API_KEY", raising=False)
+    else:
+        monkeypatch.setenv("ADMIN_API_KEY", admin_key)
+    app = FastAPI()
+    app.include_router(router)
+    # no index is loaded, so an authorized request only gets as far as the readiness check
+    assert TestClient(app).post("/admin/index/update", headers=headers).status_code == status_code
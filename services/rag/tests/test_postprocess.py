@@ -0,0 +1,57 @@
+import asyncio
+import itertools
+
+import pytest
+
+from core.rag.prompting.postprocess import (
+    astream_clean_special_tokens,
+    clean_special_tokens,
+    stream_clean_special_tokens,
+)
+
+RESPONSES = [
+    "<|eot_id|><|eot_id|> ตอบ",
+    "[/INST] คำตอบa<",
+    "<|eot_id|>คำตอบ",
+    "\n:ตอบ]<|[/INST]คำตอบ|>[/INST]",
+    "  คำตอบ: มาตรา 5 <|eot_id|>  ",
+    "ตอบ:[/INST] a [/b] <|c|>",
+    "[/[/A]B]<|<|x|>y|>",
+    "a <| b |> [/ c",
+    "",
+    "   ",
+]
+
+def splits(text):
+    """Every way to cut the text into consecutive chunks."""
+    for mask in itertools.product((False, True), repeat=max(len(text) - 1, 0)):
+        chunks, start = [], 0
+        for position, cut in enumerate(mask, start=1):
+            if cut:
+                chunks.append(text[start:position])
+                start = position
+        chunks.append(text[start:])
+        yield chunks
+
+@pytest.mark.parametrize("response", RESPONSES)
+def test_stream_matches_batch_for_every_split(response):
+    expected = clean_special_tokens(response)
+    # beyond 14 characters the number of splits explodes, cut the rest into single characters
+    head, tail = response[:14], list(response[14:])
+    for chunks in splits(head):
+        assert "".join(stream_clean_special_tokens(chunks + tail)) == expected, chunks + tail
+
+@pytest.mark.parametrize("response", RESPONSES)
+def test_stream_matches_batch_with_whole_special_tokens(response):
+    chunks = [chunk for chunk in response.replace("<|eot_id|>", "\0<|eot_id|>\0").split("\0") if chunk]
+    assert "".join(stream_clean_special_tokens(chunks)) == clean_special_tokens(response)
+
+def test_async_stream_matches_batch():
+    async def tokens():
+        for token in ["[/INST]", " ", "คำตอบ", ": ", "มาตรา", " 5", "<|eot", "_id|>"]:
+            yield token
+
+    async def collect():
+        return "".join([token async for token in astream_clean_special_tokens(tokens())])
+
+    assert asyncio.run(collect()) == clean_special_tokens("[/INST] คำตอบ: มาตรา 5<|eot_id|>")
@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import time
+from typing import Any
+
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from core.rag.retriever.fusion import FUSION_SCORE_KEY
+from core.rag.synthesizer.context_packer import ContextPacker
+from core.rag.synthesizer.reference_synthesizer import LawReferenceSynthesizer
+
+class CountingLLM(CustomLLM):
+    """Answers after a short delay, recording how many calls were in flight at once."""
+
+    delay: float = 0.05
+    in_flight: int = 0
+    max_in_flight: int = 0
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata()
+
+    def _enter(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _exit(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        self._enter()
+        try:
+            time.sleep(self.delay)
+        finally:
+            self._exit()
+        return CompletionResponse(text=prompt.replace("section", "answer"))
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        self._enter()
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self._exit()
+        return CompletionResponse(text=prompt.replace("section", "answer"))
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        yield self.complete(prompt)
+
+def make_synthesizer(**kwargs: Any) -> LawReferenceSynthesizer:
+    llm = CountingLLM(completion_to_prompt=lambda prompt, system_prompt=None: prompt)
+    return LawReferenceSynthesizer(llm=llm, **kwargs)
+
+def test_map_limits_calls_in_flight_per_request():
+    synthesizer = make_synthesizer(response_mode="map_reduce", map_concurrency=2)
+    prompts = [f"section {i}" for i in range(6)]
+    assert synthesizer._map(prompts) == [f"answer {i}" for i in range(6)]
+    assert synthesizer._llm.max_in_flight == 2
+
+def test_amap_limits_calls_in_flight_per_request():
+    synthesizer = make_synthesizer(response_mode="map_reduce", map_concurrency=2)
+    prompts = [f"section {i}" for i in range(6)]
+    assert asyncio.run(synthesizer._amap(prompts)) == [f"answer {i}" for i in range(6)]
+    assert synthesizer._llm.max_in_flight == 2
+
+def count_words(texts):
+    return [len(text.split()) for text in texts]
+
+def make_node(text: str, score: float, fused_score: float = None) -> NodeWithScore:
+    metadata = {} if fused_score is None else {FUSION_SCORE_KEY: fused_score}
+    return NodeWithScore(node=TextNode(text=text, metadata=metadata), score=score)
+
+def packed_prompt(nodes) -> str:
+    # room for two of the three four-word sections
+    synthesizer = make_synthesizer(context_packer=ContextPacker(count_words, token_budget=8))
+    _, format_input, _, _ = synthesizer.synthesize("query", nodes, {})
+    return format_input
+
+def test_lowest_scored_section_is_dropped_first():
+    prompt = packed_prompt([
+        make_node("alpha section about leases", 0.9),
+        make_node("beta section about taxes", 0.1),
+        make_node("gamma section about wages", 0.5),
+    ])
+    assert "alpha" in prompt and "gamma" in prompt
+    assert "beta" not in prompt
+    assert prompt.index("alpha") < prompt.index("gamma")
+
+def test_fused_sections_are_ranked_by_their_fused_score():
+    # the bm25 score of the last node does not compare with the cosine similarities of the others
+    prompt = packed_prompt([
+        make_node("alpha section about leases", 0.8, fused_score=0.03),
+        make_node("gamma section about wages", 0.7, fused_score=0.02),
+        make_node("beta section about taxes", 12.0, fused_score=0.01),
+    ])
+    assert "alpha" in prompt and "gamma" in prompt
+    assert "beta" not in prompt